@@ -0,0 +1,253 @@
+'''
+Business: Asyncio execution mode for the unified router, multiplexing concurrent requests on one event loop
+Args: event - same as backend/api/index.py; context - object with request_id, function_name, etc.
+Returns: HTTP response dict, identical in shape to the synchronous handlers
+'''
+
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import os
+import random
+import threading
+import time
+import types
+import requests
+from typing import Dict, Any, Optional
+
+import index as router
+
+try:
+    import asyncpg
+except ImportError:
+    asyncpg = None
+
+POOL_MIN_SIZE = int(os.environ.get('API_ASYNC_POOL_MIN', '1'))
+POOL_MAX_SIZE = int(os.environ.get('API_ASYNC_POOL_MAX', '10'))
+# Each sync worker thread holds one warm primary connection per shard of its own (see router.shared_connection_getter),
+# so the instance uses up to POOL_MAX_SIZE + SYNC_WORKERS connections per database
+SYNC_WORKERS = int(os.environ.get('API_SYNC_WORKERS', '8'))
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+# primary DSN (one per shard) -> pool
+_pools: Dict[str, Any] = {}
+_replica_pools: Dict[str, Any] = {}
+# Concurrent first requests would each await create_pool and leak all but one pool; creation happens under a lock
+_pools_lock = asyncio.Lock()
+_replica_pools_lock = asyncio.Lock()
+_sync_executor = concurrent.futures.ThreadPoolExecutor(max_workers=SYNC_WORKERS, thread_name_prefix='api-sync')
+# Telegram sends from the sync path leave the request path; goal notifications never read the reply
+_telegram_executor = concurrent.futures.ThreadPoolExecutor(max_workers=4, thread_name_prefix='api-telegram')
+
+async def init_connection(conn):
+    await conn.set_type_codec('json', encoder=json.dumps, decoder=json.loads, schema='pg_catalog')
+
+async def get_pool(dsn: str):
+    if dsn not in _pools:
+        async with _pools_lock:
+            if dsn not in _pools:
+                _pools[dsn] = await asyncpg.create_pool(
+                    dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, init=init_connection
+                )
+    return _pools[dsn]
+
+async def get_replica_pool(dsn: str):
+    if dsn not in _replica_pools:
+        async with _replica_pools_lock:
+            if dsn not in _replica_pools:
+                _replica_pools[dsn] = await asyncpg.create_pool(
+                    dsn, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE, init=init_connection, timeout=2
+                )
+    return _replica_pools[dsn]
+
+@contextlib.asynccontextmanager
+async def read_connection(module, headers: Dict[str, str], primary: str):
+    """The services' get_read_connection for asyncpg: a replica that has replayed X-Last-Write, else the shard's primary"""
+    replicas = module.get_replica_dsns()
+    if replicas:
+        try:
+            replica_pool = await get_replica_pool(random.choice(replicas))
+        except (OSError, asyncio.TimeoutError, asyncpg.PostgresError):
+            replica_pool = None
+        
+        if replica_pool is not None:
+            async with replica_pool.acquire() as conn:
+                last_write = headers.get('X-Last-Write', '') or headers.get('x-last-write', '')
+                caught_up = True
+                if last_write:
+                    try:
+                        caught_up = await conn.fetchval(
+                            "SELECT COALESCE(pg_last_wal_replay_lsn() >= $1::pg_lsn, TRUE)", last_write
+                        )
+                    except asyncpg.PostgresError:
+                        caught_up = False
+                if caught_up:
+                    yield conn
+                    return
+    
+    async with (await get_pool(primary)).acquire() as conn:
+        yield conn
+
+def json_response(status: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        'statusCode': status,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(payload)
+    }
+
+async def get_user_id(conn, module, headers: Dict[str, str]) -> Optional[int]:
+    """Token lookup through the router-wide cache, so both modes see the same entries"""
+    token = headers.get('X-Auth-Token', '') or headers.get('x-auth-token', '')
+    if not token:
+        return None
+    
+    cached = router._token_cache.get(token)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    
+    # notifications resolves tokens with its settings query; the user id is its first column either way
+    sql = module.QUERIES.get('user_id_by_token') or module.QUERIES['user_context_by_token']
+    user_id = await conn.fetchval(router.numbered_placeholders(sql), token)
+    if user_id:
+        router.remember_token(token, user_id)
+    return user_id
+
+async def list_goals(conn, module, event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    retry_after = module.check_rate_limit('goals_list', user_id)
+    if retry_after:
+        return module.rate_limited_response(retry_after)
+    
+    goals = []
+    for row in await conn.fetch(router.numbered_placeholders(module.QUERIES['goals_by_user']), user_id):
+        goal = module.goal_from_row(row)
+        goal['subtasks'] = row[14]
+        goals.append(goal)
+    
+    return module.compress_response(event, {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'goals': goals}, ensure_ascii=False, separators=(',', ':'))
+    })
+
+async def list_notifications(conn, module, event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    notifications = [{
+        'id': row[0],
+        'title': row[1],
+        'message': row[2],
+        'type': row[3],
+        'isRead': row[4],
+        'createdAt': row[5].isoformat() if row[5] else None
+    } for row in await conn.fetch(router.numbered_placeholders(module.QUERIES['notifications_by_user']), user_id)]
+    
+    return module.compress_response(event, {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'isBase64Encoded': False,
+        'body': json.dumps({
+            'notifications': notifications,
+            'unreadCount': sum(1 for n in notifications if not n['isRead'])
+        }, ensure_ascii=False, separators=(',', ':'))
+    })
+
+async def get_profile(conn, module, event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    user = await conn.fetchrow(router.numbered_placeholders(module.QUERIES['profile_by_user']), user_id)
+    if not user:
+        return json_response(404, {'error': 'User not found'})
+    
+    total_goals, completed_goals = await conn.fetchrow(
+        router.numbered_placeholders(module.QUERIES['goal_stats_by_user']), user_id
+    )
+    return json_response(200, {
+        'profile': {
+            'id': user[0],
+            'email': user[1],
+            'username': user[2],
+            'avatarUrl': user[3],
+            'bio': user[4],
+            'telegramChatId': user[5],
+            'createdAt': user[6].isoformat() if user[6] else None,
+            'stats': {
+                'totalGoals': total_goals,
+                'completedGoals': completed_goals
+            }
+        }
+    })
+
+# (service, method) -> native coroutine; only plain list reads, everything else goes to the sync handler
+ASYNC_ROUTES = {
+    ('goals', 'GET'): list_goals,
+    ('notifications', 'GET'): list_notifications,
+    ('profile', 'GET'): get_profile
+}
+
+def native_route(service: str, event: Dict[str, Any]):
+    query_params = event.get('queryStringParameters') or {}
+    if asyncpg is None or query_params.get('action') or query_params.get('fields'):
+        return None
+    return ASYNC_ROUTES.get((service, event.get('httpMethod', 'GET')))
+
+def schedule_telegram_post(*args, **kwargs):
+    _telegram_executor.submit(router._telegram_session.post, *args, **kwargs)
+
+def load_service(service: str):
+    """router.load_service, plus moving goal Telegram sends off the request path on first load"""
+    fresh = service not in router._modules
+    module = router.load_service(service)
+    if fresh and service == 'goals':
+        module.requests = types.SimpleNamespace(post=schedule_telegram_post, RequestException=requests.RequestException)
+    return module
+
+async def dispatch(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    service, service_event = router.resolve_service(event)
+    route = native_route(service, service_event)
+    loop = asyncio.get_running_loop()
+    
+    if route is None:
+        return await loop.run_in_executor(_sync_executor, sync_dispatch, service, event, context)
+    
+    module = router._modules.get(service) or await loop.run_in_executor(_sync_executor, load_service, service)
+    headers = service_event.get('headers', {})
+    token = headers.get('X-Auth-Token', '') or headers.get('x-auth-token', '')
+    try:
+        shard = 0
+        if token and len(module.get_shard_dsns()) > 1:
+            # A directory miss is a blocking query, keep it off the loop; only reads are served here, so moving is moot
+            shard, _ = await loop.run_in_executor(_sync_executor, module.token_shard, token)
+        primary = module.get_shard_dsns()[shard]
+        
+        async with read_connection(module, headers, primary) as conn:
+            user_id = await get_user_id(conn, module, headers)
+            if user_id:
+                return await route(conn, module, service_event, user_id)
+        
+        if not module.get_replica_dsns():
+            return json_response(401, {'error': 'Unauthorized'})
+        
+        # A token newer than the replica is retried on the primary, as the sync lookup does
+        async with (await get_pool(primary)).acquire() as conn:
+            user_id = await get_user_id(conn, module, headers)
+            if not user_id:
+                return json_response(401, {'error': 'Unauthorized'})
+            return await route(conn, module, service_event, user_id)
+    except Exception as e:
+        return json_response(500, {'error': str(e)})
+
+def sync_dispatch(service: str, event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    if service in router.SERVICES:
+        load_service(service)
+    return router.handler(event, context)
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """One loop per warm instance, on a daemon thread, so the asyncpg pool outlives a single invocation"""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name='api-loop', daemon=True).start()
+    return _loop
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """Same contract as every other handler; concurrent callers share the loop and the pool"""
+    return asyncio.run_coroutine_threadsafe(dispatch(event, context), get_loop()).result()
@@ -0,0 +1,192 @@
+'''
+Business: Single entry point serving auth, goals, profile, notifications and telegram from one warm instance
+Args: event - dict with httpMethod, path or queryStringParameters.service, plus the target function's own fields
+      context - object with request_id, function_name, etc.
+Returns: HTTP response dict from the target function's handler
+'''
+
+import importlib.util
+import itertools
+import json
+import os
+import re
+import sys
+import threading
+import time
+import types
+import psycopg2
+import requests
+from typing import Dict, Any, Optional
+
+SERVICES = ('auth', 'goals', 'profile', 'notifications', 'telegram')
+
+# Services built on the _pooled_connections / _prepared_statements pattern; here they share connections per thread
+POOLED_SERVICES = ('goals', 'profile', 'notifications')
+
+TOKEN_CACHE_TTL = int(os.environ.get('API_TOKEN_CACHE_TTL', '30'))
+TOKEN_CACHE_MAX = int(os.environ.get('API_TOKEN_CACHE_MAX', '10000'))
+
+# Sibling function directories; override when the functions are packaged somewhere else
+MODULES_DIR = os.environ.get('API_MODULES_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+_modules: Dict[str, types.ModuleType] = {}
+_modules_lock = threading.Lock()
+# connections and prepared_statements of the calling thread, keyed by shard; one thread here, several in the async mode
+_local = threading.local()
+_token_cache: Dict[str, tuple] = {}
+# Sync worker threads share the cache: inserts and evictions hold the lock, a lone dict.get reads without it
+_token_cache_lock = threading.Lock()
+_telegram_session = requests.Session()
+
+# Stands in for the requests module inside services, so Telegram calls reuse one keep-alive session
+telegram_client = types.SimpleNamespace(
+    post=_telegram_session.post,
+    get=_telegram_session.get,
+    RequestException=requests.RequestException
+)
+
+def numbered_placeholders(sql: str) -> str:
+    """psycopg2 %s placeholders as $1..$n, for PREPARE and asyncpg"""
+    counter = iter(range(1, sql.count('%s') + 1))
+    return re.sub(r'%s', lambda _: f'${next(counter)}', sql)
+
+def shared_connections() -> Dict[int, Any]:
+    if not hasattr(_local, 'connections'):
+        _local.connections, _local.prepared_statements = {}, {}
+    return _local.connections
+
+def shared_connection_getter(module: types.ModuleType):
+    """The service's get_db_connection: one primary connection per thread and shard for every pooled service,
+    kept open across warm invocations; the shard is the one the service routed the request to"""
+    def get_shared_connection():
+        shard = module.current_shard()
+        connections = shared_connections()
+        conn = connections.get(shard)
+        if conn is None or conn.closed:
+            conn = connections[shard] = psycopg2.connect(module.get_shard_dsns()[shard])
+            _local.prepared_statements[shard] = set()
+        return conn
+    return get_shared_connection
+
+def shared_shard(conn) -> Optional[int]:
+    return next((shard for shard, shared in shared_connections().items() if shared is conn), None)
+
+def release_shared_connection(conn):
+    """The services' release_connection: the thread's shared connections are reset and kept, any other is closed"""
+    if shared_shard(conn) is None:
+        conn.close()
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+
+def shared_query_executor(module: types.ModuleType):
+    """The service's execute_query, preparing statements once per thread connection instead of per module"""
+    def execute_query(cur, name: str, params):
+        sql = module.QUERIES[name]
+        shard = shared_shard(cur.connection)
+        if shard is None:
+            cur.execute(sql, params)
+            return
+        
+        if name not in _local.prepared_statements[shard]:
+            cur.execute(f"PREPARE {name} AS " + numbered_placeholders(sql))
+            _local.prepared_statements[shard].add(name)
+        
+        placeholders = ', '.join(['%s'] * len(params))
+        cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+    return execute_query
+
+def remember_token(token: str, user_id: int):
+    """Insert into the token cache; once full, expired entries go first, then the oldest quarter"""
+    with _token_cache_lock:
+        now = time.monotonic()
+        if len(_token_cache) >= TOKEN_CACHE_MAX:
+            for stale in [key for key, (_, expires) in _token_cache.items() if expires <= now]:
+                del _token_cache[stale]
+        if len(_token_cache) >= TOKEN_CACHE_MAX:
+            for oldest in list(itertools.islice(_token_cache, TOKEN_CACHE_MAX // 4 or 1)):
+                del _token_cache[oldest]
+        _token_cache.pop(token, None)
+        _token_cache[token] = (user_id, now + TOKEN_CACHE_TTL)
+
+def cached_token_lookup(module: types.ModuleType):
+    """Wrap a service's get_user_id_from_token with the router-wide token cache; a hit is still routed to its shard"""
+    lookup = module.get_user_id_from_token
+    
+    def get_user_id_from_token(headers: Dict[str, str]) -> Optional[int]:
+        token = headers.get('X-Auth-Token', '') or headers.get('x-auth-token', '')
+        cached = _token_cache.get(token)
+        if cached and cached[1] > time.monotonic():
+            module.use_shard(*module.token_shard(token))
+            return cached[0]
+        
+        user_id = lookup(headers)
+        if user_id:
+            remember_token(token, user_id)
+        return user_id
+    return get_user_id_from_token
+
+def check_query_catalogs(module: types.ModuleType):
+    """Prepared statement names are shared across pooled services, so equal names must mean equal SQL"""
+    for name in POOLED_SERVICES:
+        other = _modules.get(name)
+        if other is None or other is module:
+            continue
+        for query_name, sql in module.QUERIES.items():
+            if query_name in other.QUERIES and other.QUERIES[query_name] != sql:
+                raise RuntimeError(f'Query {query_name} differs between {module.__name__} and {other.__name__}')
+
+def load_service(name: str) -> types.ModuleType:
+    """Import a sibling function's index.py once and point it at the shared connections, token cache and client"""
+    module = _modules.get(name)
+    if module is not None:
+        return module
+    
+    with _modules_lock:
+        if name in _modules:
+            return _modules[name]
+        
+        path = os.path.join(MODULES_DIR, name, 'index.py')
+        spec = importlib.util.spec_from_file_location(f'taskbuddy_{name}', path)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[spec.name] = module
+        spec.loader.exec_module(module)
+        
+        module.requests = telegram_client
+        if name in POOLED_SERVICES:
+            check_query_catalogs(module)
+            module.get_db_connection = shared_connection_getter(module)
+            module.release_connection = release_shared_connection
+            module.execute_query = shared_query_executor(module)
+            module.get_user_id_from_token = cached_token_lookup(module)
+        
+        _modules[name] = module
+        return module
+
+def resolve_service(event: Dict[str, Any]):
+    """Service from the first path segment (/goals/...) or ?service=, plus the event to hand over"""
+    query_params = dict(event.get('queryStringParameters') or {})
+    path = event.get('path') or '/'
+    segments = [s for s in path.split('/') if s]
+    
+    if segments and segments[0] in SERVICES:
+        service = segments[0]
+        path = '/' + '/'.join(segments[1:])
+    else:
+        service = query_params.pop('service', '')
+    
+    return service, {**event, 'path': path, 'queryStringParameters': query_params}
+
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    service, service_event = resolve_service(event)
+    
+    if service not in SERVICES:
+        return {
+            'statusCode': 404,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f"Unknown service, expected one of: {', '.join(SERVICES)}"})
+        }
+    
+    return load_service(service).handler(service_event, context)
@@ -6,25 +6,31 @@ Returns: HTTP response dict with auth tokens or user data
 '''
 
 import json
+import math
 import os
+import random
+import threading
+import time
 import psycopg2
 import hashlib
 import secrets
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime, timedelta
 
 def hash_password(password: str) -> str:
     return hashlib.sha256(password.encode()).hexdigest()
 
-def generate_token() -> str:
-    return secrets.token_urlsafe(32)
+def generate_token(user_id: int) -> str:
+    """'<user_id>.' prefix lets the other functions route the token to the user's shard before looking it up"""
+    return f'{user_id}.{secrets.token_urlsafe(32)}'
 
 def create_token(user_id: int, conn) -> str:
-    token = generate_token()
+    token = generate_token(user_id)
     cur = conn.cursor()
     try:
         cur.execute(
-            "INSERT INTO tokens (user_id, token) VALUES (%s, %s)",
+            "INSERT INTO t_p59845625_taskbuddy_project.tokens (user_id, token) VALUES (%s, %s)",
             (user_id, token)
         )
         return token
@@ -35,12 +41,14 @@ def get_user_from_token(token: str) -> Optional[int]:
     if not token:
         return None
     
-    conn = get_db_connection()
+    user_id, dot, _ = token.partition('.')
+    shard = user_shard(int(user_id))[0] if dot and user_id.isdigit() else 0
+    conn = get_shard_connection(shard)
     cur = conn.cursor()
     
     try:
         cur.execute(
-            "SELECT user_id FROM tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
+            "SELECT user_id FROM t_p59845625_taskbuddy_project.tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
             (token,)
         )
         result = cur.fetchone()
@@ -50,9 +58,195 @@ def get_user_from_token(token: str) -> Optional[int]:
         conn.close()
 
 def get_db_connection():
+    """DATABASE_URL: the user_shards directory and the shared rate limit counters"""
     dsn = os.environ.get('DATABASE_URL')
     return psycopg2.connect(dsn)
 
+def get_shard_dsns() -> List[str]:
+    """Primaries holding disjoint sets of users, indexed by user_shards.shard; unset, DATABASE_URL is the only shard"""
+    dsns = [dsn.strip() for dsn in os.environ.get('SHARD_DSNS', '').split(',') if dsn.strip()]
+    return dsns or [os.environ.get('DATABASE_URL')]
+
+def get_shard_connection(shard: int):
+    return psycopg2.connect(get_shard_dsns()[shard])
+
+# New users are spread over the shards by id; tools/rebalance_shards.py moves existing ones
+PLACE_USER_QUERY = """INSERT INTO t_p59845625_taskbuddy_project.user_shards (user_id, email, shard) 
+    SELECT id, %(email)s, MOD(id, %(shards)s) 
+    FROM (SELECT nextval(pg_get_serial_sequence('t_p59845625_taskbuddy_project.user_shards', 'user_id')) AS id) n 
+    ON CONFLICT (email) DO NOTHING 
+    RETURNING user_id, shard"""
+
+def place_user(email: str) -> Tuple[int, int]:
+    """Allocate the user id and shard in the directory, committed before the user row is written on the shard"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(PLACE_USER_QUERY, {'email': email, 'shards': len(get_shard_dsns())})
+        placed = cur.fetchone()
+        if not placed:
+            # Taken: either a registered user, whose shard insert then fails on the email, or a registration
+            # that died after this commit, whose id and shard are reused
+            cur.execute(
+                "SELECT user_id, shard FROM t_p59845625_taskbuddy_project.user_shards WHERE email = %s",
+                (email,)
+            )
+            placed = cur.fetchone()
+        conn.commit()
+        return placed
+    finally:
+        cur.close()
+        conn.close()
+
+def email_shard(email: str) -> Tuple[int, bool]:
+    """(shard, moving) of the account registered with email; users missing from the directory are on shard 0"""
+    if len(get_shard_dsns()) == 1:
+        return 0, False
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            "SELECT shard, moving FROM t_p59845625_taskbuddy_project.user_shards WHERE email = %s",
+            (email,)
+        )
+        return cur.fetchone() or (0, False)
+    finally:
+        cur.close()
+        conn.close()
+
+def user_shard(user_id: int) -> Tuple[int, bool]:
+    if len(get_shard_dsns()) == 1:
+        return 0, False
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            "SELECT shard, moving FROM t_p59845625_taskbuddy_project.user_shards WHERE user_id = %s",
+            (user_id,)
+        )
+        return cur.fetchone() or (0, False)
+    finally:
+        cur.close()
+        conn.close()
+
+def user_moving_response() -> Dict[str, Any]:
+    """tools/rebalance_shards.py is copying the user to another shard, a token written now would be left behind"""
+    return {
+        'statusCode': 503,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': os.environ.get('SHARD_CACHE_TTL', '30'),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Account is being moved, retry shortly'})
+    }
+
+# name -> (requests, window seconds, also enforce across instances)
+RATE_LIMITS = {
+    'login': (10, 60, True),
+    'register': (5, 60, True)
+}
+
+RATE_BUCKETS_MAX = 10000
+
+_rate_buckets: Dict[str, Tuple[float, float, float]] = OrderedDict()
+# Requests may run on several threads (the router's sync workers), the pop/refill/insert must not interleave
+_rate_buckets_lock = threading.Lock()
+
+def get_client_ip(event: Dict[str, Any]) -> str:
+    """Address the platform saw; X-Forwarded-For is client-controlled except for the entry the proxy appends last"""
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    if source_ip:
+        return source_ip
+    headers = event.get('headers', {}) or {}
+    forwarded = headers.get('X-Forwarded-For', '') or headers.get('x-forwarded-for', '')
+    if forwarded:
+        return forwarded.split(',')[-1].strip()
+    return 'unknown'
+
+def take_local_token(key: str, limit: int, window: int) -> float:
+    """In-process token bucket, returns seconds until a token is available (0 when allowed)"""
+    with _rate_buckets_lock:
+        now = time.monotonic()
+        tokens, updated, _ = _rate_buckets.pop(key, (float(limit), now, now))
+        tokens = min(float(limit), tokens + (now - updated) * limit / window)
+        evict_full_buckets(now)
+        
+        retry_after = 0
+        if tokens < 1:
+            retry_after = (1 - tokens) * window / limit
+        else:
+            tokens -= 1
+        
+        # Buckets stay ordered by last use with the time they will be full again, a full bucket equals no bucket
+        _rate_buckets[key] = (tokens, now, now + (limit - tokens) * window / limit)
+    return retry_after
+
+def evict_full_buckets(now: float):
+    """Drop least recently used buckets that have refilled, so a flood of new keys cannot reset live ones;
+    called with _rate_buckets_lock held"""
+    while len(_rate_buckets) >= RATE_BUCKETS_MAX:
+        key = next(iter(_rate_buckets))
+        if _rate_buckets[key][2] > now:
+            break
+        del _rate_buckets[key]
+
+def take_shared_token(key: str, limit: int, window: int) -> float:
+    """Fixed-window counter shared by all instances, returns seconds until the window resets when exceeded"""
+    now = time.time()
+    window_id = int(now // window)
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """INSERT INTO t_p59845625_taskbuddy_project.rate_limits (key, window_id, hits) 
+               VALUES (%s, %s, 1) 
+               ON CONFLICT (key, window_id) DO UPDATE SET hits = rate_limits.hits + 1 
+               RETURNING hits""",
+            (key, window_id)
+        )
+        hits = cur.fetchone()[0]
+        
+        if hits == 1 and random.random() < 0.01:
+            cur.execute(
+                "DELETE FROM t_p59845625_taskbuddy_project.rate_limits WHERE window_id < %s AND key LIKE %s",
+                (window_id - 1, key.split(':')[0] + ':%')
+            )
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    
+    return (window_id + 1) * window - now if hits > limit else 0
+
+def check_rate_limit(name: str, identity: Any) -> float:
+    limit, window, shared = RATE_LIMITS[name]
+    key = f'{name}:{identity}'
+    retry_after = take_local_token(key, limit, window)
+    if not retry_after and shared:
+        retry_after = take_shared_token(key, limit, window)
+    return retry_after
+
+def rate_limited_response(retry_after: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(max(1, math.ceil(retry_after))),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Too many requests'})
+    }
+
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
     
@@ -71,6 +265,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     path = event.get('queryStringParameters', {}).get('action', '')
     
     try:
+        if method == 'POST' and path in RATE_LIMITS:
+            retry_after = check_rate_limit(path, get_client_ip(event))
+            if retry_after:
+                return rate_limited_response(retry_after)
+        
         if method == 'POST' and path == 'register':
             return register_user(event)
         elif method == 'POST' and path == 'login':
@@ -104,20 +303,20 @@ def register_user(event: Dict[str, Any]) -> Dict[str, Any]:
         }
     
     password_hash = hash_password(password)
+    user_id, shard = place_user(email)
     
-    conn = get_db_connection()
+    conn = get_shard_connection(shard)
     cur = conn.cursor()
     
     try:
         cur.execute(
-            "INSERT INTO users (email, password_hash, username) VALUES (%s, %s, %s) RETURNING id, email, username, created_at",
-            (email, password_hash, username)
+            "INSERT INTO t_p59845625_taskbuddy_project.users (id, email, password_hash, username) VALUES (%s, %s, %s, %s) RETURNING id, email, username, created_at",
+            (user_id, email, password_hash, username)
         )
         user = cur.fetchone()
-        user_id = user[0]
         
         cur.execute(
-            "INSERT INTO notifications (user_id, title, message, type) VALUES (%s, %s, %s, %s)",
+            "INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type) VALUES (%s, %s, %s, %s)",
             (user_id, 'Добро пожаловать в TaskBuddy!', 'Вы успешно зарегистрировались. Начните создавать свои первые задачи!', 'success')
         )
         
@@ -148,6 +347,8 @@ def register_user(event: Dict[str, Any]) -> Dict[str, Any]:
         cur.close()
         conn.close()
 
+LOGIN_QUERY = "SELECT id, email, username, password_hash, created_at FROM t_p59845625_taskbuddy_project.users WHERE email = %s"
+
 def login_user(event: Dict[str, Any]) -> Dict[str, Any]:
     body = json.loads(event.get('body', '{}'))
     email = body.get('email', '').strip().lower()
@@ -161,15 +362,15 @@ def login_user(event: Dict[str, Any]) -> Dict[str, Any]:
         }
     
     password_hash = hash_password(password)
+    shard, moving = email_shard(email)
+    if moving:
+        return user_moving_response()
     
-    conn = get_db_connection()
+    conn = get_shard_connection(shard)
     cur = conn.cursor()
     
     try:
-        cur.execute(
-            "SELECT id, email, username, password_hash, created_at FROM users WHERE email = %s",
-            (email,)
-        )
+        cur.execute(LOGIN_QUERY, (email,))
         user = cur.fetchone()
         
         if not user or user[3] != password_hash:
@@ -5,87 +5,483 @@ Args: event - dict with httpMethod, body, queryStringParameters, headers
 Returns: HTTP response dict with goals data
 '''
 
+import base64
+import csv
+import gzip
+import io
 import json
+import math
 import os
+import random
+import re
+import tempfile
+import threading
+import time
 import psycopg2
 import requests
-from typing import Dict, Any, Optional, List
-from datetime import datetime
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+from datetime import datetime, date, timedelta
 
-def send_telegram_notification(user_id: int, message: str):
-    """Send Telegram notification to user if they have chat_id"""
-    conn = get_db_connection()
-    cur = conn.cursor()
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+def send_telegram_notification(chat_id: Optional[int], enabled: bool, message: str):
+    """Send Telegram notification using chat_id and settings returned by the mutation statement"""
+    if not chat_id or not enabled:
+        return
     
-    try:
-        cur.execute(
-            """SELECT u.telegram_chat_id, COALESCE(s.telegram_notifications, TRUE) as tg_enabled
-               FROM t_p59845625_taskbuddy_project.users u
-               LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON u.id = s.user_id
-               WHERE u.id = %s""",
-            (user_id,)
-        )
-        result = cur.fetchone()
-        
-        if result and result[0]:
-            chat_id = result[0]
-            tg_enabled = result[1]
-            
-            if tg_enabled:
-                bot_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
-                
-                if bot_token:
-                    url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
-                    try:
-                        requests.post(url, json={
-                            'chat_id': chat_id,
-                            'text': message,
-                            'parse_mode': 'HTML'
-                        }, timeout=5)
-                    except Exception:
-                        pass
-    finally:
-        cur.close()
-        conn.close()
+    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+    
+    if bot_token:
+        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
+        try:
+            requests.post(url, json={
+                'chat_id': chat_id,
+                'text': message,
+                'parse_mode': 'HTML'
+            }, timeout=5)
+        except Exception:
+            pass
 
-def create_notification(user_id: int, title: str, message: str, notif_type: str):
-    """Helper function to create notification for user"""
-    conn = get_db_connection()
-    cur = conn.cursor()
+GOAL_COLUMNS = """id, title, description, category, priority, status, 
+    start_date, end_date, progress, created_at, updated_at, 
+    recurrence, recurrence_interval, recurrence_until"""
+
+GOAL_UPDATE_FIELDS = (
+    ('title', 'title'),
+    ('description', 'description'),
+    ('category', 'category'),
+    ('priority', 'priority'),
+    ('status', 'status'),
+    ('startDate', 'start_date'),
+    ('endDate', 'end_date'),
+    ('progress', 'progress'),
+    ('recurrence', 'recurrence'),
+    ('recurrenceInterval', 'recurrence_interval'),
+    ('recurrenceUntil', 'recurrence_until')
+)
+
+# Final SELECT of fused mutations: the changed row plus where to deliver its Telegram message
+# Ends with the WRITE_LSN column: every statement using it is a write
+TELEGRAM_TARGET_SELECT = """SELECT {source}.*, u.telegram_chat_id, COALESCE(s.telegram_notifications, TRUE), 
+                      pg_current_wal_insert_lsn()::text 
+               FROM {source} 
+               LEFT JOIN t_p59845625_taskbuddy_project.users u ON u.id = %(user_id)s 
+               LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON s.user_id = u.id"""
+
+# Goals the user may change: owned ones plus those shared with them as editor
+GOAL_EDITABLE = """(user_id = %(user_id)s OR id IN (
+    SELECT goal_id FROM t_p59845625_taskbuddy_project.goal_members WHERE user_id = %(user_id)s AND role = 'editor'))"""
+
+# Fan-out of a change to everyone else on a shared goal: one multi-row notification insert and queued Telegram
+# messages, the title escaped in SQL because the outbox is sent with HTML parse mode
+SHARED_GOAL_FANOUT = """recipients AS (
+                       SELECT owner_id AS user_id FROM updated WHERE owner_id <> %(user_id)s 
+                       UNION 
+                       SELECT m.user_id FROM t_p59845625_taskbuddy_project.goal_members m 
+                       JOIN updated ON m.goal_id = updated.id WHERE m.user_id <> %(user_id)s
+                   ), fanout AS (
+                       INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+                       SELECT r.user_id, 'Общая задача обновлена', 'Задача "' || updated.title || '" изменена', 
+                              'shared_goal_updated', FALSE 
+                       FROM recipients r CROSS JOIN updated
+                   ), outbox AS (
+                       INSERT INTO t_p59845625_taskbuddy_project.telegram_outbox (chat_id, message) 
+                       SELECT u.telegram_chat_id, '🔔 <b>Общая задача обновлена</b>' || chr(10) || chr(10) || '📋 ' || 
+                              replace(replace(replace(updated.title, '&', '&amp;'), '<', '&lt;'), '>', '&gt;') 
+                       FROM recipients r CROSS JOIN updated 
+                       JOIN t_p59845625_taskbuddy_project.users u ON u.id = r.user_id 
+                       LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON s.user_id = r.user_id 
+                       WHERE u.telegram_chat_id IS NOT NULL AND COALESCE(s.telegram_notifications, TRUE)
+                   )"""
+
+# Changed columns of an UPDATE ... FROM (... to_jsonb(prev) AS old_row) old as {"column": [old, new]}, NULL if none
+GOAL_DIFF = """(SELECT jsonb_object_agg(n.key, jsonb_build_array(old.old_row -> n.key, n.value)) 
+                     FROM jsonb_each(to_jsonb(g)) n 
+                     WHERE n.key NOT IN ('updated_at', 'completed_at') AND n.value IS DISTINCT FROM old.old_row -> n.key)"""
+
+RECURRENCE_RULES = ('daily', 'weekly', 'monthly')
+
+def goal_from_row(row) -> Dict[str, Any]:
+    """Map a row selected with GOAL_COLUMNS to the API representation"""
+    return {
+        'id': row[0],
+        'title': row[1],
+        'description': row[2],
+        'category': row[3],
+        'priority': row[4],
+        'status': row[5],
+        'startDate': row[6].isoformat() if row[6] else None,
+        'endDate': row[7].isoformat() if row[7] else None,
+        'progress': row[8],
+        'createdAt': row[9].isoformat() if row[9] else None,
+        'updatedAt': row[10].isoformat() if row[10] else None,
+        'recurrence': row[11],
+        'recurrenceInterval': row[12],
+        'recurrenceUntil': row[13].isoformat() if row[13] else None
+    }
+
+def subtask_from_row(row) -> Dict[str, Any]:
+    return {
+        'id': row[0],
+        'goalId': row[1],
+        'title': row[2],
+        'isDone': row[3],
+        'position': row[4]
+    }
+
+def validate_recurrence(body: Dict[str, Any]) -> Optional[str]:
+    if body.get('recurrence') not in (None,) + RECURRENCE_RULES:
+        return 'Recurrence must be one of: daily, weekly, monthly'
+    interval = body.get('recurrenceInterval', 1)
+    if not isinstance(interval, int) or isinstance(interval, bool) or interval < 1:
+        return 'Recurrence interval must be a positive integer'
+    return None
+
+SUBTASKS_JSON = """COALESCE((SELECT json_agg(json_build_object('id', s.id, 'title', s.title, 'isDone', s.is_done, 
+                                                    'position', s.position) ORDER BY s.position, s.id) 
+                  FROM t_p59845625_taskbuddy_project.subtasks s WHERE s.goal_id = g.id), '[]')"""
+
+# API field -> SELECT expression for ?fields= on the goal list; id is always returned
+GOAL_LIST_FIELDS = {
+    'title': 'title',
+    'description': 'description',
+    'category': 'category',
+    'priority': 'priority',
+    'status': 'status',
+    'startDate': 'start_date',
+    'endDate': 'end_date',
+    'progress': 'progress',
+    'createdAt': 'created_at',
+    'updatedAt': 'updated_at',
+    'recurrence': 'recurrence',
+    'recurrenceInterval': 'recurrence_interval',
+    'recurrenceUntil': 'recurrence_until',
+    'subtasks': SUBTASKS_JSON
+}
+
+QUERIES = {
+    'user_id_by_token': "SELECT user_id FROM t_p59845625_taskbuddy_project.tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
+    'goals_by_user': f"""SELECT {GOAL_COLUMNS}, 
+        {SUBTASKS_JSON} 
+        FROM t_p59845625_taskbuddy_project.goals g WHERE user_id = %s ORDER BY created_at DESC""",
+    'analytics_cache': """SELECT data FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+        WHERE user_id = %s AND weeks = %s AND computed_at::date = CURRENT_DATE"""
+}
+
+SHARD_CACHE_TTL = int(os.environ.get('SHARD_CACHE_TTL', '30'))
+SHARD_CACHE_MAX = 10000
+
+_shard_dsns: List[str] = []
+# shard -> primary connection kept open across warm invocations, and the statements prepared on it
+_pooled_connections: Dict[int, Any] = {}
+_prepared_statements: Dict[int, set] = {}
+# user_id -> (shard, moving, expires) read from the user_shards directory
+_user_shards: Dict[int, Tuple[int, bool, float]] = OrderedDict()
+_user_shards_lock = threading.Lock()
+# Shard of the request this thread is serving, set from the token before anything touches the database
+_request = threading.local()
+
+def get_shard_dsns() -> List[str]:
+    """Primaries holding disjoint sets of users, indexed by user_shards.shard; unset, DATABASE_URL is the only shard.
+    Read once per instance, it is on every request's path"""
+    if not _shard_dsns:
+        dsns = [dsn.strip() for dsn in os.environ.get('SHARD_DSNS', '').split(',') if dsn.strip()]
+        _shard_dsns[:] = dsns or [os.environ.get('DATABASE_URL')]
+    return _shard_dsns
+
+def lookup_user_shard(user_id: int) -> Tuple[int, bool]:
+    """(shard, moving) of a user from the directory on DATABASE_URL, cached for SHARD_CACHE_TTL"""
+    if len(get_shard_dsns()) == 1:
+        return 0, False
     
+    now = time.monotonic()
+    with _user_shards_lock:
+        cached = _user_shards.get(user_id)
+    if cached and cached[2] > now:
+        return cached[0], cached[1]
+    
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    cur = conn.cursor()
     try:
-        cur.execute(
-            """INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
-               VALUES (%s, %s, %s, %s, FALSE)""",
-            (user_id, title, message, notif_type)
-        )
-        conn.commit()
+        cur.execute("SELECT shard, moving FROM t_p59845625_taskbuddy_project.user_shards WHERE user_id = %s", (user_id,))
+        # Unknown ids go to shard 0, where their token lookup fails like any other bad token
+        shard, moving = cur.fetchone() or (0, False)
     finally:
         cur.close()
         conn.close()
+    
+    with _user_shards_lock:
+        _user_shards.pop(user_id, None)
+        _user_shards[user_id] = (shard, moving, now + SHARD_CACHE_TTL)
+        while len(_user_shards) > SHARD_CACHE_MAX:
+            _user_shards.popitem(last=False)
+    return shard, moving
+
+def token_shard(token: str) -> Tuple[int, bool]:
+    """Tokens start with '<user_id>.'; older tokens without the prefix belong to users who never left shard 0"""
+    user_id, dot, _ = token.partition('.')
+    return lookup_user_shard(int(user_id)) if dot and user_id.isdigit() else (0, False)
+
+def use_shard(shard: int, moving: bool = False):
+    """Point this thread's get_db_connection at a shard until the next call"""
+    _request.shard, _request.moving = shard, moving
+
+def current_shard() -> int:
+    return getattr(_request, 'shard', 0)
+
+def user_moving_response() -> Optional[Dict[str, Any]]:
+    """503 for a write while tools/rebalance_shards.py copies the routed user to another shard, else None"""
+    if not getattr(_request, 'moving', False):
+        return None
+    return {
+        'statusCode': 503,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(SHARD_CACHE_TTL),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Account is being moved, retry shortly'})
+    }
 
 def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+    """Primary of the routed shard, kept open across warm invocations so prepared statements survive"""
+    shard = current_shard()
+    conn = _pooled_connections.get(shard)
+    if conn is None or conn.closed:
+        conn = _pooled_connections[shard] = psycopg2.connect(get_shard_dsns()[shard])
+        _prepared_statements[shard] = set()
+    return conn
+
+def pooled_shard(conn) -> Optional[int]:
+    for shard, pooled in _pooled_connections.items():
+        if pooled is conn:
+            return shard
+    return None
+
+def release_connection(conn):
+    """Finish using a connection: a pooled one is reset and kept, any other is closed"""
+    if pooled_shard(conn) is None:
+        conn.close()
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+
+def execute_query(cur, name: str, params):
+    """Run a QUERIES entry, server-side prepared once per pooled connection"""
+    sql = QUERIES[name]
+    shard = pooled_shard(cur.connection)
+    if shard is None:
+        cur.execute(sql, params)
+        return
+    
+    if name not in _prepared_statements[shard]:
+        counter = iter(range(1, sql.count('%s') + 1))
+        cur.execute(f"PREPARE {name} AS " + re.sub(r'%s', lambda _: f'${next(counter)}', sql))
+        _prepared_statements[shard].add(name)
+    
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+
+def get_replica_dsns() -> List[str]:
+    """Replicas of DATABASE_URL; once users are spread over SHARD_DSNS every read goes to its shard's primary"""
+    if len(get_shard_dsns()) > 1:
+        return []
+    return [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+
+def get_read_connection(headers: Dict[str, str]):
+    """Connect to a read replica, or to the primary if the replica has not replayed the client's last write"""
+    replicas = get_replica_dsns()
+    if not replicas:
+        return get_db_connection()
+    
+    try:
+        conn = psycopg2.connect(random.choice(replicas), connect_timeout=2)
+    except psycopg2.OperationalError:
+        return get_db_connection()
+    
+    last_write = headers.get('X-Last-Write', '') or headers.get('x-last-write', '')
+    if last_write:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, TRUE)", (last_write,))
+            caught_up = cur.fetchone()[0]
+            conn.rollback()
+        except psycopg2.Error:
+            caught_up = False
+        finally:
+            cur.close()
+        
+        if not caught_up:
+            release_connection(conn)
+            return get_db_connection()
+    
+    return conn
+
+# Last column of every write statement, so the X-Last-Write position comes back with the write's own row
+WRITE_LSN = 'pg_current_wal_insert_lsn()::text'
+
+def split_write_lsn(row) -> Tuple[Optional[tuple], Optional[str]]:
+    """Separate the trailing WRITE_LSN column, leaving the row as the handler reads it"""
+    if not row:
+        return None, None
+    return row[:-1], row[-1]
+
+def get_write_headers(lsn: Optional[str]) -> Dict[str, str]:
+    """Read-your-writes token for the client to send back as X-Last-Write on the next read. The position is read
+    inside the write statement, just before the transaction's commit record, so only a replica whose replay stops
+    between the two could pass the check without showing the write"""
+    if not lsn or not get_replica_dsns():
+        return {}
+    return {'X-Last-Write': lsn, 'Access-Control-Expose-Headers': 'X-Last-Write'}
+
+# name -> (requests, window seconds), enforced per instance
+RATE_LIMITS = {
+    'goals_list': (60, 60)
+}
+
+RATE_BUCKETS_MAX = 10000
+
+_rate_buckets: Dict[str, Tuple[float, float, float]] = OrderedDict()
+# Requests may run on several threads (the router's sync workers), the pop/refill/insert must not interleave
+_rate_buckets_lock = threading.Lock()
+
+def take_local_token(key: str, limit: int, window: int) -> float:
+    """In-process token bucket, returns seconds until a token is available (0 when allowed)"""
+    with _rate_buckets_lock:
+        now = time.monotonic()
+        tokens, updated, _ = _rate_buckets.pop(key, (float(limit), now, now))
+        tokens = min(float(limit), tokens + (now - updated) * limit / window)
+        evict_full_buckets(now)
+        
+        retry_after = 0
+        if tokens < 1:
+            retry_after = (1 - tokens) * window / limit
+        else:
+            tokens -= 1
+        
+        # Buckets stay ordered by last use with the time they will be full again, a full bucket equals no bucket
+        _rate_buckets[key] = (tokens, now, now + (limit - tokens) * window / limit)
+    return retry_after
+
+def evict_full_buckets(now: float):
+    """Drop least recently used buckets that have refilled, so a flood of new keys cannot reset live ones;
+    called with _rate_buckets_lock held"""
+    while len(_rate_buckets) >= RATE_BUCKETS_MAX:
+        key = next(iter(_rate_buckets))
+        if _rate_buckets[key][2] > now:
+            break
+        del _rate_buckets[key]
+
+def check_rate_limit(name: str, identity: Any) -> float:
+    limit, window = RATE_LIMITS[name]
+    return take_local_token(f'{name}:{identity}', limit, window)
+
+def rate_limited_response(retry_after: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(max(1, math.ceil(retry_after))),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Too many requests'})
+    }
+
+COMPRESSION_MIN_BYTES = 1024
+
+def accepted_encodings(headers: Dict[str, str]) -> Dict[str, float]:
+    """Parse Accept-Encoding into encoding -> q-value"""
+    header = headers.get('Accept-Encoding', '') or headers.get('accept-encoding', '')
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+def accepted_q(encodings: Dict[str, float], name: str) -> float:
+    """q-value for an encoding, falling back to the * wildcard when it is not listed"""
+    return encodings.get(name, encodings.get('*', 0))
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    """Compress a JSON response body with brotli or gzip when the client accepts it and it is worth it"""
+    if response.get('statusCode') != 200:
+        return response
+    
+    # Every 200 varies on Accept-Encoding, including bodies too small to compress
+    response['headers']['Vary'] = 'Accept-Encoding'
+    raw = response.get('body', '').encode('utf-8')
+    if len(raw) < COMPRESSION_MIN_BYTES:
+        return response
+    
+    encodings = accepted_encodings(event.get('headers', {}))
+    if brotli is not None and accepted_q(encodings, 'br') > 0:
+        encoding, data = 'br', brotli.compress(raw, quality=5)
+    elif accepted_q(encodings, 'gzip') > 0:
+        encoding, data = 'gzip', gzip.compress(raw, compresslevel=6)
+    else:
+        return response
+    
+    response['headers']['Content-Encoding'] = encoding
+    response['isBase64Encoded'] = True
+    response['body'] = base64.b64encode(data).decode('ascii')
+    return response
+
+def parse_fields(query_params: Dict[str, Any], allowed: Dict[str, str]) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Read a ?fields= sparse fieldset; None means every field"""
+    raw = query_params.get('fields')
+    if not raw:
+        return None, None
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip() and f.strip() != 'id'))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+    return fields, None
+
+def api_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
 
 def get_user_id_from_token(headers: Dict[str, str]) -> Optional[int]:
     token = headers.get('X-Auth-Token', '') or headers.get('x-auth-token', '')
     if not token:
         return None
     
-    conn = get_db_connection()
+    use_shard(*token_shard(token))
+    
+    conn = get_read_connection(headers)
     cur = conn.cursor()
     
     try:
-        cur.execute(
-            "SELECT user_id FROM t_p59845625_taskbuddy_project.tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
-            (token,)
-        )
+        execute_query(cur, 'user_id_by_token', (token,))
         result = cur.fetchone()
+        
+        if not result and get_replica_dsns():
+            cur.close()
+            release_connection(conn)
+            conn = get_db_connection()
+            cur = conn.cursor()
+            execute_query(cur, 'user_id_by_token', (token,))
+            result = cur.fetchone()
+        
         return result[0] if result else None
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -96,7 +492,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Last-Write',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -112,9 +508,53 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Unauthorized'})
         }
     
+    moving = user_moving_response() if method != 'GET' else None
+    if moving:
+        return moving
+    
+    action = event.get('queryStringParameters', {}).get('action', '')
+    
     try:
-        if method == 'GET':
-            return get_goals(user_id)
+        if method == 'GET' and action == 'analytics':
+            return get_analytics(event, user_id)
+        elif method == 'GET' and action == 'activity':
+            return get_activity(event, user_id)
+        elif method == 'POST' and action == 'reconcile_activity':
+            return reconcile_activity(event, user_id)
+        elif method == 'GET' and action == 'occurrences':
+            return get_occurrences(event, user_id)
+        elif method == 'POST' and action == 'complete_occurrence':
+            return complete_occurrence(event, user_id)
+        elif method == 'DELETE' and action == 'complete_occurrence':
+            return uncomplete_occurrence(event, user_id)
+        elif method == 'GET' and action == 'visible':
+            retry_after = check_rate_limit('goals_list', user_id)
+            if retry_after:
+                return rate_limited_response(retry_after)
+            return get_visible_goals(event, user_id)
+        elif method == 'GET' and action == 'history':
+            return get_goal_history(event, user_id)
+        elif method == 'GET' and action == 'members':
+            return get_goal_members(event, user_id)
+        elif method == 'POST' and action == 'members':
+            return add_goal_member(event, user_id)
+        elif method == 'DELETE' and action == 'members':
+            return remove_goal_member(event, user_id)
+        elif method == 'POST' and action == 'import':
+            return import_goals(event, user_id)
+        elif method == 'POST' and action == 'subtasks':
+            return create_subtask(event, user_id)
+        elif method == 'PUT' and action == 'subtasks':
+            return update_subtask(event, user_id)
+        elif method == 'DELETE' and action == 'subtasks':
+            return delete_subtask(event, user_id)
+        elif method == 'GET' and action == 'export':
+            return export_data(event, user_id)
+        elif method == 'GET':
+            retry_after = check_rate_limit('goals_list', user_id)
+            if retry_after:
+                return rate_limited_response(retry_after)
+            return get_goals(event, user_id)
         elif method == 'POST':
             return create_goal(event, user_id)
         elif method == 'PUT':
@@ -134,250 +574,1716 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)})
         }
 
-def get_goals(user_id: int) -> Dict[str, Any]:
-    conn = get_db_connection()
+def get_goals(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    fields, fields_error = parse_fields(event.get('queryStringParameters', {}), GOAL_LIST_FIELDS)
+    if fields_error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': fields_error})
+        }
+    
+    conn = get_read_connection(event.get('headers', {}))
+    cur = conn.cursor()
+    
+    try:
+        if fields is None:
+            execute_query(cur, 'goals_by_user', (user_id,))
+            goals = []
+            for row in cur.fetchall():
+                goal = goal_from_row(row)
+                goal['subtasks'] = row[14]
+                goals.append(goal)
+        else:
+            cur.execute(
+                f"""SELECT g.id{''.join(', ' + GOAL_LIST_FIELDS[f] for f in fields)} 
+                    FROM t_p59845625_taskbuddy_project.goals g WHERE user_id = %s ORDER BY created_at DESC""",
+                (user_id,)
+            )
+            keys = ['id'] + fields
+            goals = [dict(zip(keys, map(api_value, row))) for row in cur.fetchall()]
+        
+        return compress_response(event, {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'goals': goals}, ensure_ascii=False, separators=(',', ':'))
+        })
+    finally:
+        cur.close()
+        release_connection(conn)
+
+MEMBER_ROLES = ('editor', 'viewer')
+VISIBLE_PAGE_SIZE = 50
+
+def encode_goal_cursor(created_at: datetime, goal_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{created_at.isoformat()}|{goal_id}'.encode()).decode('ascii')
+
+def decode_goal_cursor(cursor: str) -> Tuple[datetime, int]:
+    created_at, goal_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode().split('|')
+    return datetime.fromisoformat(created_at), int(goal_id)
+
+def get_visible_goals(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """Owned and shared goals newest first, merged from two keyset-bounded index scans"""
+    query_params = event.get('queryStringParameters', {})
+    
+    try:
+        limit = max(1, min(int(query_params.get('limit', VISIBLE_PAGE_SIZE)), 200))
+        after = decode_goal_cursor(query_params['cursor']) if query_params.get('cursor') else None
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid limit or cursor'})
+        }
+    
+    keyset = ' AND (g.created_at, g.id) < (%(after_created)s, %(after_id)s)' if after else ''
+    member_keyset = ' AND (m.goal_created_at, m.goal_id) < (%(after_created)s, %(after_id)s)' if after else ''
+    params = {'user_id': user_id, 'limit': limit + 1, 'after_created': after and after[0], 'after_id': after and after[1]}
+    
+    conn = get_read_connection(event.get('headers', {}))
     cur = conn.cursor()
     
     try:
         cur.execute(
-            """SELECT id, title, description, category, priority, status, 
-               start_date, end_date, progress, created_at, updated_at 
-               FROM t_p59845625_taskbuddy_project.goals WHERE user_id = %s ORDER BY created_at DESC""",
-            (user_id,)
+            f"""SELECT {GOAL_COLUMNS}, {SUBTASKS_JSON}, g.user_id <> %(user_id)s, page.role 
+                FROM (
+                    (SELECT g.id AS page_id, g.created_at AS page_created, NULL::varchar AS role 
+                     FROM t_p59845625_taskbuddy_project.goals g 
+                     WHERE g.user_id = %(user_id)s{keyset} 
+                     ORDER BY g.created_at DESC, g.id DESC LIMIT %(limit)s) 
+                    UNION ALL 
+                    (SELECT m.goal_id, m.goal_created_at, m.role 
+                     FROM t_p59845625_taskbuddy_project.goal_members m 
+                     WHERE m.user_id = %(user_id)s{member_keyset} 
+                     ORDER BY m.goal_created_at DESC, m.goal_id DESC LIMIT %(limit)s)
+                ) page 
+                JOIN t_p59845625_taskbuddy_project.goals g ON g.id = page.page_id 
+                ORDER BY page.page_created DESC, page.page_id DESC 
+                LIMIT %(limit)s""",
+            params
         )
         rows = cur.fetchall()
         
         goals = []
-        for row in rows:
-            goals.append({
-                'id': row[0],
-                'title': row[1],
-                'description': row[2],
-                'category': row[3],
-                'priority': row[4],
-                'status': row[5],
-                'startDate': row[6].isoformat() if row[6] else None,
-                'endDate': row[7].isoformat() if row[7] else None,
-                'progress': row[8],
-                'createdAt': row[9].isoformat() if row[9] else None,
-                'updatedAt': row[10].isoformat() if row[10] else None
-            })
+        for row in rows[:limit]:
+            goal = goal_from_row(row)
+            goal['subtasks'] = row[14]
+            goal['shared'] = row[15]
+            goal['role'] = row[16] or 'owner'
+            goals.append(goal)
         
-        return {
+        last = rows[limit - 1] if len(rows) > limit else None
+        
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'goals': goals})
-        }
+            'body': json.dumps({
+                'goals': goals,
+                'nextCursor': encode_goal_cursor(last[9], last[0]) if last else None
+            }, ensure_ascii=False, separators=(',', ':'))
+        })
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
-def create_goal(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
-    body = json.loads(event.get('body', '{}'))
+HISTORY_MAX_DAYS = 366
+HISTORY_PAGE_SIZE = 200
+
+def get_goal_history(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """Change events in [from, to], newest first; the required range keeps the scan to the matching month partitions"""
+    query_params = event.get('queryStringParameters', {})
     
-    title = body.get('title', '').strip()
-    description = body.get('description', '').strip()
-    category = body.get('category', '')
-    priority = body.get('priority', 'medium')
-    status = body.get('status', 'pending')
-    start_date = body.get('startDate')
-    end_date = body.get('endDate')
-    progress = body.get('progress', 0)
+    try:
+        date_to = date.fromisoformat(query_params['to']) if query_params.get('to') else date.today()
+        date_from = date.fromisoformat(query_params['from']) if query_params.get('from') else date_to - timedelta(days=30)
+        limit = max(1, min(int(query_params.get('limit', HISTORY_PAGE_SIZE)), 1000))
+        before = decode_goal_cursor(query_params['cursor']) if query_params.get('cursor') else None
+        goal_id = int(query_params['goalId']) if query_params.get('goalId') else None
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid from, to, limit, goalId or cursor'})
+        }
     
-    if not title:
+    if date_from > date_to or (date_to - date_from).days > HISTORY_MAX_DAYS:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Title is required'})
+            'body': json.dumps({'error': f'Range must be at most {HISTORY_MAX_DAYS} days'})
         }
     
-    conn = get_db_connection()
+    # One goal the user can see (owned or shared), or everything on the user's own goals
+    if goal_id is not None:
+        scope = """e.goal_id = %(goal_id)s AND EXISTS (
+                       SELECT 1 FROM t_p59845625_taskbuddy_project.goals g 
+                       WHERE g.id = %(goal_id)s AND (g.user_id = %(user_id)s OR EXISTS (
+                           SELECT 1 FROM t_p59845625_taskbuddy_project.goal_members m 
+                           WHERE m.goal_id = g.id AND m.user_id = %(user_id)s)))"""
+    else:
+        scope = "e.user_id = %(user_id)s"
+    keyset = ' AND (e.created_at, e.id) < (%(before_created)s, %(before_id)s)' if before else ''
+    
+    conn = get_read_connection(event.get('headers', {}))
     cur = conn.cursor()
     
     try:
         cur.execute(
-            """INSERT INTO t_p59845625_taskbuddy_project.goals (user_id, title, description, category, priority, 
-               status, start_date, end_date, progress) 
-               VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) 
-               RETURNING id, title, description, category, priority, status, 
-               start_date, end_date, progress, created_at, updated_at""",
-            (user_id, title, description, category, priority, status, 
-             start_date, end_date, progress)
+            f"""SELECT e.id, e.goal_id, e.actor_id, e.kind, e.diff, e.created_at 
+                FROM t_p59845625_taskbuddy_project.goal_events e 
+                WHERE {scope} 
+                  AND e.created_at >= %(date_from)s AND e.created_at < %(date_to)s::date + 1{keyset} 
+                ORDER BY e.created_at DESC, e.id DESC 
+                LIMIT %(limit)s""",
+            {
+                'user_id': user_id, 'goal_id': goal_id, 'date_from': date_from, 'date_to': date_to,
+                'limit': limit + 1, 'before_created': before and before[0], 'before_id': before and before[1]
+            }
         )
-        row = cur.fetchone()
-        conn.commit()
+        rows = cur.fetchall()
         
-        create_notification(
-            user_id,
-            'Новая задача добавлена',
-            f'Задача "{title}" успешно создана',
-            'task_created'
-        )
+        events = [{
+            'id': row[0],
+            'goalId': row[1],
+            'actorId': row[2],
+            'kind': row[3],
+            'changes': row[4],
+            'createdAt': row[5].isoformat()
+        } for row in rows[:limit]]
         
-        send_telegram_notification(
-            user_id,
-            f'✅ <b>Новая задача добавлена</b>\n\n📋 {title}\n⏰ Дедлайн: {end_date if end_date else "не указан"}'
+        last = rows[limit - 1] if len(rows) > limit else None
+        
+        return compress_response(event, {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'events': events,
+                'nextCursor': encode_goal_cursor(last[5], last[0]) if last else None
+            }, ensure_ascii=False, separators=(',', ':'))
+        })
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def get_goal_members(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    goal_id = event.get('queryStringParameters', {}).get('goalId')
+    
+    conn = get_read_connection(event.get('headers', {}))
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """WITH goal AS (
+                   SELECT id, user_id FROM t_p59845625_taskbuddy_project.goals 
+                   WHERE id = %(goal_id)s AND (user_id = %(user_id)s OR EXISTS (
+                       SELECT 1 FROM t_p59845625_taskbuddy_project.goal_members 
+                       WHERE goal_id = %(goal_id)s AND user_id = %(user_id)s))
+               )
+               SELECT u.id, u.username, 'owner', NULL::timestamp 
+               FROM goal JOIN t_p59845625_taskbuddy_project.users u ON u.id = goal.user_id 
+               UNION ALL 
+               SELECT u.id, u.username, m.role, m.added_at 
+               FROM goal 
+               JOIN t_p59845625_taskbuddy_project.goal_members m ON m.goal_id = goal.id 
+               JOIN t_p59845625_taskbuddy_project.users u ON u.id = m.user_id""",
+            {'user_id': user_id, 'goal_id': goal_id}
         )
+        rows = cur.fetchall()
         
-        goal = {
-            'id': row[0],
-            'title': row[1],
-            'description': row[2],
-            'category': row[3],
-            'priority': row[4],
-            'status': row[5],
-            'startDate': row[6].isoformat() if row[6] else None,
-            'endDate': row[7].isoformat() if row[7] else None,
-            'progress': row[8],
-            'createdAt': row[9].isoformat() if row[9] else None,
-            'updatedAt': row[10].isoformat() if row[10] else None
-        }
+        if not rows:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Goal not found'})
+            }
+        
+        members = [{
+            'userId': row[0],
+            'username': row[1],
+            'role': row[2],
+            'addedAt': row[3].isoformat() if row[3] else None
+        } for row in rows]
         
         return {
-            'statusCode': 201,
+            'statusCode': 200,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'goal': goal})
+            'body': json.dumps({'members': members})
         }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def email_shard(email: str) -> Optional[int]:
+    """Shard of the account registered with email, None if there is none; one shard needs no lookup"""
+    if len(get_shard_dsns()) == 1:
+        return None
+    
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT shard FROM t_p59845625_taskbuddy_project.user_shards WHERE email = %s", (email,))
+        row = cur.fetchone()
+        return row[0] if row else None
     finally:
         cur.close()
         conn.close()
 
-def update_goal(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+def add_goal_member(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     body = json.loads(event.get('body', '{}'))
-    goal_id = body.get('id')
+    goal_id = body.get('goalId')
+    email = (body.get('email') or '').strip().lower()
+    role = body.get('role', 'editor')
     
-    if not goal_id:
+    if not goal_id or not email or role not in MEMBER_ROLES:
         return {
             'statusCode': 400,
             'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Goal ID is required'})
+            'body': json.dumps({'error': 'Goal ID, email and a role of editor or viewer are required'})
         }
     
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        update_fields = []
-        params = []
-        
-        if 'title' in body:
-            update_fields.append('title = %s')
-            params.append(body['title'])
-        if 'description' in body:
-            update_fields.append('description = %s')
-            params.append(body['description'])
-        if 'category' in body:
-            update_fields.append('category = %s')
-            params.append(body['category'])
-        if 'priority' in body:
-            update_fields.append('priority = %s')
-            params.append(body['priority'])
-        if 'status' in body:
-            update_fields.append('status = %s')
-            params.append(body['status'])
-        if 'startDate' in body:
-            update_fields.append('start_date = %s')
-            params.append(body['startDate'])
-        if 'endDate' in body:
-            update_fields.append('end_date = %s')
-            params.append(body['endDate'])
-        if 'progress' in body:
-            update_fields.append('progress = %s')
-            params.append(body['progress'])
-        
-        update_fields.append('updated_at = CURRENT_TIMESTAMP')
-        
-        params.extend([user_id, goal_id])
-        
-        query = f"""UPDATE t_p59845625_taskbuddy_project.goals SET {', '.join(update_fields)} 
-                   WHERE user_id = %s AND id = %s 
-                   RETURNING id, title, description, category, priority, status, 
-                   start_date, end_date, progress, created_at, updated_at"""
-        
-        cur.execute(query, params)
-        row = cur.fetchone()
+        cur.execute(
+            f"""WITH added AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_members (goal_id, user_id, role, goal_created_at) 
+                   SELECT g.id, u.id, %(role)s, g.created_at 
+                   FROM t_p59845625_taskbuddy_project.goals g 
+                   JOIN t_p59845625_taskbuddy_project.users u ON lower(u.email) = %(email)s 
+                   WHERE g.id = %(goal_id)s AND g.user_id = %(user_id)s AND u.id <> %(user_id)s 
+                   ON CONFLICT (goal_id, user_id) DO UPDATE SET role = EXCLUDED.role 
+                   RETURNING goal_id, user_id, role, (xmax = 0) AS inserted
+               ), notification AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+                   SELECT added.user_id, 'С вами поделились задачей', 'Вам открыт доступ к задаче "' || g.title || '"', 
+                          'goal_shared', FALSE 
+                   FROM added JOIN t_p59845625_taskbuddy_project.goals g ON g.id = added.goal_id 
+                   WHERE added.inserted
+               )
+               SELECT user_id, role, {WRITE_LSN} FROM added""",
+            {'user_id': user_id, 'goal_id': goal_id, 'email': email, 'role': role}
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
         conn.commit()
+        write_headers = get_write_headers(lsn)
         
-        if row and 'status' in body and body['status'] == 'completed':
-            task_title = row[1]
-            create_notification(
-                user_id,
-                'Задача выполнена!',
-                f'Вы завершили задачу "{task_title}"',
-                'task_completed'
-            )
-            send_telegram_notification(
-                user_id,
-                f'✅ <b>Задача выполнена!</b>\n\n🎉 Поздравляем! Вы завершили: <b>{task_title}</b>'
-            )
+        if not row and email_shard(email) not in (None, current_shard()):
+            return {
+                'statusCode': 409,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Sharing with a user on another shard is not supported'})
+            }
         
         if not row:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Goal not found'})
+                'body': json.dumps({'error': 'Goal or user not found'})
             }
         
-        goal = {
-            'id': row[0],
-            'title': row[1],
-            'description': row[2],
-            'category': row[3],
-            'priority': row[4],
-            'status': row[5],
-            'startDate': row[6].isoformat() if row[6] else None,
-            'endDate': row[7].isoformat() if row[7] else None,
-            'progress': row[8],
-            'createdAt': row[9].isoformat() if row[9] else None,
-            'updatedAt': row[10].isoformat() if row[10] else None
-        }
-        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'goal': goal})
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'member': {'userId': row[0], 'role': row[1]}})
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
-def delete_goal(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+def remove_goal_member(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """The owner can remove anyone, a member can leave"""
     query_params = event.get('queryStringParameters', {})
-    goal_id = query_params.get('id')
-    
-    if not goal_id:
-        return {
-            'statusCode': 400,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps({'error': 'Goal ID is required'})
-        }
     
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
         cur.execute(
-            "SELECT id FROM t_p59845625_taskbuddy_project.goals WHERE user_id = %s AND id = %s",
-            (user_id, goal_id)
+            f"""DELETE FROM t_p59845625_taskbuddy_project.goal_members m 
+               USING t_p59845625_taskbuddy_project.goals g 
+               WHERE m.goal_id = %(goal_id)s AND m.user_id = %(member_id)s AND g.id = m.goal_id 
+                 AND (g.user_id = %(user_id)s OR m.user_id = %(user_id)s) 
+               RETURNING m.user_id, {WRITE_LSN}""",
+            {'user_id': user_id, 'goal_id': query_params.get('goalId'), 'member_id': query_params.get('userId')}
         )
-        if not cur.fetchone():
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
             return {
                 'statusCode': 404,
                 'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'Goal not found'})
+                'body': json.dumps({'error': 'Member not found'})
             }
         
-        cur.execute(
-            "UPDATE t_p59845625_taskbuddy_project.goals SET status = 'deleted', updated_at = CURRENT_TIMESTAMP WHERE user_id = %s AND id = %s",
-            (user_id, goal_id)
-        )
-        conn.commit()
-        
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
             'body': json.dumps({'success': True})
         }
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release_connection(conn)
+
+EXPORT_FORMATS = ('jsonl', 'csv')
+EXPORT_FETCH_ROWS = 2000
+# Output is buffered in memory up to this size, then spilled to a temp file
+EXPORT_SPOOL_BYTES = 4 * 1024 * 1024
+# The function runtime returns the body base64-encoded in one piece, so an export is delivered in pages of about
+# this size, each naming the next in X-Export-Cursor; the encoded page fits the platform's response limit and
+# peak memory stays about 2.3x this size however long the history is
+EXPORT_MAX_BYTES = int(os.environ.get('EXPORT_MAX_BYTES', str(2500 * 1024)))
+EXPORT_CHECK_ROWS = 500
+
+EXPORT_COLUMNS = ('kind', 'id', 'title', 'description', 'category', 'priority', 'status',
+                  'startDate', 'endDate', 'progress', 'type', 'isRead', 'createdAt', 'updatedAt')
+
+EXPORT_SOURCES = (
+    ('goal', f"""SELECT {GOAL_COLUMNS} FROM t_p59845625_taskbuddy_project.goals 
+                 WHERE user_id = %s AND id > %s ORDER BY id""", goal_from_row),
+    ('notification', """SELECT id, title, message, type, is_read, created_at 
+                        FROM t_p59845625_taskbuddy_project.notifications 
+                        WHERE user_id = %s AND id > %s ORDER BY id""",
+     lambda row: {
+         'id': row[0],
+         'title': row[1],
+         'description': row[2],
+         'type': row[3],
+         'isRead': row[4],
+         'createdAt': row[5].isoformat() if row[5] else None
+     })
+)
+
+def encode_export_cursor(source: int, last_id: int) -> str:
+    return base64.urlsafe_b64encode(f'{source}|{last_id}'.encode()).decode('ascii')
+
+def decode_export_cursor(cursor: str) -> Tuple[int, int]:
+    source, last_id = base64.urlsafe_b64decode(cursor.encode('ascii')).decode().split('|')
+    if not 0 <= int(source) < len(EXPORT_SOURCES):
+        raise ValueError(source)
+    return int(source), int(last_id)
+
+def iter_export_records(conn, user_id: int, after: Tuple[int, int] = (0, 0)):
+    """Yield (source, record) for goals then notifications after the cursor position, through named
+    server-side cursors EXPORT_FETCH_ROWS at a time; keyset on id, so a page never rescans earlier rows"""
+    for source, (kind, sql, from_row) in enumerate(EXPORT_SOURCES):
+        if source < after[0]:
+            continue
+        cur = conn.cursor(name=f'export_{kind}')
+        cur.itersize = EXPORT_FETCH_ROWS
+        try:
+            cur.execute(sql, (user_id, after[1] if source == after[0] else 0))
+            for row in cur:
+                record = from_row(row)
+                record['kind'] = kind
+                yield source, record
+        finally:
+            cur.close()
+
+def export_data(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """One page of the export; clients repeat the request with cursor=X-Export-Cursor until the header is absent
+    and concatenate the bodies (csv repeats no header, gzip pages are gzip members of one stream)"""
+    query_params = event.get('queryStringParameters', {})
+    export_format = query_params.get('format', 'jsonl')
+    compress = query_params.get('gzip', '') in ('1', 'true')
+    
+    if export_format not in EXPORT_FORMATS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f"Format must be one of: {', '.join(EXPORT_FORMATS)}"})
+        }
+    
+    try:
+        after = decode_export_cursor(query_params['cursor']) if query_params.get('cursor') else None
+    except (TypeError, ValueError, UnicodeDecodeError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid cursor'})
+        }
+    
+    conn = get_read_connection(event.get('headers', {}))
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES)
+    next_cursor = None
+    
+    try:
+        raw = gzip.GzipFile(fileobj=spool, mode='wb') if compress else spool
+        out = io.TextIOWrapper(raw, encoding='utf-8', newline='')
+        
+        if export_format == 'csv':
+            writer = csv.DictWriter(out, fieldnames=EXPORT_COLUMNS, extrasaction='ignore')
+            if after is None:
+                writer.writeheader()
+            write_record = writer.writerow
+        else:
+            def write_record(record):
+                out.write(json.dumps(record, ensure_ascii=False))
+                out.write('\n')
+        
+        # The size is checked every EXPORT_CHECK_ROWS rows, so a page overshoots the cap by at most that many rows;
+        # a full page only hands out a cursor when another record follows
+        records = iter_export_records(conn, user_id, after or (0, 0))
+        for count, (source, record) in enumerate(records, start=1):
+            write_record(record)
+            if count % EXPORT_CHECK_ROWS == 0:
+                out.flush()
+                if spool.tell() > EXPORT_MAX_BYTES:
+                    if next(records, None) is not None:
+                        next_cursor = encode_export_cursor(source, record['id'])
+                    break
+        records.close()
+        
+        out.flush()
+        out.detach()
+        if compress:
+            raw.close()
+        
+        spool.seek(0)
+        body = base64.b64encode(spool.read()).decode('ascii')
+    finally:
+        spool.close()
+        release_connection(conn)
+    
+    if compress:
+        content_type = 'application/gzip'
+    elif export_format == 'csv':
+        content_type = 'text/csv; charset=utf-8'
+    else:
+        content_type = 'application/x-ndjson; charset=utf-8'
+    
+    response_headers = {
+        'Content-Type': content_type,
+        'Content-Disposition': f'attachment; filename="taskbuddy-export.{export_format}{".gz" if compress else ""}"',
+        'Access-Control-Allow-Origin': '*',
+        'Access-Control-Expose-Headers': 'Content-Disposition, X-Export-Cursor'
+    }
+    if next_cursor:
+        response_headers['X-Export-Cursor'] = next_cursor
+    
+    return {
+        'statusCode': 200,
+        'headers': response_headers,
+        'isBase64Encoded': True,
+        'body': body
+    }
+
+def create_goal(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    body = json.loads(event.get('body', '{}'))
+    
+    title = body.get('title', '').strip()
+    description = body.get('description', '').strip()
+    category = body.get('category', '')
+    priority = body.get('priority', 'medium')
+    status = body.get('status', 'pending')
+    start_date = body.get('startDate')
+    end_date = body.get('endDate')
+    progress = body.get('progress', 0)
+    recurrence = body.get('recurrence')
+    recurrence_interval = body.get('recurrenceInterval', 1)
+    recurrence_until = body.get('recurrenceUntil')
+    
+    if not title:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Title is required'})
+        }
+    
+    recurrence_error = validate_recurrence(body)
+    if recurrence_error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': recurrence_error})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH created AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goals (user_id, title, description, category, priority, 
+                   status, start_date, end_date, progress, recurrence, recurrence_interval, recurrence_until, completed_at) 
+                   VALUES (%(user_id)s, %(title)s, %(description)s, %(category)s, %(priority)s, %(status)s, 
+                   %(start_date)s, %(end_date)s, %(progress)s, %(recurrence)s, %(recurrence_interval)s, %(recurrence_until)s, 
+                   CASE WHEN %(status)s = 'completed' THEN CURRENT_TIMESTAMP END) 
+                   RETURNING {GOAL_COLUMNS}
+               ), history AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, actor_id, kind, diff) 
+                   SELECT id, %(user_id)s, %(user_id)s, 'created', 
+                          jsonb_strip_nulls(to_jsonb(created)) - ARRAY['id', 'created_at', 'updated_at'] 
+                   FROM created
+               ), cache AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache WHERE user_id = %(user_id)s
+               ), activity AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, created) 
+                   VALUES (%(user_id)s, CURRENT_DATE, 1) 
+                   ON CONFLICT (user_id, day) DO UPDATE SET created = goal_activity_daily.created + 1
+               ), notification AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+                   VALUES (%(user_id)s, 'Новая задача добавлена', %(message)s, 'task_created', FALSE)
+               )
+               {TELEGRAM_TARGET_SELECT.format(source='created')}""",
+            {
+                'user_id': user_id, 'title': title, 'description': description, 'category': category,
+                'priority': priority, 'status': status, 'start_date': start_date, 'end_date': end_date,
+                'progress': progress, 'recurrence': recurrence, 'recurrence_interval': recurrence_interval,
+                'recurrence_until': recurrence_until, 'message': f'Задача "{title}" успешно создана'
+            }
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        send_telegram_notification(
+            row[-2], row[-1],
+            f'✅ <b>Новая задача добавлена</b>\n\n📋 {title}\n⏰ Дедлайн: {end_date if end_date else "не указан"}'
+        )
+        
+        goal = goal_from_row(row)
+        
+        return {
+            'statusCode': 201,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'goal': goal})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+IMPORT_FORMATS = ('csv', 'json', 'jsonl')
+# Statuses a user may set; 'overdue' is only assigned by the overdue sweep
+IMPORT_STATUSES = ('pending', 'in_progress', 'completed')
+MAX_IMPORT_ROWS = 100000
+MAX_IMPORT_ERRORS = 50
+
+# Staging columns in COPY order; line is the source row number, kept for ordering
+IMPORT_COLUMNS = ('line', 'title', 'description', 'category', 'priority', 'status', 'start_date', 'end_date',
+                  'progress', 'recurrence', 'recurrence_interval', 'recurrence_until')
+
+def copy_line(values) -> str:
+    """One row in COPY text format"""
+    return '\t'.join(
+        '\\N' if v is None else str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+        for v in values
+    ) + '\n'
+
+def iter_import_records(body: str, import_format: str):
+    """Yield raw records from the request body without materialising a parsed copy of the whole file"""
+    if import_format == 'csv':
+        yield from csv.DictReader(io.StringIO(body))
+    elif import_format == 'jsonl':
+        for raw_line in io.StringIO(body):
+            if raw_line.strip():
+                yield json.loads(raw_line)
+    else:
+        yield from iter_json_records(body)
+
+_json_decoder = json.JSONDecoder()
+
+def skip_json_space(body: str, pos: int) -> int:
+    while pos < len(body) and body[pos] in ' \t\n\r':
+        pos += 1
+    return pos
+
+def iter_json_array(body: str, pos: int):
+    """Decode the array opening at body[pos] one element at a time; the generator returns the position after it"""
+    pos = skip_json_space(body, pos + 1)
+    if body.startswith(']', pos):
+        return pos + 1
+    while True:
+        item, pos = _json_decoder.raw_decode(body, pos)
+        yield item
+        pos = skip_json_space(body, pos)
+        if body.startswith(']', pos):
+            return pos + 1
+        if not body.startswith(',', pos):
+            raise ValueError(f"Expecting ',' or ']' at char {pos}")
+        pos = skip_json_space(body, pos + 1)
+
+def iter_json_records(body: str):
+    """Stream a top-level array or the "goals" array of an object like jsonl, keeping one parsed element at a time"""
+    pos = skip_json_space(body, 0)
+    if body.startswith('[', pos):
+        pos = yield from iter_json_array(body, pos)
+    elif body.startswith('{', pos):
+        pos = skip_json_space(body, pos + 1)
+        while not body.startswith('}', pos):
+            key, pos = _json_decoder.raw_decode(body, pos)
+            pos = skip_json_space(body, pos)
+            if not isinstance(key, str) or not body.startswith(':', pos):
+                raise ValueError(f"Expecting a property name and ':' at char {pos}")
+            pos = skip_json_space(body, pos + 1)
+            if key == 'goals':
+                if not body.startswith('[', pos):
+                    raise ValueError('"goals" must be an array')
+                pos = yield from iter_json_array(body, pos)
+            else:
+                _, pos = _json_decoder.raw_decode(body, pos)
+            pos = skip_json_space(body, pos)
+            if body.startswith(',', pos):
+                pos = skip_json_space(body, pos + 1)
+            elif not body.startswith('}', pos):
+                raise ValueError(f"Expecting ',' or '}}' at char {pos}")
+        pos += 1
+    else:
+        raise ValueError('Expecting a JSON array or an object with a "goals" array')
+    if skip_json_space(body, pos) != len(body):
+        raise ValueError(f'Extra data at char {pos}')
+
+def parse_import_date(value: Any) -> Optional[str]:
+    if value in (None, ''):
+        return None
+    return date.fromisoformat(str(value)).isoformat()
+
+def normalize_import_record(record: Any) -> Tuple[Optional[tuple], Optional[str]]:
+    """Validate one imported record, accepting API (camelCase) or column (snake_case) keys"""
+    if not isinstance(record, dict):
+        return None, 'Row must be an object'
+    
+    def field(key: str, column: str, default=None):
+        value = record.get(key, record.get(column))
+        return default if value in (None, '') else value
+    
+    title = str(field('title', 'title', '')).strip()
+    if not title:
+        return None, 'Title is required'
+    if len(title) > 255:
+        return None, 'Title must be at most 255 characters'
+    
+    try:
+        progress = int(field('progress', 'progress', 0))
+        recurrence_interval = int(field('recurrenceInterval', 'recurrence_interval', 1))
+        start_date = parse_import_date(field('startDate', 'start_date'))
+        end_date = parse_import_date(field('endDate', 'end_date'))
+        recurrence_until = parse_import_date(field('recurrenceUntil', 'recurrence_until'))
+    except (TypeError, ValueError) as e:
+        return None, str(e)
+    
+    recurrence = field('recurrence', 'recurrence')
+    recurrence_error = validate_recurrence({'recurrence': recurrence, 'recurrenceInterval': recurrence_interval})
+    if recurrence_error:
+        return None, recurrence_error
+    
+    category = str(field('category', 'category', ''))
+    priority = str(field('priority', 'priority', 'medium'))
+    status = str(field('status', 'status', 'pending'))
+    if status not in IMPORT_STATUSES:
+        return None, f"Status must be one of: {', '.join(IMPORT_STATUSES)}"
+    if len(category) > 50 or len(priority) > 20:
+        return None, 'Category or priority is too long'
+    
+    return (
+        title, str(field('description', 'description', '')).strip(), category, priority, status,
+        start_date, end_date, max(0, min(progress, 100)), recurrence, recurrence_interval, recurrence_until
+    ), None
+
+def import_goals(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    import_format = query_params.get('format', 'csv')
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8-sig')
+    
+    if import_format not in IMPORT_FORMATS:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': f"Format must be one of: {', '.join(IMPORT_FORMATS)}"})
+        }
+    
+    errors = []
+    invalid = 0
+    line_no = 0
+    
+    # Validate the whole file before touching the database, so a malformed row or the row cap is a 400 with
+    # its row number; rows are staged as COPY text in a spool that only spills to disk for large imports
+    spool = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_BYTES, mode='w+', encoding='utf-8')
+    failure = None
+    try:
+        for line_no, record in enumerate(iter_import_records(body, import_format), start=1):
+            if line_no > MAX_IMPORT_ROWS:
+                failure = f'Import is limited to {MAX_IMPORT_ROWS} rows'
+                break
+            values, error = normalize_import_record(record)
+            if error:
+                invalid += 1
+                if len(errors) < MAX_IMPORT_ERRORS:
+                    errors.append({'row': line_no, 'error': error})
+                continue
+            spool.write(copy_line((line_no,) + values))
+    except (TypeError, ValueError, csv.Error) as e:
+        failure = f'Row {line_no + 1}: {e}'
+    
+    if failure:
+        spool.close()
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': failure})
+        }
+    spool.seek(0)
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """CREATE TEMP TABLE goal_import (
+                   line INTEGER, title VARCHAR(255), description TEXT, category VARCHAR(50), 
+                   priority VARCHAR(20), status VARCHAR(20), start_date DATE, end_date DATE, progress INTEGER, 
+                   recurrence VARCHAR(10), recurrence_interval INTEGER, recurrence_until DATE
+               ) ON COMMIT DROP"""
+        )
+        cur.copy_expert(
+            f"COPY goal_import ({', '.join(IMPORT_COLUMNS)}) FROM STDIN WITH (FORMAT text)",
+            spool,
+            size=1 << 20
+        )
+        
+        cur.execute(
+            f"""WITH imported AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goals (user_id, title, description, category, priority, 
+                   status, start_date, end_date, progress, recurrence, recurrence_interval, recurrence_until, completed_at) 
+                   SELECT %(user_id)s, i.title, i.description, i.category, i.priority, i.status, i.start_date, 
+                          i.end_date, i.progress, i.recurrence, i.recurrence_interval, i.recurrence_until, 
+                          CASE WHEN i.status = 'completed' THEN CURRENT_TIMESTAMP END 
+                   FROM (
+                       SELECT DISTINCT ON (title, start_date) * FROM goal_import ORDER BY title, start_date, line
+                   ) i 
+                   WHERE NOT EXISTS (
+                       SELECT 1 FROM t_p59845625_taskbuddy_project.goals g 
+                       WHERE g.user_id = %(user_id)s AND g.title = i.title 
+                         AND g.start_date IS NOT DISTINCT FROM i.start_date
+                   ) 
+                   ORDER BY i.line 
+                   RETURNING id
+               ), history AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, actor_id, kind) 
+                   SELECT id, %(user_id)s, %(user_id)s, 'imported' FROM imported
+               ), summary AS (
+                   SELECT (SELECT count(*) FROM imported) AS imported, 
+                          (SELECT count(*) FROM goal_import) AS staged
+               ), cache AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+                   WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM imported)
+               ), activity AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, created) 
+                   SELECT %(user_id)s, CURRENT_DATE, imported FROM summary WHERE imported > 0 
+                   ON CONFLICT (user_id, day) DO UPDATE SET created = goal_activity_daily.created + EXCLUDED.created
+               ), notification AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+                   SELECT %(user_id)s, 'Импорт задач завершён', 'Импортировано задач: ' || imported, 'task_created', FALSE 
+                   FROM summary WHERE imported > 0
+               )
+               {TELEGRAM_TARGET_SELECT.format(source='summary')}""",
+            {'user_id': user_id}
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        imported, staged = row[0], row[1]
+        if imported:
+            send_telegram_notification(
+                row[-2], row[-1],
+                f'📥 <b>Импорт задач завершён</b>\n\nИмпортировано задач: {imported}'
+            )
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({
+                'imported': imported,
+                'duplicates': staged - imported,
+                'invalid': invalid,
+                'errors': errors
+            })
+        }
+    finally:
+        spool.close()
+        cur.close()
+        release_connection(conn)
+
+def update_goal(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    body = json.loads(event.get('body', '{}'))
+    goal_id = body.get('id')
+    
+    if not goal_id:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Goal ID is required'})
+        }
+    
+    recurrence_error = validate_recurrence(body)
+    if recurrence_error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': recurrence_error})
+        }
+    
+    if set(body) == {'id', 'progress'}:
+        return update_goal_progress(user_id, goal_id, body['progress'])
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        update_fields = []
+        params = {
+            'user_id': user_id,
+            'goal_id': goal_id,
+            'notify': body.get('status') == 'completed'
+        }
+        
+        for key, column in GOAL_UPDATE_FIELDS:
+            if key in body:
+                update_fields.append(f'{column} = %({column})s')
+                params[column] = body[key]
+        
+        # completed_at is only set while a goal is completed, so re-sending 'completed' keeps the first timestamp
+        if 'status' in body:
+            update_fields.append("completed_at = CASE WHEN %(status)s = 'completed' THEN COALESCE(g.completed_at, CURRENT_TIMESTAMP) END")
+        
+        # Moving or clearing the deadline of a swept overdue goal reopens it with the status the sweep's
+        # 'overdue' event recorded (written after the old deadline, so the lookup stays in recent partitions)
+        swept_from = ''
+        if 'endDate' in body and 'status' not in body:
+            update_fields.append(
+                """status = CASE WHEN status = 'overdue' AND (%(end_date)s::date IS NULL OR %(end_date)s::date >= CURRENT_DATE) 
+                             THEN CASE WHEN old.swept_from = 'in_progress' THEN 'in_progress' ELSE 'pending' END 
+                             ELSE status END"""
+            )
+            swept_from = """, (SELECT e.diff -> 'status' ->> 0 FROM t_p59845625_taskbuddy_project.goal_events e 
+                                 WHERE e.goal_id = prev.id AND e.kind = 'overdue' AND e.created_at >= prev.end_date 
+                                 ORDER BY e.created_at DESC LIMIT 1) AS swept_from"""
+        
+        update_fields.append('updated_at = CURRENT_TIMESTAMP')
+        
+        query = f"""WITH updated AS (
+                       UPDATE t_p59845625_taskbuddy_project.goals g SET {', '.join(update_fields)} 
+                       FROM (SELECT id AS old_id, status AS old_status, completed_at AS old_completed_at, 
+                                    to_jsonb(prev) AS old_row{swept_from} 
+                             FROM t_p59845625_taskbuddy_project.goals prev 
+                             WHERE id = %(goal_id)s AND {GOAL_EDITABLE} FOR UPDATE) old 
+                       WHERE id = old.old_id 
+                       RETURNING {GOAL_COLUMNS}, old.old_status, old.old_completed_at, user_id AS owner_id, 
+                                 {GOAL_DIFF} AS diff
+                   ), history AS (
+                       INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, actor_id, kind, diff) 
+                       SELECT id, owner_id, %(user_id)s, 
+                              CASE WHEN old_status = 'overdue' AND status IN ('pending', 'in_progress') 
+                                   THEN 'reopened' ELSE 'updated' END, diff 
+                       FROM updated WHERE diff IS NOT NULL
+                   ), cache AS (
+                       DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+                       WHERE user_id IN (SELECT owner_id FROM updated)
+                   ), activity AS (
+                       INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, completed) 
+                       SELECT owner_id, CURRENT_DATE, 1 FROM updated 
+                       WHERE status = 'completed' AND old_status IS DISTINCT FROM 'completed' 
+                       ON CONFLICT (user_id, day) DO UPDATE SET completed = goal_activity_daily.completed + 1
+                   ), uncounted AS (
+                       UPDATE t_p59845625_taskbuddy_project.goal_activity_daily a 
+                       SET completed = GREATEST(a.completed - 1, 0) 
+                       FROM updated 
+                       WHERE a.user_id = updated.owner_id AND a.day = updated.old_completed_at::date 
+                         AND updated.old_status = 'completed' AND updated.status != 'completed'
+                   ), {SHARED_GOAL_FANOUT}, notification AS (
+                       INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+                       SELECT %(user_id)s, 'Задача выполнена!', 'Вы завершили задачу "' || title || '"', 'task_completed', FALSE 
+                       FROM updated WHERE %(notify)s
+                   )
+                   {TELEGRAM_TARGET_SELECT.format(source='updated')}"""
+        
+        cur.execute(query, params)
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Goal not found'})
+            }
+        
+        if params['notify']:
+            send_telegram_notification(
+                row[-2], row[-1],
+                f'✅ <b>Задача выполнена!</b>\n\n🎉 Поздравляем! Вы завершили: <b>{row[1]}</b>'
+            )
+        
+        goal = goal_from_row(row)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'goal': goal})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def update_goal_progress(user_id: int, goal_id: Any, progress: Any) -> Dict[str, Any]:
+    """Progress-only fast path for slider updates: no notification, rollup or cache work, and no write when unchanged"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH updated AS (
+                   UPDATE t_p59845625_taskbuddy_project.goals 
+                   SET progress = %(progress)s, updated_at = CURRENT_TIMESTAMP 
+                   FROM (SELECT id AS old_id, progress AS old_progress FROM t_p59845625_taskbuddy_project.goals 
+                         WHERE id = %(goal_id)s AND {GOAL_EDITABLE} FOR UPDATE) old 
+                   WHERE id = old.old_id AND progress IS DISTINCT FROM %(progress)s 
+                   RETURNING {GOAL_COLUMNS}, user_id AS owner_id, old.old_progress
+               ), history AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, actor_id, kind, diff) 
+                   SELECT id, owner_id, %(user_id)s, 'updated', 
+                          jsonb_build_object('progress', jsonb_build_array(old_progress, progress)) 
+                   FROM updated
+               )
+               SELECT {GOAL_COLUMNS}, {WRITE_LSN} FROM updated 
+               UNION ALL 
+               SELECT {GOAL_COLUMNS}, {WRITE_LSN} FROM t_p59845625_taskbuddy_project.goals 
+               WHERE id = %(goal_id)s AND {GOAL_EDITABLE} AND NOT EXISTS (SELECT 1 FROM updated)""",
+            {'user_id': user_id, 'goal_id': goal_id, 'progress': progress}
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Goal not found'})
+            }
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'goal': goal_from_row(row)})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def delete_goal(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    goal_id = query_params.get('id')
+    
+    if not goal_id:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Goal ID is required'})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH deleted AS (
+                   UPDATE t_p59845625_taskbuddy_project.goals SET status = 'deleted', updated_at = CURRENT_TIMESTAMP 
+                   FROM (SELECT id AS old_id, status AS old_status FROM t_p59845625_taskbuddy_project.goals 
+                         WHERE user_id = %(user_id)s AND id = %(goal_id)s FOR UPDATE) old 
+                   WHERE id = old.old_id 
+                   RETURNING id, old.old_status
+               ), history AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, actor_id, kind, diff) 
+                   SELECT id, %(user_id)s, %(user_id)s, 'deleted', jsonb_build_object('status', jsonb_build_array(old_status, 'deleted')) 
+                   FROM deleted WHERE old_status IS DISTINCT FROM 'deleted'
+               ), cache AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+                   WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM deleted)
+               ), activity AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, deleted) 
+                   SELECT %(user_id)s, CURRENT_DATE, 1 FROM deleted WHERE old_status IS DISTINCT FROM 'deleted' 
+                   ON CONFLICT (user_id, day) DO UPDATE SET deleted = goal_activity_daily.deleted + 1
+               )
+               SELECT id, {WRITE_LSN} FROM deleted""",
+            {'user_id': user_id, 'goal_id': goal_id}
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Goal not found'})
+            }
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'success': True})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def get_analytics(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    
+    try:
+        weeks = int(query_params.get('weeks', 4))
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Weeks must be a number'})
+        }
+    
+    weeks = max(1, min(weeks, 52))
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        execute_query(cur, 'analytics_cache', (user_id, weeks))
+        cached = cur.fetchone()
+        
+        if cached:
+            analytics = cached[0]
+        else:
+            analytics = compute_analytics(cur, user_id, weeks)
+            cur.execute(
+                """INSERT INTO t_p59845625_taskbuddy_project.user_analytics_cache (user_id, weeks, data) 
+                   VALUES (%s, %s, %s) 
+                   ON CONFLICT (user_id, weeks) 
+                   DO UPDATE SET data = EXCLUDED.data, computed_at = CURRENT_TIMESTAMP""",
+                (user_id, weeks, json.dumps(analytics))
+            )
+            conn.commit()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'analytics': analytics})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+# Completed recurring occurrences join as rows with only a done_day: COUNT(status) counts goals, COUNT(done_day)
+# counts completions in the window, so they add to completionsPerDay without changing the goal totals
+ANALYTICS_QUERY = """SELECT GROUPING(category, priority, done_day), category, priority, done_day,
+           COUNT(status),
+           COUNT(*) FILTER (WHERE status = 'completed'),
+           COUNT(*) FILTER (WHERE status != 'completed' AND end_date < CURRENT_DATE),
+           COUNT(done_day)
+    FROM (
+        SELECT category, priority, status, end_date,
+               CASE WHEN status = 'completed' AND completed_at >= CURRENT_DATE - %s 
+                    THEN completed_at::date END AS done_day
+        FROM t_p59845625_taskbuddy_project.goals 
+        WHERE user_id = %s AND status != 'deleted'
+        UNION ALL
+        SELECT NULL, NULL, NULL, NULL, o.completed_at::date 
+        FROM t_p59845625_taskbuddy_project.goal_occurrences o 
+        JOIN t_p59845625_taskbuddy_project.goals og ON og.id = o.goal_id 
+        WHERE og.user_id = %s AND og.status != 'deleted' AND o.completed_at >= CURRENT_DATE - %s
+    ) g
+    GROUP BY GROUPING SETS ((), (category), (priority), (done_day))"""
+
+def compute_analytics(cur, user_id: int, weeks: int) -> Dict[str, Any]:
+    """Build dashboard stats from a single grouped pass over the user's goals and completed occurrences"""
+    days = weeks * 7
+    
+    cur.execute(ANALYTICS_QUERY, (days - 1, user_id, user_id, days - 1))
+    rows = cur.fetchall()
+    
+    total_goals = 0
+    completed_goals = 0
+    overdue_goals = 0
+    by_category = {}
+    by_priority = {}
+    completions = {}
+    
+    for grouping, category, priority, done_day, total, completed, overdue, done in rows:
+        if grouping == 7:
+            total_goals = total
+            completed_goals = completed
+            overdue_goals = overdue
+        elif grouping == 3 and total:
+            bucket = by_category.setdefault(category or 'uncategorized', {'total': 0, 'completed': 0})
+            bucket['total'] += total
+            bucket['completed'] += completed
+        elif grouping == 5 and total:
+            bucket = by_priority.setdefault(priority or 'none', {'total': 0, 'completed': 0})
+            bucket['total'] += total
+            bucket['completed'] += completed
+        elif grouping == 6 and done_day:
+            completions[done_day.isoformat()] = done
+    
+    today = datetime.now().date()
+    completions_per_day = []
+    for offset in range(days - 1, -1, -1):
+        day = (today - timedelta(days=offset)).isoformat()
+        completions_per_day.append({'date': day, 'count': completions.get(day, 0)})
+    
+    return {
+        'weeks': weeks,
+        'totalGoals': total_goals,
+        'completedGoals': completed_goals,
+        'completionRate': round(completed_goals * 100 / total_goals, 1) if total_goals else 0,
+        'overdueGoals': overdue_goals,
+        'byCategory': by_category,
+        'byPriority': by_priority,
+        'completionsPerDay': completions_per_day
+    }
+
+def get_activity(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    today = datetime.now().date()
+    
+    try:
+        date_to = datetime.strptime(query_params['to'], '%Y-%m-%d').date() if query_params.get('to') else today
+        date_from = datetime.strptime(query_params['from'], '%Y-%m-%d').date() if query_params.get('from') else date_to - timedelta(days=89)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Dates must be in YYYY-MM-DD format'})
+        }
+    
+    if date_from > date_to or (date_to - date_from).days > 731:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid date range'})
+        }
+    
+    conn = get_read_connection(event.get('headers', {}))
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """SELECT day, created, completed, deleted 
+               FROM t_p59845625_taskbuddy_project.goal_activity_daily 
+               WHERE user_id = %s AND day BETWEEN %s AND %s""",
+            (user_id, date_from, date_to)
+        )
+        counts = {row[0]: row[1:] for row in cur.fetchall()}
+        
+        activity = []
+        for offset in range((date_to - date_from).days + 1):
+            day = date_from + timedelta(days=offset)
+            created, completed, deleted = counts.get(day, (0, 0, 0))
+            activity.append({
+                'date': day.isoformat(),
+                'created': created,
+                'completed': completed,
+                'deleted': deleted
+            })
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'activity': activity})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def reconcile_activity(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """Rebuild the user's rollup for the last N days from goals and completed occurrences.
+    
+    Counters are set to exactly what the rows show: created_at, completed_at (kept when a
+    completed goal is deleted, cleared when it is reopened) and the deletion's updated_at.
+    Days in the window without any such row are removed.
+    """
+    query_params = event.get('queryStringParameters', {})
+    
+    try:
+        days = max(1, min(int(query_params.get('days', 30)), 3660))
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Days must be a number'})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH counts AS (
+                   SELECT day, SUM(created) AS created, SUM(completed) AS completed, SUM(deleted) AS deleted 
+                   FROM (
+                       SELECT created_at::date AS day, 1 AS created, 0 AS completed, 0 AS deleted 
+                       FROM t_p59845625_taskbuddy_project.goals WHERE user_id = %(user_id)s 
+                       UNION ALL 
+                       SELECT completed_at::date, 0, 1, 0 
+                       FROM t_p59845625_taskbuddy_project.goals 
+                       WHERE user_id = %(user_id)s AND completed_at IS NOT NULL 
+                       UNION ALL 
+                       SELECT o.completed_at::date, 0, 1, 0 
+                       FROM t_p59845625_taskbuddy_project.goal_occurrences o 
+                       JOIN t_p59845625_taskbuddy_project.goals g ON g.id = o.goal_id 
+                       WHERE g.user_id = %(user_id)s 
+                       UNION ALL 
+                       SELECT updated_at::date, 0, 0, 1 
+                       FROM t_p59845625_taskbuddy_project.goals WHERE user_id = %(user_id)s AND status = 'deleted' 
+                   ) a 
+                   WHERE day > CURRENT_DATE - %(days)s 
+                   GROUP BY day
+               ), reconciled AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, created, completed, deleted) 
+                   SELECT %(user_id)s, day, created, completed, deleted FROM counts 
+                   ON CONFLICT (user_id, day) DO UPDATE SET 
+                       created = EXCLUDED.created,
+                       completed = EXCLUDED.completed,
+                       deleted = EXCLUDED.deleted 
+                   RETURNING day
+               ), cleared AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.goal_activity_daily a 
+                   WHERE a.user_id = %(user_id)s AND a.day > CURRENT_DATE - %(days)s 
+                     AND a.day NOT IN (SELECT day FROM counts) 
+                   RETURNING day
+               )
+               SELECT (SELECT COUNT(*) FROM reconciled) + (SELECT COUNT(*) FROM cleared), {WRITE_LSN}""",
+            {'user_id': user_id, 'days': days}
+        )
+        (reconciled,), lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'success': True, 'daysReconciled': reconciled})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def add_months(day: date, months: int) -> date:
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    last_day = (next_month - timedelta(days=1)).day
+    return date(year, month, min(day.day, last_day))
+
+def expand_occurrences(anchor: date, rule: str, interval: int, until: Optional[date],
+                       date_from: date, date_to: date) -> List[date]:
+    """Generate occurrence dates of a recurrence rule that fall inside [date_from, date_to]"""
+    last = min(date_to, until) if until else date_to
+    if last < anchor or last < date_from:
+        return []
+    
+    dates = []
+    if rule == 'monthly':
+        months_apart = (date_from.year - anchor.year) * 12 + date_from.month - anchor.month
+        index = max(0, months_apart // interval - 1)
+        while True:
+            day = add_months(anchor, index * interval)
+            if day > last:
+                break
+            if day >= date_from:
+                dates.append(day)
+            index += 1
+    else:
+        step = interval * (7 if rule == 'weekly' else 1)
+        index = max(0, -(-(date_from - anchor).days // step))
+        day = anchor + timedelta(days=index * step)
+        while day <= last:
+            dates.append(day)
+            day += timedelta(days=step)
+    return dates
+
+def parse_occurrence_window(query_params: Dict[str, Any]):
+    today = datetime.now().date()
+    date_from = datetime.strptime(query_params['from'], '%Y-%m-%d').date() if query_params.get('from') else today
+    date_to = datetime.strptime(query_params['to'], '%Y-%m-%d').date() if query_params.get('to') else date_from + timedelta(days=6)
+    return date_from, date_to
+
+def get_occurrences(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    
+    try:
+        date_from, date_to = parse_occurrence_window(query_params)
+    except ValueError:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Dates must be in YYYY-MM-DD format'})
+        }
+    
+    if date_from > date_to or (date_to - date_from).days > 366:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Invalid date range'})
+        }
+    
+    conn = get_read_connection(event.get('headers', {}))
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """SELECT g.id, g.title, g.category, g.priority, g.recurrence, g.recurrence_interval, 
+                      g.recurrence_until, COALESCE(g.start_date, g.created_at::date), 
+                      COALESCE(array_agg(o.occurrence_date) FILTER (WHERE o.occurrence_date IS NOT NULL), '{}')
+               FROM t_p59845625_taskbuddy_project.goals g 
+               LEFT JOIN t_p59845625_taskbuddy_project.goal_occurrences o 
+                   ON o.goal_id = g.id AND o.occurrence_date BETWEEN %s AND %s 
+               WHERE g.user_id = %s AND g.recurrence IS NOT NULL AND g.status != 'deleted' 
+               AND COALESCE(g.start_date, g.created_at::date) <= %s 
+               AND (g.recurrence_until IS NULL OR g.recurrence_until >= %s) 
+               GROUP BY g.id""",
+            (date_from, date_to, user_id, date_to, date_from)
+        )
+        rows = cur.fetchall()
+        
+        occurrences = []
+        for goal_id, title, category, priority, rule, interval, until, anchor, completed_dates in rows:
+            completed = set(completed_dates)
+            for day in expand_occurrences(anchor, rule, interval or 1, until, date_from, date_to):
+                occurrences.append({
+                    'goalId': goal_id,
+                    'title': title,
+                    'category': category,
+                    'priority': priority,
+                    'date': day.isoformat(),
+                    'completed': day in completed
+                })
+        
+        occurrences.sort(key=lambda o: (o['date'], o['goalId']))
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'occurrences': occurrences})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def find_occurrence(cur, user_id: int, goal_id: Any, occurrence_date: date) -> bool:
+    """Check that occurrence_date is generated by the goal's recurrence rule"""
+    cur.execute(
+        """SELECT recurrence, recurrence_interval, recurrence_until, COALESCE(start_date, created_at::date) 
+           FROM t_p59845625_taskbuddy_project.goals 
+           WHERE user_id = %s AND id = %s AND recurrence IS NOT NULL AND status != 'deleted'""",
+        (user_id, goal_id)
+    )
+    goal = cur.fetchone()
+    if not goal:
+        return False
+    rule, interval, until, anchor = goal
+    return bool(expand_occurrences(anchor, rule, interval or 1, until, occurrence_date, occurrence_date))
+
+def complete_occurrence(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    body = json.loads(event.get('body', '{}'))
+    goal_id = body.get('id')
+    
+    try:
+        occurrence_date = datetime.strptime(body.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        occurrence_date = None
+    
+    if not goal_id or not occurrence_date:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Goal ID and date are required'})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        if not find_occurrence(cur, user_id, goal_id, occurrence_date):
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Occurrence not found'})
+            }
+        
+        # A repeated completion inserts nothing, so the cache and today's counter only move for a new one
+        cur.execute(
+            f"""WITH added AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_occurrences (goal_id, occurrence_date) 
+                   VALUES (%(goal_id)s, %(date)s) ON CONFLICT (goal_id, occurrence_date) DO NOTHING 
+                   RETURNING goal_id
+               ), cache AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+                   WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM added)
+               ), activity AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, completed) 
+                   SELECT %(user_id)s, CURRENT_DATE, 1 FROM added 
+                   ON CONFLICT (user_id, day) DO UPDATE SET completed = goal_activity_daily.completed + 1
+               )
+               SELECT COUNT(*), {WRITE_LSN} FROM added""",
+            {'user_id': user_id, 'goal_id': goal_id, 'date': occurrence_date}
+        )
+        _, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'success': True})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def uncomplete_occurrence(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    goal_id = query_params.get('id')
+    
+    try:
+        occurrence_date = datetime.strptime(query_params.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        occurrence_date = None
+    
+    if not goal_id or not occurrence_date:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Goal ID and date are required'})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        # The completion was counted on the day it happened, so that day's counter is the one reversed
+        cur.execute(
+            f"""WITH removed AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.goal_occurrences o 
+                   USING t_p59845625_taskbuddy_project.goals g 
+                   WHERE o.goal_id = g.id AND g.user_id = %(user_id)s AND o.goal_id = %(goal_id)s 
+                         AND o.occurrence_date = %(date)s 
+                   RETURNING o.completed_at::date AS day
+               ), uncounted AS (
+                   UPDATE t_p59845625_taskbuddy_project.goal_activity_daily a 
+                   SET completed = GREATEST(a.completed - 1, 0) 
+                   FROM removed 
+                   WHERE a.user_id = %(user_id)s AND a.day = removed.day
+               ), cache AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+                   WHERE user_id = %(user_id)s AND EXISTS (SELECT 1 FROM removed)
+               )
+               SELECT COUNT(*), {WRITE_LSN} FROM removed""",
+            {'user_id': user_id, 'goal_id': goal_id, 'date': occurrence_date}
+        )
+        _, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'success': True})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def create_subtask(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    body = json.loads(event.get('body', '{}'))
+    goal_id = body.get('goalId')
+    title = body.get('title', '').strip()
+    
+    if not goal_id or not title:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Goal ID and title are required'})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH parent AS (
+                   UPDATE t_p59845625_taskbuddy_project.goals 
+                   SET subtasks_total = subtasks_total + 1, 
+                       progress = subtasks_done * 100 / (subtasks_total + 1), 
+                       updated_at = CURRENT_TIMESTAMP 
+                   WHERE user_id = %s AND id = %s AND status != 'deleted' 
+                   RETURNING id, progress, subtasks_total
+               ), created AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.subtasks (goal_id, title, position) 
+                   SELECT id, %s, subtasks_total FROM parent 
+                   RETURNING id, goal_id, title, is_done, position
+               )
+               SELECT created.id, created.goal_id, created.title, created.is_done, created.position, parent.progress, 
+                      {WRITE_LSN} 
+               FROM created, parent""",
+            (user_id, goal_id, title)
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Goal not found'})
+            }
+        
+        return {
+            'statusCode': 201,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'subtask': subtask_from_row(row), 'progress': row[5]})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def update_subtask(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    body = json.loads(event.get('body', '{}'))
+    subtask_id = body.get('id')
+    
+    if not subtask_id:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Subtask ID is required'})
+        }
+    
+    title = body['title'].strip() if isinstance(body.get('title'), str) and body['title'].strip() else None
+    is_done = bool(body['isDone']) if 'isDone' in body else None
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH prev AS (
+                   SELECT s.id, s.is_done FROM t_p59845625_taskbuddy_project.subtasks s 
+                   JOIN t_p59845625_taskbuddy_project.goals g ON g.id = s.goal_id 
+                   WHERE s.id = %(subtask_id)s AND g.user_id = %(user_id)s 
+                   FOR UPDATE OF s
+               ), changed AS (
+                   UPDATE t_p59845625_taskbuddy_project.subtasks s 
+                   SET title = COALESCE(%(title)s, s.title), is_done = COALESCE(%(is_done)s, s.is_done), updated_at = CURRENT_TIMESTAMP 
+                   FROM prev WHERE s.id = prev.id 
+                   RETURNING s.id, s.goal_id, s.title, s.is_done, s.position, 
+                             s.is_done::int - prev.is_done::int AS delta
+               ), parent AS (
+                   UPDATE t_p59845625_taskbuddy_project.goals g 
+                   SET subtasks_done = g.subtasks_done + changed.delta, 
+                       progress = (g.subtasks_done + changed.delta) * 100 / GREATEST(g.subtasks_total, 1), 
+                       updated_at = CURRENT_TIMESTAMP 
+                   FROM changed WHERE g.id = changed.goal_id AND changed.delta != 0 
+                   RETURNING g.title, g.progress, g.subtasks_done, g.subtasks_total, changed.delta
+               ), notification AS (
+                   INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+                   SELECT %(user_id)s, 'Задача выполнена!', 'Вы завершили задачу "' || title || '"', 'task_completed', FALSE 
+                   FROM parent WHERE delta > 0 AND subtasks_done = subtasks_total
+               )
+               SELECT changed.id, changed.goal_id, changed.title, changed.is_done, changed.position, changed.delta, 
+                      parent.title, parent.progress, parent.subtasks_done, parent.subtasks_total, 
+                      u.telegram_chat_id, COALESCE(st.telegram_notifications, TRUE), {WRITE_LSN} 
+               FROM changed 
+               LEFT JOIN parent ON TRUE 
+               LEFT JOIN t_p59845625_taskbuddy_project.users u ON u.id = %(user_id)s 
+               LEFT JOIN t_p59845625_taskbuddy_project.user_settings st ON st.user_id = u.id""",
+            {'subtask_id': subtask_id, 'user_id': user_id, 'title': title, 'is_done': is_done}
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Subtask not found'})
+            }
+        
+        delta, goal_title, progress, subtasks_done, subtasks_total = row[5:10]
+        
+        if delta > 0 and subtasks_done == subtasks_total:
+            send_telegram_notification(
+                row[10], row[11],
+                f'✅ <b>Задача выполнена!</b>\n\n🎉 Поздравляем! Вы завершили: <b>{goal_title}</b>'
+            )
+        
+        response = {'subtask': subtask_from_row(row)}
+        if progress is not None:
+            response['progress'] = progress
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps(response)
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+def delete_subtask(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    query_params = event.get('queryStringParameters', {})
+    subtask_id = query_params.get('id')
+    
+    if not subtask_id:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'Subtask ID is required'})
+        }
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            f"""WITH removed AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.subtasks s 
+                   USING t_p59845625_taskbuddy_project.goals g 
+                   WHERE s.goal_id = g.id AND s.id = %s AND g.user_id = %s 
+                   RETURNING s.goal_id, s.is_done::int AS done
+               )
+               UPDATE t_p59845625_taskbuddy_project.goals g 
+               SET subtasks_total = g.subtasks_total - 1, 
+                   subtasks_done = g.subtasks_done - removed.done, 
+                   progress = CASE WHEN g.subtasks_total > 1 
+                                   THEN (g.subtasks_done - removed.done) * 100 / (g.subtasks_total - 1) 
+                                   ELSE g.progress END, 
+                   updated_at = CURRENT_TIMESTAMP 
+               FROM removed WHERE g.id = removed.goal_id 
+               RETURNING g.progress, {WRITE_LSN}""",
+            (subtask_id, user_id)
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
+        conn.commit()
+        write_headers = get_write_headers(lsn)
+        
+        if not row:
+            return {
+                'statusCode': 404,
+                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                'body': json.dumps({'error': 'Subtask not found'})
+            }
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
+            'body': json.dumps({'success': True, 'progress': row[0]})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
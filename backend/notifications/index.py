@@ -5,35 +5,500 @@ Args: event - dict with httpMethod, queryStringParameters, headers, pathParams
 Returns: HTTP response dict with notifications data or settings
 '''
 
+import base64
+import gzip
+import hmac
+import html
+import itertools
 import json
+import math
 import os
+import random
+import re
+import threading
+import time
 import psycopg2
 import requests
-from typing import Dict, Any, Optional
-from datetime import datetime, timedelta
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from datetime import datetime, date, timedelta
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# API field -> notifications column for ?fields= on the list; id is always returned
+NOTIFICATION_LIST_FIELDS = {
+    'title': 'title',
+    'message': 'message',
+    'type': 'type',
+    'isRead': 'is_read',
+    'createdAt': 'created_at'
+}
+
+QUERIES = {
+    'user_context_by_token': """SELECT t.user_id, COALESCE(s.notifications, TRUE), 
+               COALESCE(s.email_notifications, FALSE), COALESCE(s.telegram_notifications, TRUE), 
+               COALESCE(s.reminder_time, '1day') 
+        FROM t_p59845625_taskbuddy_project.tokens t 
+        LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON s.user_id = t.user_id 
+        WHERE t.token = %s AND t.expires_at > CURRENT_TIMESTAMP""",
+    'user_context_by_id': """SELECT u.id, COALESCE(s.notifications, TRUE), 
+               COALESCE(s.email_notifications, FALSE), COALESCE(s.telegram_notifications, TRUE), 
+               COALESCE(s.reminder_time, '1day') 
+        FROM t_p59845625_taskbuddy_project.users u 
+        LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON s.user_id = u.id 
+        WHERE u.id = %s""",
+    'notifications_by_user': """SELECT id, title, message, type, is_read, created_at 
+        FROM t_p59845625_taskbuddy_project.notifications 
+        WHERE user_id = %s 
+        ORDER BY created_at DESC 
+        LIMIT 50""",
+}
+
+SHARD_CACHE_TTL = int(os.environ.get('SHARD_CACHE_TTL', '30'))
+SHARD_CACHE_MAX = 10000
+
+_shard_dsns: List[str] = []
+# shard -> primary connection kept open across warm invocations, and the statements prepared on it
+_pooled_connections: Dict[int, Any] = {}
+_prepared_statements: Dict[int, set] = {}
+# user_id -> (shard, moving, expires) read from the user_shards directory
+_user_shards: Dict[int, Tuple[int, bool, float]] = OrderedDict()
+_user_shards_lock = threading.Lock()
+# Shard of the request this thread is serving, set from the token before anything touches the database
+_request = threading.local()
+
+def get_shard_dsns() -> List[str]:
+    """Primaries holding disjoint sets of users, indexed by user_shards.shard; unset, DATABASE_URL is the only shard.
+    Read once per instance, it is on every request's path"""
+    if not _shard_dsns:
+        dsns = [dsn.strip() for dsn in os.environ.get('SHARD_DSNS', '').split(',') if dsn.strip()]
+        _shard_dsns[:] = dsns or [os.environ.get('DATABASE_URL')]
+    return _shard_dsns
+
+def lookup_user_shard(user_id: int) -> Tuple[int, bool]:
+    """(shard, moving) of a user from the directory on DATABASE_URL, cached for SHARD_CACHE_TTL"""
+    if len(get_shard_dsns()) == 1:
+        return 0, False
+    
+    now = time.monotonic()
+    with _user_shards_lock:
+        cached = _user_shards.get(user_id)
+    if cached and cached[2] > now:
+        return cached[0], cached[1]
+    
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT shard, moving FROM t_p59845625_taskbuddy_project.user_shards WHERE user_id = %s", (user_id,))
+        # Unknown ids go to shard 0, where their token lookup fails like any other bad token
+        shard, moving = cur.fetchone() or (0, False)
+    finally:
+        cur.close()
+        conn.close()
+    
+    with _user_shards_lock:
+        _user_shards.pop(user_id, None)
+        _user_shards[user_id] = (shard, moving, now + SHARD_CACHE_TTL)
+        while len(_user_shards) > SHARD_CACHE_MAX:
+            _user_shards.popitem(last=False)
+    return shard, moving
+
+def token_shard(token: str) -> Tuple[int, bool]:
+    """Tokens start with '<user_id>.'; older tokens without the prefix belong to users who never left shard 0"""
+    user_id, dot, _ = token.partition('.')
+    return lookup_user_shard(int(user_id)) if dot and user_id.isdigit() else (0, False)
+
+def use_shard(shard: int, moving: bool = False):
+    """Point this thread's get_db_connection at a shard until the next call"""
+    _request.shard, _request.moving = shard, moving
+
+def current_shard() -> int:
+    return getattr(_request, 'shard', 0)
+
+def user_moving_response() -> Optional[Dict[str, Any]]:
+    """503 for a write while tools/rebalance_shards.py copies the routed user to another shard, else None"""
+    if not getattr(_request, 'moving', False):
+        return None
+    return {
+        'statusCode': 503,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(SHARD_CACHE_TTL),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Account is being moved, retry shortly'})
+    }
 
 def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+    """Primary of the routed shard, kept open across warm invocations so prepared statements survive"""
+    shard = current_shard()
+    conn = _pooled_connections.get(shard)
+    if conn is None or conn.closed:
+        conn = _pooled_connections[shard] = psycopg2.connect(get_shard_dsns()[shard])
+        _prepared_statements[shard] = set()
+    return conn
+
+def pooled_shard(conn) -> Optional[int]:
+    for shard, pooled in _pooled_connections.items():
+        if pooled is conn:
+            return shard
+    return None
+
+def release_connection(conn):
+    """Finish using a connection: a pooled one is reset and kept, any other is closed"""
+    if pooled_shard(conn) is None:
+        conn.close()
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+
+def execute_query(cur, name: str, params):
+    """Run a QUERIES entry, server-side prepared once per pooled connection"""
+    sql = QUERIES[name]
+    shard = pooled_shard(cur.connection)
+    if shard is None:
+        cur.execute(sql, params)
+        return
+    
+    if name not in _prepared_statements[shard]:
+        counter = iter(range(1, sql.count('%s') + 1))
+        cur.execute(f"PREPARE {name} AS " + re.sub(r'%s', lambda _: f'${next(counter)}', sql))
+        _prepared_statements[shard].add(name)
+    
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+
+def get_replica_dsns() -> List[str]:
+    """Replicas of DATABASE_URL; once users are spread over SHARD_DSNS every read goes to its shard's primary"""
+    if len(get_shard_dsns()) > 1:
+        return []
+    return [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+
+def get_read_connection(headers: Dict[str, str]):
+    """Connect to a read replica, or to the primary if the replica has not replayed the client's last write"""
+    replicas = get_replica_dsns()
+    if not replicas:
+        return get_db_connection()
+    
+    try:
+        conn = psycopg2.connect(random.choice(replicas), connect_timeout=2)
+    except psycopg2.OperationalError:
+        return get_db_connection()
+    
+    last_write = headers.get('X-Last-Write', '') or headers.get('x-last-write', '')
+    if last_write:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, TRUE)", (last_write,))
+            caught_up = cur.fetchone()[0]
+            conn.rollback()
+        except psycopg2.Error:
+            caught_up = False
+        finally:
+            cur.close()
+        
+        if not caught_up:
+            release_connection(conn)
+            return get_db_connection()
+    
+    return conn
+
+# Last column of every write statement, so the X-Last-Write position comes back with the write's own row
+WRITE_LSN = 'pg_current_wal_insert_lsn()::text'
+
+def split_write_lsn(row) -> Tuple[Optional[tuple], Optional[str]]:
+    """Separate the trailing WRITE_LSN column, leaving the row as the handler reads it"""
+    if not row:
+        return None, None
+    return row[:-1], row[-1]
+
+def get_write_headers(lsn: Optional[str]) -> Dict[str, str]:
+    """Read-your-writes token for the client to send back as X-Last-Write on the next read. The position is read
+    inside the write statement, just before the transaction's commit record, so only a replica whose replay stops
+    between the two could pass the check without showing the write"""
+    if not lsn or not get_replica_dsns():
+        return {}
+    return {'X-Last-Write': lsn, 'Access-Control-Expose-Headers': 'X-Last-Write'}
+
+def is_worker_request(event: Dict[str, Any]) -> bool:
+    """The cron actions must present NOTIFICATIONS_WORKER_SECRET, checked before they spend the rate limit"""
+    secret = os.environ.get('NOTIFICATIONS_WORKER_SECRET', '')
+    headers = event.get('headers', {}) or {}
+    presented = headers.get('X-Worker-Secret', '') or headers.get('x-worker-secret', '')
+    return bool(secret) and hmac.compare_digest(presented.encode(), secret.encode())
+
+def unauthorized_response() -> Dict[str, Any]:
+    return {
+        'statusCode': 401,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'error': 'Unauthorized'})
+    }
+
+# name -> (requests, window seconds, also enforce across instances); the cron jobs are global, keyed 'global'
+# and only reachable with the worker secret, so anonymous callers cannot drain the shared bucket
+RATE_LIMITS = {
+    'reminders': (3, 300, True),
+    'overdue': (3, 300, True),
+    'history_maintenance': (3, 300, True)
+}
+
+RATE_BUCKETS_MAX = 10000
+
+_rate_buckets: Dict[str, Tuple[float, float, float]] = OrderedDict()
+# Requests may run on several threads (the router's sync workers), the pop/refill/insert must not interleave
+_rate_buckets_lock = threading.Lock()
+
+def take_local_token(key: str, limit: int, window: int) -> float:
+    """In-process token bucket, returns seconds until a token is available (0 when allowed)"""
+    with _rate_buckets_lock:
+        now = time.monotonic()
+        tokens, updated, _ = _rate_buckets.pop(key, (float(limit), now, now))
+        tokens = min(float(limit), tokens + (now - updated) * limit / window)
+        evict_full_buckets(now)
+        
+        retry_after = 0
+        if tokens < 1:
+            retry_after = (1 - tokens) * window / limit
+        else:
+            tokens -= 1
+        
+        # Buckets stay ordered by last use with the time they will be full again, a full bucket equals no bucket
+        _rate_buckets[key] = (tokens, now, now + (limit - tokens) * window / limit)
+    return retry_after
+
+def evict_full_buckets(now: float):
+    """Drop least recently used buckets that have refilled, so a flood of new keys cannot reset live ones;
+    called with _rate_buckets_lock held"""
+    while len(_rate_buckets) >= RATE_BUCKETS_MAX:
+        key = next(iter(_rate_buckets))
+        if _rate_buckets[key][2] > now:
+            break
+        del _rate_buckets[key]
+
+def take_shared_token(key: str, limit: int, window: int) -> float:
+    """Fixed-window counter shared by all instances, returns seconds until the window resets when exceeded"""
+    now = time.time()
+    window_id = int(now // window)
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """INSERT INTO t_p59845625_taskbuddy_project.rate_limits (key, window_id, hits) 
+               VALUES (%s, %s, 1) 
+               ON CONFLICT (key, window_id) DO UPDATE SET hits = rate_limits.hits + 1 
+               RETURNING hits""",
+            (key, window_id)
+        )
+        hits = cur.fetchone()[0]
+        
+        if hits == 1 and random.random() < 0.01:
+            cur.execute(
+                "DELETE FROM t_p59845625_taskbuddy_project.rate_limits WHERE window_id < %s AND key LIKE %s",
+                (window_id - 1, key.split(':')[0] + ':%')
+            )
+        conn.commit()
+    finally:
+        cur.close()
+        release_connection(conn)
+    
+    return (window_id + 1) * window - now if hits > limit else 0
+
+def check_rate_limit(name: str, identity: Any) -> float:
+    limit, window, shared = RATE_LIMITS[name]
+    key = f'{name}:{identity}'
+    retry_after = take_local_token(key, limit, window)
+    if not retry_after and shared:
+        retry_after = take_shared_token(key, limit, window)
+    return retry_after
+
+def rate_limited_response(retry_after: float) -> Dict[str, Any]:
+    return {
+        'statusCode': 429,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(max(1, math.ceil(retry_after))),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Too many requests'})
+    }
+
+COMPRESSION_MIN_BYTES = 1024
+
+def accepted_encodings(headers: Dict[str, str]) -> Dict[str, float]:
+    """Parse Accept-Encoding into encoding -> q-value"""
+    header = headers.get('Accept-Encoding', '') or headers.get('accept-encoding', '')
+    encodings = {}
+    for part in header.split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        q = 1.0
+        if params.strip().startswith('q='):
+            try:
+                q = float(params.strip()[2:])
+            except ValueError:
+                q = 0.0
+        encodings[name.strip().lower()] = q
+    return encodings
+
+def accepted_q(encodings: Dict[str, float], name: str) -> float:
+    """q-value for an encoding, falling back to the * wildcard when it is not listed"""
+    return encodings.get(name, encodings.get('*', 0))
+
+def compress_response(event: Dict[str, Any], response: Dict[str, Any]) -> Dict[str, Any]:
+    """Compress a JSON response body with brotli or gzip when the client accepts it and it is worth it"""
+    if response.get('statusCode') != 200:
+        return response
+    
+    # Every 200 varies on Accept-Encoding, including bodies too small to compress
+    response['headers']['Vary'] = 'Accept-Encoding'
+    raw = response.get('body', '').encode('utf-8')
+    if len(raw) < COMPRESSION_MIN_BYTES:
+        return response
+    
+    encodings = accepted_encodings(event.get('headers', {}))
+    if brotli is not None and accepted_q(encodings, 'br') > 0:
+        encoding, data = 'br', brotli.compress(raw, quality=5)
+    elif accepted_q(encodings, 'gzip') > 0:
+        encoding, data = 'gzip', gzip.compress(raw, compresslevel=6)
+    else:
+        return response
+    
+    response['headers']['Content-Encoding'] = encoding
+    response['isBase64Encoded'] = True
+    response['body'] = base64.b64encode(data).decode('ascii')
+    return response
+
+def parse_fields(query_params: Dict[str, Any], allowed: Dict[str, str]) -> Tuple[Optional[List[str]], Optional[str]]:
+    """Read a ?fields= sparse fieldset; None means every field"""
+    raw = query_params.get('fields')
+    if not raw:
+        return None, None
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(',') if f.strip() and f.strip() != 'id'))
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        return None, f"Unknown fields: {', '.join(unknown)}"
+    return fields, None
+
+def api_value(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (date, datetime)) else value
+
+# Settings are cached per instance: a PUT invalidates only the instance that served it, so the others
+# keep serving the previous values until their entry expires (up to USER_CONTEXT_TTL seconds)
+USER_CONTEXT_TTL = int(os.environ.get('USER_CONTEXT_TTL', '60'))
+USER_CONTEXT_CACHE_MAX = int(os.environ.get('USER_CONTEXT_CACHE_MAX', '10000'))
+
+# token -> (user_id, expires) and user_id -> (context, expires); one entry per user holds the settings
+_token_users: Dict[str, Tuple[int, float]] = {}
+_user_contexts: Dict[int, Tuple[Dict[str, Any], float]] = {}
+# Writers iterate and evict, so they hold the lock; a lone dict.get is atomic and reads without it
+_context_lock = threading.Lock()
+
+def context_from_row(row) -> Dict[str, Any]:
+    return {
+        'notifications': row[1],
+        'emailNotifications': row[2],
+        'telegramNotifications': row[3],
+        'reminderTime': row[4]
+    }
+
+def cache_put(cache: Dict[Any, tuple], key: Any, value: Any):
+    """Insert with USER_CONTEXT_TTL; once full, expired entries go first, then the oldest quarter"""
+    with _context_lock:
+        now = time.monotonic()
+        if len(cache) >= USER_CONTEXT_CACHE_MAX:
+            for stale in [k for k, (_, expires) in cache.items() if expires <= now]:
+                del cache[stale]
+        if len(cache) >= USER_CONTEXT_CACHE_MAX:
+            for oldest in list(itertools.islice(cache, USER_CONTEXT_CACHE_MAX // 4 or 1)):
+                del cache[oldest]
+        cache.pop(key, None)
+        cache[key] = (value, now + USER_CONTEXT_TTL)
+
+def cache_user_context(user_id: int, context: Dict[str, Any]):
+    cache_put(_user_contexts, user_id, context)
+
+def invalidate_user_context(user_id: int):
+    """Drop the cached settings after a write; other instances expire theirs within USER_CONTEXT_TTL"""
+    with _context_lock:
+        _user_contexts.pop(user_id, None)
+
+def get_user_context(headers: Dict[str, str], user_id: int) -> Optional[Dict[str, Any]]:
+    """Cached settings of an authenticated user, reloaded by id if a write invalidated them; None once the user is gone"""
+    cached = _user_contexts.get(user_id)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+    
+    conn = get_read_connection(headers)
+    cur = conn.cursor()
+    try:
+        execute_query(cur, 'user_context_by_id', (user_id,))
+        row = cur.fetchone()
+        
+        if not row and get_replica_dsns():
+            cur.close()
+            release_connection(conn)
+            conn = get_db_connection()
+            cur = conn.cursor()
+            execute_query(cur, 'user_context_by_id', (user_id,))
+            row = cur.fetchone()
+    finally:
+        cur.close()
+        release_connection(conn)
+    
+    if not row:
+        return None
+    
+    context = context_from_row(row)
+    cache_user_context(user_id, context)
+    return context
 
 def get_user_id_from_token(headers: Dict[str, str]) -> Optional[int]:
+    """Resolve the token and load the settings in the same query, cached per user"""
     token = headers.get('X-Auth-Token', '') or headers.get('x-auth-token', '')
     if not token:
         return None
     
-    conn = get_db_connection()
+    use_shard(*token_shard(token))
+    
+    now = time.monotonic()
+    cached = _token_users.get(token)
+    if cached and cached[1] > now and _user_contexts.get(cached[0], (None, 0))[1] > now:
+        return cached[0]
+    
+    conn = get_read_connection(headers)
     cur = conn.cursor()
     
     try:
-        cur.execute(
-            "SELECT user_id FROM t_p59845625_taskbuddy_project.tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
-            (token,)
-        )
+        execute_query(cur, 'user_context_by_token', (token,))
         result = cur.fetchone()
-        return result[0] if result else None
+        
+        if not result and get_replica_dsns():
+            cur.close()
+            release_connection(conn)
+            conn = get_db_connection()
+            cur = conn.cursor()
+            execute_query(cur, 'user_context_by_token', (token,))
+            result = cur.fetchone()
+        
+        if not result:
+            return None
+        
+        cache_put(_token_users, token, result[0])
+        cache_user_context(result[0], context_from_row(result))
+        return result[0]
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -46,14 +511,38 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Last-Write',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
         }
     
     if action == 'reminders':
-        return check_and_send_reminders()
+        if not is_worker_request(event):
+            return unauthorized_response()
+        use_shard(0)
+        retry_after = check_rate_limit('reminders', 'global')
+        if retry_after:
+            return rate_limited_response(retry_after)
+        return on_every_shard(check_and_send_reminders)
+    
+    if action == 'overdue':
+        if not is_worker_request(event):
+            return unauthorized_response()
+        use_shard(0)
+        retry_after = check_rate_limit('overdue', 'global')
+        if retry_after:
+            return rate_limited_response(retry_after)
+        return on_every_shard(sweep_overdue_goals)
+    
+    if action == 'history_maintenance':
+        if not is_worker_request(event):
+            return unauthorized_response()
+        use_shard(0)
+        retry_after = check_rate_limit('history_maintenance', 'global')
+        if retry_after:
+            return rate_limited_response(retry_after)
+        return on_every_shard(maintain_goal_history)
     
     if action == 'settings':
         headers = event.get('headers', {})
@@ -66,9 +555,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Unauthorized'})
             }
         
+        moving = user_moving_response() if method != 'GET' else None
+        if moving:
+            return moving
+        
         try:
             if method == 'GET':
-                return get_settings(user_id)
+                return get_settings(event, user_id)
             elif method == 'PUT':
                 return update_settings(event, user_id)
         except Exception as e:
@@ -88,9 +581,13 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Unauthorized'})
         }
     
+    moving = user_moving_response() if method != 'GET' else None
+    if moving:
+        return moving
+    
     try:
         if method == 'GET':
-            return get_notifications(user_id)
+            return get_notifications(event, user_id)
         elif method == 'PUT':
             return mark_as_read(event, user_id)
         elif method == 'DELETE':
@@ -108,35 +605,48 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)})
         }
 
-def get_notifications(user_id: int) -> Dict[str, Any]:
-    conn = get_db_connection()
+def get_notifications(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    fields, fields_error = parse_fields(event.get('queryStringParameters', {}), NOTIFICATION_LIST_FIELDS)
+    if fields_error:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': fields_error})
+        }
+    
+    conn = get_read_connection(event.get('headers', {}))
     cur = conn.cursor()
     
     try:
-        cur.execute(
-            """SELECT id, title, message, type, is_read, created_at 
-               FROM t_p59845625_taskbuddy_project.notifications 
-               WHERE user_id = %s 
-               ORDER BY created_at DESC 
-               LIMIT 50""",
-            (user_id,)
-        )
-        rows = cur.fetchall()
-        
-        notifications = []
-        for row in rows:
-            notifications.append({
-                'id': row[0],
-                'title': row[1],
-                'message': row[2],
-                'type': row[3],
-                'isRead': row[4],
-                'createdAt': row[5].isoformat() if row[5] else None
-            })
-        
-        unread_count = sum(1 for n in notifications if not n['isRead'])
+        if fields is None:
+            execute_query(cur, 'notifications_by_user', (user_id,))
+            notifications = []
+            for row in cur.fetchall():
+                notifications.append({
+                    'id': row[0],
+                    'title': row[1],
+                    'message': row[2],
+                    'type': row[3],
+                    'isRead': row[4],
+                    'createdAt': row[5].isoformat() if row[5] else None
+                })
+            unread_count = sum(1 for n in notifications if not n['isRead'])
+        else:
+            # is_read is always selected last so unreadCount works whatever the fieldset
+            cur.execute(
+                f"""SELECT id{''.join(', ' + NOTIFICATION_LIST_FIELDS[f] for f in fields)}, is_read 
+                    FROM t_p59845625_taskbuddy_project.notifications 
+                    WHERE user_id = %s 
+                    ORDER BY created_at DESC 
+                    LIMIT 50""",
+                (user_id,)
+            )
+            rows = cur.fetchall()
+            keys = ['id'] + fields
+            notifications = [dict(zip(keys, map(api_value, row[:-1]))) for row in rows]
+            unread_count = sum(1 for row in rows if not row[-1])
         
-        return {
+        return compress_response(event, {
             'statusCode': 200,
             'headers': {
                 'Content-Type': 'application/json', 
@@ -146,11 +656,11 @@ def get_notifications(user_id: int) -> Dict[str, Any]:
             'body': json.dumps({
                 'notifications': notifications,
                 'unreadCount': unread_count
-            })
-        }
+            }, ensure_ascii=False, separators=(',', ':'))
+        })
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 def mark_as_read(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     body = json.loads(event.get('body', '{}'))
@@ -168,19 +678,22 @@ def mark_as_read(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     
     try:
         cur.execute(
-            "UPDATE t_p59845625_taskbuddy_project.notifications SET is_read = TRUE WHERE id = %s AND user_id = %s",
+            f"""UPDATE t_p59845625_taskbuddy_project.notifications SET is_read = TRUE WHERE id = %s AND user_id = %s 
+                RETURNING {WRITE_LSN}""",
             (notification_id, user_id)
         )
+        _, lsn = split_write_lsn(cur.fetchone())
         conn.commit()
+        write_headers = get_write_headers(lsn)
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
             'body': json.dumps({'success': True})
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 def delete_notification(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     params = event.get('queryStringParameters', {})
@@ -198,10 +711,13 @@ def delete_notification(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     
     try:
         cur.execute(
-            "DELETE FROM t_p59845625_taskbuddy_project.notifications WHERE id = %s AND user_id = %s",
+            f"""DELETE FROM t_p59845625_taskbuddy_project.notifications WHERE id = %s AND user_id = %s 
+                RETURNING {WRITE_LSN}""",
             (notification_id, user_id)
         )
+        _, lsn = split_write_lsn(cur.fetchone())
         conn.commit()
+        write_headers = get_write_headers(lsn)
         
         if cur.rowcount == 0:
             return {
@@ -212,90 +728,72 @@ def delete_notification(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
             'body': json.dumps({'success': True})
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
-def get_settings(user_id: int) -> Dict[str, Any]:
-    conn = get_db_connection()
-    cur = conn.cursor()
+def get_settings(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    """Served from the context loaded with the token; users without a settings row get the column defaults"""
+    context = get_user_context(event.get('headers', {}), user_id)
+    if context is None:
+        return unauthorized_response()
     
-    try:
-        cur.execute(
-            """SELECT notifications, email_notifications, telegram_notifications, reminder_time
-               FROM t_p59845625_taskbuddy_project.user_settings 
-               WHERE user_id = %s""",
-            (user_id,)
-        )
-        row = cur.fetchone()
-        
-        if not row:
-            cur.execute(
-                """INSERT INTO t_p59845625_taskbuddy_project.user_settings (user_id) VALUES (%s)
-                   RETURNING notifications, email_notifications, telegram_notifications, reminder_time""",
-                (user_id,)
-            )
-            row = cur.fetchone()
-            conn.commit()
-        
-        settings = {
-            'notifications': row[0],
-            'emailNotifications': row[1],
-            'telegramNotifications': row[2],
-            'reminderTime': row[3]
-        }
-        
-        return {
-            'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-            'body': json.dumps(settings)
-        }
-    finally:
-        cur.close()
-        conn.close()
+    settings = {
+        'notifications': context['notifications'],
+        'emailNotifications': context['emailNotifications'],
+        'telegramNotifications': context['telegramNotifications'],
+        'reminderTime': context['reminderTime']
+    }
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps(settings)
+    }
+
+# API key -> user_settings column accepted by update_settings
+SETTINGS_FIELDS = (
+    ('notifications', 'notifications'),
+    ('emailNotifications', 'email_notifications'),
+    ('telegramNotifications', 'telegram_notifications'),
+    ('reminderTime', 'reminder_time')
+)
 
 def update_settings(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     body = json.loads(event.get('body', '{}'))
     
+    columns = [column for key, column in SETTINGS_FIELDS if key in body]
+    if not columns:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'No fields to update'})
+        }
+    
+    params = {column: body[key] for key, column in SETTINGS_FIELDS if key in body}
+    params['user_id'] = user_id
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
     try:
-        update_fields = []
-        params = []
-        
-        if 'notifications' in body:
-            update_fields.append('notifications = %s')
-            params.append(body['notifications'])
-        if 'emailNotifications' in body:
-            update_fields.append('email_notifications = %s')
-            params.append(body['emailNotifications'])
-        if 'telegramNotifications' in body:
-            update_fields.append('telegram_notifications = %s')
-            params.append(body['telegramNotifications'])
-        if 'reminderTime' in body:
-            update_fields.append('reminder_time = %s')
-            params.append(body['reminderTime'])
-        
-        if not update_fields:
-            return {
-                'statusCode': 400,
-                'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
-                'body': json.dumps({'error': 'No fields to update'})
-            }
-        
-        params.append(user_id)
-        
-        query = f"""UPDATE t_p59845625_taskbuddy_project.user_settings SET {', '.join(update_fields)} 
-                   WHERE user_id = %s
-                   RETURNING notifications, email_notifications, telegram_notifications, reminder_time"""
-        
-        cur.execute(query, params)
-        row = cur.fetchone()
+        # Upsert, so the first save creates the row that reads no longer insert lazily
+        cur.execute(
+            f"""INSERT INTO t_p59845625_taskbuddy_project.user_settings (user_id, {', '.join(columns)}) 
+                VALUES (%(user_id)s, {', '.join(f'%({column})s' for column in columns)}) 
+                ON CONFLICT (user_id) DO UPDATE SET 
+                    {', '.join(f'{column} = EXCLUDED.{column}' for column in columns)}, 
+                    updated_at = CURRENT_TIMESTAMP 
+                RETURNING notifications, email_notifications, telegram_notifications, reminder_time, {WRITE_LSN}""",
+            params
+        )
+        row, lsn = split_write_lsn(cur.fetchone())
         conn.commit()
+        invalidate_user_context(user_id)
+        write_headers = get_write_headers(lsn)
         
         settings = {
             'notifications': row[0],
@@ -306,12 +804,39 @@ def update_settings(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
             'body': json.dumps(settings)
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
+
+def on_every_shard(job: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    """Cron jobs cover every user, so they run once per shard; with one shard the job's own response is returned"""
+    shards = len(get_shard_dsns())
+    if shards == 1:
+        return job()
+    
+    results = []
+    for shard in range(shards):
+        use_shard(shard)
+        results.append(json.loads(job()['body']))
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': json.dumps({'success': True, 'shards': results})
+    }
+
+REMINDER_CANDIDATES_QUERY = """SELECT g.id, g.title, g.end_date, g.user_id, u.username, u.telegram_chat_id, 
+           COALESCE(s.telegram_notifications, TRUE)
+    FROM t_p59845625_taskbuddy_project.goals g
+    JOIN t_p59845625_taskbuddy_project.users u ON g.user_id = u.id
+    LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON u.id = s.user_id
+    WHERE g.status NOT IN ('completed', 'deleted')
+    AND g.end_date = %s
+    AND (s.telegram_notifications = TRUE OR s.telegram_notifications IS NULL)
+    AND u.telegram_chat_id IS NOT NULL"""
 
 def check_and_send_reminders() -> Dict[str, Any]:
     conn = get_db_connection()
@@ -323,18 +848,7 @@ def check_and_send_reminders() -> Dict[str, Any]:
         tomorrow = datetime.now() + timedelta(days=1)
         tomorrow_str = tomorrow.strftime('%Y-%m-%d')
         
-        cur.execute(
-            """SELECT g.id, g.title, g.end_date, g.user_id, u.username, u.telegram_chat_id, 
-                      s.telegram_notifications
-               FROM t_p59845625_taskbuddy_project.goals g
-               JOIN t_p59845625_taskbuddy_project.users u ON g.user_id = u.id
-               LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON u.id = s.user_id
-               WHERE g.status != 'completed'
-               AND g.due_date::date = %s
-               AND (s.telegram_notifications = TRUE OR s.telegram_notifications IS NULL)
-               AND u.telegram_chat_id IS NOT NULL""",
-            (tomorrow_str,)
-        )
+        cur.execute(REMINDER_CANDIDATES_QUERY, (tomorrow_str,))
         
         upcoming_goals = cur.fetchall()
         
@@ -370,7 +884,149 @@ def check_and_send_reminders() -> Dict[str, Any]:
         
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
+
+OVERDUE_BATCH_USERS = 500
+OVERDUE_MAX_BATCHES = 20
+OVERDUE_TITLES_SHOWN = 5
+
+# One batch: every open (pending or in_progress) non-recurring goal past the cutoff for up to %(batch)s users,
+# one notification per user; the event keeps the status the goal had, goals.update_goal restores it on reopen
+OVERDUE_BATCH_QUERY = """WITH batch AS (
+        SELECT DISTINCT user_id FROM t_p59845625_taskbuddy_project.goals 
+        WHERE status IN ('pending', 'in_progress') AND end_date < %(cutoff)s AND recurrence IS NULL 
+        LIMIT %(batch)s
+    ), marked AS (
+        UPDATE t_p59845625_taskbuddy_project.goals g SET status = 'overdue', updated_at = CURRENT_TIMESTAMP 
+        FROM batch, t_p59845625_taskbuddy_project.goals prev 
+        WHERE g.user_id = batch.user_id AND prev.id = g.id 
+          AND g.status IN ('pending', 'in_progress') AND g.end_date < %(cutoff)s AND g.recurrence IS NULL 
+        RETURNING g.id, g.user_id, g.title, g.end_date, prev.status AS old_status
+    ), history AS (
+        INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, kind, diff) 
+        SELECT id, user_id, 'overdue', jsonb_build_object('status', jsonb_build_array(old_status, 'overdue')) FROM marked
+    ), grouped AS (
+        SELECT user_id, count(*) AS goals, (array_agg(title ORDER BY end_date, title))[1:%(titles)s] AS titles 
+        FROM marked GROUP BY user_id
+    ), cache AS (
+        DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache 
+        WHERE user_id IN (SELECT user_id FROM grouped)
+    ), notification AS (
+        INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+        SELECT user_id, 'Просроченные задачи', 
+               'Просрочено задач: ' || goals || ' (' || array_to_string(titles, ', ') || 
+               CASE WHEN goals > %(titles)s THEN ', …' ELSE '' END || ')', 
+               'deadline_overdue', FALSE 
+        FROM grouped
+    ), state AS (
+        UPDATE t_p59845625_taskbuddy_project.overdue_sweep_state 
+        SET goals_marked = goals_marked + (SELECT count(*) FROM marked), 
+            users_notified = users_notified + (SELECT count(*) FROM grouped) 
+        WHERE id = 1
+    )
+    SELECT grouped.user_id, grouped.goals, grouped.titles, u.telegram_chat_id, COALESCE(s.telegram_notifications, TRUE) 
+    FROM grouped 
+    JOIN t_p59845625_taskbuddy_project.users u ON u.id = grouped.user_id 
+    LEFT JOIN t_p59845625_taskbuddy_project.user_settings s ON s.user_id = grouped.user_id"""
+
+def sweep_overdue_goals() -> Dict[str, Any]:
+    """Mark goals past their deadline as overdue in per-user batches; each batch commits, so a rerun resumes"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    bot_token = os.environ.get('TELEGRAM_BOT_TOKEN', '')
+    
+    try:
+        # Keep the cutoff of an unfinished sweep so a resumed run covers the same goals
+        cur.execute(
+            """INSERT INTO t_p59845625_taskbuddy_project.overdue_sweep_state (id, cutoff) 
+               VALUES (1, CURRENT_DATE) 
+               ON CONFLICT (id) DO UPDATE SET 
+                   cutoff = CURRENT_DATE, goals_marked = 0, users_notified = 0, 
+                   started_at = CURRENT_TIMESTAMP, finished_at = NULL 
+               WHERE overdue_sweep_state.finished_at IS NOT NULL 
+                 AND overdue_sweep_state.cutoff < CURRENT_DATE""",
+        )
+        cur.execute("SELECT cutoff FROM t_p59845625_taskbuddy_project.overdue_sweep_state WHERE id = 1")
+        cutoff = cur.fetchone()[0]
+        conn.commit()
+        
+        goals_marked = 0
+        users_notified = 0
+        done = False
+        
+        for _ in range(OVERDUE_MAX_BATCHES):
+            cur.execute(OVERDUE_BATCH_QUERY, {'cutoff': cutoff, 'batch': OVERDUE_BATCH_USERS, 'titles': OVERDUE_TITLES_SHOWN})
+            rows = cur.fetchall()
+            conn.commit()
+            
+            if not rows:
+                done = True
+                break
+            
+            for user_id, goals, titles, chat_id, tg_enabled in rows:
+                goals_marked += goals
+                users_notified += 1
+                if tg_enabled and chat_id:
+                    listed = '\n'.join(f'📋 {html.escape(title)}' for title in titles)
+                    more = f'\n…и ещё {goals - len(titles)}' if goals > len(titles) else ''
+                    send_telegram_message(bot_token, chat_id, f'⏰ <b>Просрочено задач: {goals}</b>\n\n{listed}{more}')
+        
+        if done:
+            cur.execute(
+                """UPDATE t_p59845625_taskbuddy_project.overdue_sweep_state 
+                   SET finished_at = CURRENT_TIMESTAMP WHERE id = 1 AND finished_at IS NULL"""
+            )
+            conn.commit()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'success': True,
+                'cutoff': cutoff.isoformat(),
+                'goalsMarked': goals_marked,
+                'usersNotified': users_notified,
+                'done': done
+            })
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
+
+GOAL_EVENTS_MONTHS_AHEAD = 3
+GOAL_EVENTS_RETENTION_MONTHS = int(os.environ.get('GOAL_EVENTS_RETENTION_MONTHS', '24'))
+
+def maintain_goal_history() -> Dict[str, Any]:
+    """Keep monthly goal_events partitions ahead of time and drop whole ones past retention"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            "SELECT t_p59845625_taskbuddy_project.create_goal_events_partitions(%s)",
+            (GOAL_EVENTS_MONTHS_AHEAD,)
+        )
+        created = cur.fetchone()[0]
+        cur.execute(
+            """SELECT t_p59845625_taskbuddy_project.drop_goal_events_partitions_before(
+                   (date_trunc('month', CURRENT_DATE) - make_interval(months => %s))::date)""",
+            (GOAL_EVENTS_RETENTION_MONTHS,)
+        )
+        dropped = cur.fetchone()[0]
+        conn.commit()
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'success': True,
+                'partitionsCreated': created,
+                'partitionsDropped': dropped
+            })
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
 
 def send_telegram_message(bot_token: str, chat_id: str, text: str) -> bool:
     if not bot_token:
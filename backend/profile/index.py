@@ -7,31 +7,220 @@ Returns: HTTP response dict with profile data
 
 import json
 import os
+import random
+import re
+import secrets
+import threading
+import time
 import psycopg2
-from typing import Dict, Any, Optional
+from collections import OrderedDict
+from typing import Dict, Any, Optional, List, Tuple
+
+QUERIES = {
+    'user_id_by_token': "SELECT user_id FROM t_p59845625_taskbuddy_project.tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
+    'profile_by_user': """SELECT id, email, username, avatar_url, bio, telegram_chat_id, created_at 
+        FROM t_p59845625_taskbuddy_project.users WHERE id = %s""",
+    'goal_stats_by_user': """SELECT COUNT(*) FILTER (WHERE status != 'deleted'), COUNT(*) FILTER (WHERE status = 'completed') 
+        FROM t_p59845625_taskbuddy_project.goals WHERE user_id = %s"""
+}
+
+SHARD_CACHE_TTL = int(os.environ.get('SHARD_CACHE_TTL', '30'))
+SHARD_CACHE_MAX = 10000
+
+_shard_dsns: List[str] = []
+# shard -> primary connection kept open across warm invocations, and the statements prepared on it
+_pooled_connections: Dict[int, Any] = {}
+_prepared_statements: Dict[int, set] = {}
+# user_id -> (shard, moving, expires) read from the user_shards directory
+_user_shards: Dict[int, Tuple[int, bool, float]] = OrderedDict()
+_user_shards_lock = threading.Lock()
+# Shard of the request this thread is serving, set from the token before anything touches the database
+_request = threading.local()
+
+def get_shard_dsns() -> List[str]:
+    """Primaries holding disjoint sets of users, indexed by user_shards.shard; unset, DATABASE_URL is the only shard.
+    Read once per instance, it is on every request's path"""
+    if not _shard_dsns:
+        dsns = [dsn.strip() for dsn in os.environ.get('SHARD_DSNS', '').split(',') if dsn.strip()]
+        _shard_dsns[:] = dsns or [os.environ.get('DATABASE_URL')]
+    return _shard_dsns
+
+def lookup_user_shard(user_id: int) -> Tuple[int, bool]:
+    """(shard, moving) of a user from the directory on DATABASE_URL, cached for SHARD_CACHE_TTL"""
+    if len(get_shard_dsns()) == 1:
+        return 0, False
+    
+    now = time.monotonic()
+    with _user_shards_lock:
+        cached = _user_shards.get(user_id)
+    if cached and cached[2] > now:
+        return cached[0], cached[1]
+    
+    conn = psycopg2.connect(os.environ.get('DATABASE_URL'))
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT shard, moving FROM t_p59845625_taskbuddy_project.user_shards WHERE user_id = %s", (user_id,))
+        # Unknown ids go to shard 0, where their token lookup fails like any other bad token
+        shard, moving = cur.fetchone() or (0, False)
+    finally:
+        cur.close()
+        conn.close()
+    
+    with _user_shards_lock:
+        _user_shards.pop(user_id, None)
+        _user_shards[user_id] = (shard, moving, now + SHARD_CACHE_TTL)
+        while len(_user_shards) > SHARD_CACHE_MAX:
+            _user_shards.popitem(last=False)
+    return shard, moving
+
+def token_shard(token: str) -> Tuple[int, bool]:
+    """Tokens start with '<user_id>.'; older tokens without the prefix belong to users who never left shard 0"""
+    user_id, dot, _ = token.partition('.')
+    return lookup_user_shard(int(user_id)) if dot and user_id.isdigit() else (0, False)
+
+def use_shard(shard: int, moving: bool = False):
+    """Point this thread's get_db_connection at a shard until the next call"""
+    _request.shard, _request.moving = shard, moving
+
+def current_shard() -> int:
+    return getattr(_request, 'shard', 0)
+
+def user_moving_response() -> Optional[Dict[str, Any]]:
+    """503 for a write while tools/rebalance_shards.py copies the routed user to another shard, else None"""
+    if not getattr(_request, 'moving', False):
+        return None
+    return {
+        'statusCode': 503,
+        'headers': {
+            'Content-Type': 'application/json',
+            'Access-Control-Allow-Origin': '*',
+            'Retry-After': str(SHARD_CACHE_TTL),
+            'Access-Control-Expose-Headers': 'Retry-After'
+        },
+        'body': json.dumps({'error': 'Account is being moved, retry shortly'})
+    }
 
 def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
-    return psycopg2.connect(dsn)
+    """Primary of the routed shard, kept open across warm invocations so prepared statements survive"""
+    shard = current_shard()
+    conn = _pooled_connections.get(shard)
+    if conn is None or conn.closed:
+        conn = _pooled_connections[shard] = psycopg2.connect(get_shard_dsns()[shard])
+        _prepared_statements[shard] = set()
+    return conn
+
+def pooled_shard(conn) -> Optional[int]:
+    for shard, pooled in _pooled_connections.items():
+        if pooled is conn:
+            return shard
+    return None
+
+def release_connection(conn):
+    """Finish using a connection: a pooled one is reset and kept, any other is closed"""
+    if pooled_shard(conn) is None:
+        conn.close()
+        return
+    try:
+        conn.rollback()
+    except psycopg2.Error:
+        conn.close()
+
+def execute_query(cur, name: str, params):
+    """Run a QUERIES entry, server-side prepared once per pooled connection"""
+    sql = QUERIES[name]
+    shard = pooled_shard(cur.connection)
+    if shard is None:
+        cur.execute(sql, params)
+        return
+    
+    if name not in _prepared_statements[shard]:
+        counter = iter(range(1, sql.count('%s') + 1))
+        cur.execute(f"PREPARE {name} AS " + re.sub(r'%s', lambda _: f'${next(counter)}', sql))
+        _prepared_statements[shard].add(name)
+    
+    placeholders = ', '.join(['%s'] * len(params))
+    cur.execute(f"EXECUTE {name} ({placeholders})" if params else f"EXECUTE {name}", params)
+
+def get_replica_dsns() -> List[str]:
+    """Replicas of DATABASE_URL; once users are spread over SHARD_DSNS every read goes to its shard's primary"""
+    if len(get_shard_dsns()) > 1:
+        return []
+    return [dsn.strip() for dsn in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if dsn.strip()]
+
+def get_read_connection(headers: Dict[str, str]):
+    """Connect to a read replica, or to the primary if the replica has not replayed the client's last write"""
+    replicas = get_replica_dsns()
+    if not replicas:
+        return get_db_connection()
+    
+    try:
+        conn = psycopg2.connect(random.choice(replicas), connect_timeout=2)
+    except psycopg2.OperationalError:
+        return get_db_connection()
+    
+    last_write = headers.get('X-Last-Write', '') or headers.get('x-last-write', '')
+    if last_write:
+        cur = conn.cursor()
+        try:
+            cur.execute("SELECT COALESCE(pg_last_wal_replay_lsn() >= %s::pg_lsn, TRUE)", (last_write,))
+            caught_up = cur.fetchone()[0]
+            conn.rollback()
+        except psycopg2.Error:
+            caught_up = False
+        finally:
+            cur.close()
+        
+        if not caught_up:
+            release_connection(conn)
+            return get_db_connection()
+    
+    return conn
+
+# Last column of every write statement, so the X-Last-Write position comes back with the write's own row
+WRITE_LSN = 'pg_current_wal_insert_lsn()::text'
+
+def split_write_lsn(row) -> Tuple[Optional[tuple], Optional[str]]:
+    """Separate the trailing WRITE_LSN column, leaving the row as the handler reads it"""
+    if not row:
+        return None, None
+    return row[:-1], row[-1]
+
+def get_write_headers(lsn: Optional[str]) -> Dict[str, str]:
+    """Read-your-writes token for the client to send back as X-Last-Write on the next read. The position is read
+    inside the write statement, just before the transaction's commit record, so only a replica whose replay stops
+    between the two could pass the check without showing the write"""
+    if not lsn or not get_replica_dsns():
+        return {}
+    return {'X-Last-Write': lsn, 'Access-Control-Expose-Headers': 'X-Last-Write'}
+
+TELEGRAM_LINK_TTL_MINUTES = 15
 
 def get_user_id_from_token(headers: Dict[str, str]) -> Optional[int]:
     token = headers.get('X-Auth-Token', '') or headers.get('x-auth-token', '')
     if not token:
         return None
     
-    conn = get_db_connection()
+    use_shard(*token_shard(token))
+    
+    conn = get_read_connection(headers)
     cur = conn.cursor()
     
     try:
-        cur.execute(
-            "SELECT user_id FROM tokens WHERE token = %s AND expires_at > CURRENT_TIMESTAMP",
-            (token,)
-        )
+        execute_query(cur, 'user_id_by_token', (token,))
         result = cur.fetchone()
+        
+        if not result and get_replica_dsns():
+            cur.close()
+            release_connection(conn)
+            conn = get_db_connection()
+            cur = conn.cursor()
+            execute_query(cur, 'user_id_by_token', (token,))
+            result = cur.fetchone()
+        
         return result[0] if result else None
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     method: str = event.get('httpMethod', 'GET')
@@ -41,8 +230,8 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'statusCode': 200,
             'headers': {
                 'Access-Control-Allow-Origin': '*',
-                'Access-Control-Allow-Methods': 'GET, PUT, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token',
+                'Access-Control-Allow-Methods': 'GET, POST, PUT, OPTIONS',
+                'Access-Control-Allow-Headers': 'Content-Type, X-Auth-Token, X-Last-Write',
                 'Access-Control-Max-Age': '86400'
             },
             'body': ''
@@ -58,11 +247,17 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': 'Unauthorized'})
         }
     
+    moving = user_moving_response() if method != 'GET' else None
+    if moving:
+        return moving
+    
     try:
         if method == 'GET':
-            return get_profile(user_id)
+            return get_profile(event, user_id)
         elif method == 'PUT':
             return update_profile(event, user_id)
+        elif method == 'POST' and (event.get('queryStringParameters') or {}).get('action') == 'telegram_link':
+            return create_telegram_link(user_id)
         else:
             return {
                 'statusCode': 405,
@@ -76,16 +271,12 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': json.dumps({'error': str(e)})
         }
 
-def get_profile(user_id: int) -> Dict[str, Any]:
-    conn = get_db_connection()
+def get_profile(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
+    conn = get_read_connection(event.get('headers', {}))
     cur = conn.cursor()
     
     try:
-        cur.execute(
-            """SELECT id, email, username, avatar_url, bio, telegram_chat_id, created_at 
-               FROM users WHERE id = %s""",
-            (user_id,)
-        )
+        execute_query(cur, 'profile_by_user', (user_id,))
         user = cur.fetchone()
         
         if not user:
@@ -95,17 +286,8 @@ def get_profile(user_id: int) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'User not found'})
             }
         
-        cur.execute(
-            "SELECT COUNT(*) FROM goals WHERE user_id = %s AND status != 'deleted'",
-            (user_id,)
-        )
-        total_goals = cur.fetchone()[0]
-        
-        cur.execute(
-            "SELECT COUNT(*) FROM goals WHERE user_id = %s AND status = 'completed'",
-            (user_id,)
-        )
-        completed_goals = cur.fetchone()[0]
+        execute_query(cur, 'goal_stats_by_user', (user_id,))
+        total_goals, completed_goals = cur.fetchone()
         
         return {
             'statusCode': 200,
@@ -128,11 +310,19 @@ def get_profile(user_id: int) -> Dict[str, Any]:
         }
     finally:
         cur.close()
-        conn.close()
+        release_connection(conn)
 
 def update_profile(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
     body = json.loads(event.get('body', '{}'))
     
+    # A chat is linked only through the bot's /start deep link, which proves the user owns it; PUT can only unlink
+    if body.get('telegramChatId') is not None:
+        return {
+            'statusCode': 400,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'error': 'telegramChatId can only be set to null; link a chat through the bot'})
+        }
+    
     conn = get_db_connection()
     cur = conn.cursor()
     
@@ -150,8 +340,7 @@ def update_profile(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
             update_fields.append('avatar_url = %s')
             params.append(body['avatarUrl'])
         if 'telegramChatId' in body:
-            update_fields.append('telegram_chat_id = %s')
-            params.append(body['telegramChatId'])
+            update_fields.append('telegram_chat_id = NULL')
         
         if not update_fields:
             return {
@@ -163,15 +352,16 @@ def update_profile(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
         update_fields.append('updated_at = CURRENT_TIMESTAMP')
         params.append(user_id)
         
-        query = f"UPDATE users SET {', '.join(update_fields)} WHERE id = %s RETURNING id, email, username, avatar_url, bio, telegram_chat_id, created_at"
+        query = f"UPDATE t_p59845625_taskbuddy_project.users SET {', '.join(update_fields)} WHERE id = %s RETURNING id, email, username, avatar_url, bio, telegram_chat_id, created_at, {WRITE_LSN}"
         
         cur.execute(query, params)
-        user = cur.fetchone()
+        user, lsn = split_write_lsn(cur.fetchone())
         conn.commit()
+        write_headers = get_write_headers(lsn)
         
         return {
             'statusCode': 200,
-            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*', **write_headers},
             'body': json.dumps({
                 'profile': {
                     'id': user[0],
@@ -186,4 +376,37 @@ def update_profile(event: Dict[str, Any], user_id: int) -> Dict[str, Any]:
         }
     finally:
         cur.close()
-        conn.close()
\ No newline at end of file
+        release_connection(conn)
+
+
+def create_telegram_link(user_id: int) -> Dict[str, Any]:
+    """Issue a single-use token for the bot's /start deep link, replacing any earlier unused one"""
+    # '<user_id>-' routes /start to the user's shard; with token_urlsafe(24) (32 chars from [A-Za-z0-9_-])
+    # it stays within Telegram's 64-char start parameter limit
+    token = f'{user_id}-{secrets.token_urlsafe(24)}'
+    
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """WITH stale AS (
+                   DELETE FROM t_p59845625_taskbuddy_project.telegram_link_tokens 
+                   WHERE user_id = %(user_id)s
+               )
+               INSERT INTO t_p59845625_taskbuddy_project.telegram_link_tokens (token, user_id, expires_at) 
+               VALUES (%(token)s, %(user_id)s, CURRENT_TIMESTAMP + make_interval(mins => %(ttl)s)) 
+               RETURNING expires_at""",
+            {'token': token, 'user_id': user_id, 'ttl': TELEGRAM_LINK_TTL_MINUTES}
+        )
+        expires_at = cur.fetchone()[0]
+        conn.commit()
+        
+        return {
+            'statusCode': 201,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({'token': token, 'expiresAt': expires_at.isoformat()})
+        }
+    finally:
+        cur.close()
+        release_connection(conn)
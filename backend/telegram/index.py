@@ -5,25 +5,195 @@ Args: event - dict with httpMethod, body, queryStringParameters
 Returns: HTTP response dict
 '''
 
+import hmac
+import html
 import json
 import os
+import threading
+import time
 import psycopg2
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List, Tuple
 
-def get_db_connection():
-    dsn = os.environ.get('DATABASE_URL')
+MAX_UPDATE_ATTEMPTS = 5
+
+COMMAND_BUDGET_MS = int(os.environ.get('TELEGRAM_COMMAND_BUDGET_MS', '1500'))
+
+COMMAND_METRICS: Dict[str, Dict[str, Any]] = {}
+COMMAND_METRICS_LOCK = threading.Lock()
+
+HELP_TEXT = ('<b>🤖 Команды TaskBuddy</b>\n\n'
+             '/today — задачи на сегодня\n'
+             '/list — активные задачи\n'
+             '/overdue — просроченные задачи\n'
+             '/done &lt;номер&gt; — отметить задачу выполненной')
+
+NOT_LINKED_TEXT = 'Telegram не подключен к аккаунту. Используйте ссылку из настроек профиля.'
+
+MOVING_TEXT = 'Аккаунт переносится на другой сервер, повторите команду через минуту.'
+
+# Goal lists start from users so an unlinked chat (no rows) differs from an empty list (one NULL row)
+GOAL_LIST_QUERY_TEMPLATE = """SELECT g.id, g.title, g.end_date 
+    FROM t_p59845625_taskbuddy_project.users u 
+    LEFT JOIN t_p59845625_taskbuddy_project.goals g 
+        ON g.user_id = u.id AND g.status NOT IN ('completed', 'deleted') {condition} 
+    WHERE u.telegram_chat_id = %s 
+    ORDER BY g.end_date NULLS LAST, g.id 
+    LIMIT 20"""
+
+LIST_GOALS_QUERY = GOAL_LIST_QUERY_TEMPLATE.format(condition='')
+TODAY_GOALS_QUERY = GOAL_LIST_QUERY_TEMPLATE.format(condition='AND g.end_date = CURRENT_DATE')
+OVERDUE_GOALS_QUERY = GOAL_LIST_QUERY_TEMPLATE.format(condition='AND g.end_date < CURRENT_DATE')
+
+COMPLETE_GOAL_QUERY = """WITH target AS (
+        SELECT g.id, g.user_id, g.status AS old_status 
+        FROM t_p59845625_taskbuddy_project.goals g 
+        JOIN t_p59845625_taskbuddy_project.users u ON u.id = g.user_id 
+        WHERE u.telegram_chat_id = %(chat_id)s AND g.id = %(goal_id)s AND g.status != 'deleted' 
+        FOR UPDATE OF g
+    ), updated AS (
+        UPDATE t_p59845625_taskbuddy_project.goals g 
+        SET status = 'completed', completed_at = CURRENT_TIMESTAMP, updated_at = CURRENT_TIMESTAMP 
+        FROM target WHERE g.id = target.id AND target.old_status IS DISTINCT FROM 'completed' 
+        RETURNING g.id, g.user_id, g.title, target.old_status
+    ), history AS (
+        INSERT INTO t_p59845625_taskbuddy_project.goal_events (goal_id, user_id, actor_id, kind, diff) 
+        SELECT id, user_id, user_id, 'updated', jsonb_build_object('status', jsonb_build_array(old_status, 'completed')) 
+        FROM updated
+    ), cache AS (
+        DELETE FROM t_p59845625_taskbuddy_project.user_analytics_cache c 
+        USING updated WHERE c.user_id = updated.user_id
+    ), activity AS (
+        INSERT INTO t_p59845625_taskbuddy_project.goal_activity_daily (user_id, day, completed) 
+        SELECT user_id, CURRENT_DATE, 1 FROM updated 
+        ON CONFLICT (user_id, day) DO UPDATE SET completed = goal_activity_daily.completed + 1
+    ), notification AS (
+        INSERT INTO t_p59845625_taskbuddy_project.notifications (user_id, title, message, type, is_read) 
+        SELECT user_id, 'Задача выполнена!', 'Вы завершили задачу "' || title || '"', 'task_completed', FALSE 
+        FROM updated
+    )
+    SELECT target.id, g.title, target.old_status 
+    FROM target JOIN t_p59845625_taskbuddy_project.goals g ON g.id = target.id"""
+
+# Redeems a single-use link token issued by the profile page; the chat moves off any account it was linked to before
+LINK_CHAT_QUERY = """WITH link AS (
+        UPDATE t_p59845625_taskbuddy_project.telegram_link_tokens 
+        SET used_at = CURRENT_TIMESTAMP 
+        WHERE token = %(token)s AND used_at IS NULL AND expires_at > CURRENT_TIMESTAMP 
+        RETURNING user_id
+    ), unlinked AS (
+        UPDATE t_p59845625_taskbuddy_project.users u 
+        SET telegram_chat_id = NULL 
+        FROM link WHERE u.telegram_chat_id = %(chat_id)s AND u.id != link.user_id
+    )
+    UPDATE t_p59845625_taskbuddy_project.users u 
+    SET telegram_chat_id = %(chat_id)s 
+    FROM link WHERE u.id = link.user_id 
+    RETURNING u.id"""
+
+def get_db_connection(statement_timeout_ms: Optional[int] = None, dsn: Optional[str] = None):
+    dsn = dsn or os.environ.get('DATABASE_URL')
+    if statement_timeout_ms:
+        return psycopg2.connect(dsn, options=f'-c statement_timeout={statement_timeout_ms}')
     return psycopg2.connect(dsn)
 
+def get_shard_dsns() -> List[str]:
+    """Primaries holding disjoint sets of users, indexed by user_shards.shard; unset, DATABASE_URL is the only shard"""
+    dsns = [dsn.strip() for dsn in os.environ.get('SHARD_DSNS', '').split(',') if dsn.strip()]
+    return dsns or [os.environ.get('DATABASE_URL')]
+
+def open_shard_connections(conn) -> List[Any]:
+    """One connection per shard for a batch; a shard on DATABASE_URL reuses the inbox connection,
+    so its updates still commit together with their 'done' mark"""
+    return [conn if dsn == os.environ.get('DATABASE_URL') else get_db_connection(COMMAND_BUDGET_MS, dsn)
+            for dsn in get_shard_dsns()]
+
+def user_shard(cur, user_id: int) -> Tuple[int, bool]:
+    """(shard, moving) from the user_shards directory; cur is on DATABASE_URL"""
+    cur.execute("SELECT shard, moving FROM t_p59845625_taskbuddy_project.user_shards WHERE user_id = %s", (user_id,))
+    return cur.fetchone() or (0, False)
+
+def update_shard(cur, shards: List[Any], update: Dict[str, Any]) -> Tuple[int, bool]:
+    """Shard of the account an update acts on: /start tokens start with the user id, other commands find the chat"""
+    if len(shards) == 1:
+        return 0, False
+    
+    message = update.get('message', {})
+    chat_id = message.get('chat', {}).get('id')
+    parts = (message.get('text') or '').split()
+    
+    if len(parts) > 1 and parts[0].split('@')[0].lower() == '/start':
+        user_id, dash, _ = parts[1].partition('-')
+        return user_shard(cur, int(user_id)) if dash and user_id.isdigit() else (0, False)
+    
+    for shard_conn in shards:
+        shard_cur = shard_conn.cursor()
+        try:
+            shard_cur.execute("SELECT id FROM t_p59845625_taskbuddy_project.users WHERE telegram_chat_id = %s", (chat_id,))
+            row = shard_cur.fetchone()
+        finally:
+            shard_cur.close()
+        if shard_conn is not cur.connection:
+            shard_conn.rollback()
+        if row:
+            return user_shard(cur, row[0])
+    return 0, False
+
+def unlink_chat_elsewhere(shards: List[Any], shard: int, update: Dict[str, Any]):
+    """After a /start the chat belongs to one account; LINK_CHAT_QUERY unlinks it on its own shard only"""
+    message = update.get('message', {})
+    if len(shards) == 1 or not (message.get('text') or '').startswith('/start'):
+        return
+    
+    chat_id = message.get('chat', {}).get('id')
+    cur = shards[shard].cursor()
+    try:
+        cur.execute("SELECT 1 FROM t_p59845625_taskbuddy_project.users WHERE telegram_chat_id = %s", (chat_id,))
+        linked = cur.fetchone()
+    finally:
+        cur.close()
+    if not linked:
+        return
+    
+    for index, shard_conn in enumerate(shards):
+        if index == shard:
+            continue
+        cur = shard_conn.cursor()
+        try:
+            cur.execute(
+                "UPDATE t_p59845625_taskbuddy_project.users SET telegram_chat_id = NULL WHERE telegram_chat_id = %s",
+                (chat_id,)
+            )
+        finally:
+            cur.close()
+        shard_conn.commit()
+
+def is_worker_request(event: Dict[str, Any]) -> bool:
+    """?action=process is for the cron job only, it must present TELEGRAM_WORKER_SECRET"""
+    secret = os.environ.get('TELEGRAM_WORKER_SECRET', '')
+    headers = event.get('headers', {}) or {}
+    presented = headers.get('X-Worker-Secret', '') or headers.get('x-worker-secret', '')
+    return bool(secret) and hmac.compare_digest(presented.encode(), secret.encode())
+
+def is_telegram_request(event: Dict[str, Any]) -> bool:
+    """Webhook updates must carry the secret_token passed to setWebhook, Telegram echoes it in every call"""
+    secret = os.environ.get('TELEGRAM_WEBHOOK_SECRET', '')
+    headers = event.get('headers', {}) or {}
+    presented = headers.get('X-Telegram-Bot-Api-Secret-Token', '') or headers.get('x-telegram-bot-api-secret-token', '')
+    return bool(secret) and hmac.compare_digest(presented.encode(), secret.encode())
+
 def get_bot_token() -> str:
     return os.environ.get('TELEGRAM_BOT_TOKEN', '')
 
+def get_api_url() -> str:
+    return os.environ.get('TELEGRAM_API_URL', 'https://api.telegram.org').rstrip('/')
+
 def send_telegram_message(chat_id: int, text: str) -> bool:
     bot_token = get_bot_token()
     if not bot_token:
         return False
     
-    url = f'https://api.telegram.org/bot{bot_token}/sendMessage'
+    url = f'{get_api_url()}/bot{bot_token}/sendMessage'
     data = {
         'chat_id': chat_id,
         'text': text,
@@ -51,15 +221,32 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': ''
         }
     
+    action = (event.get('queryStringParameters') or {}).get('action', '')
+    
     try:
-        if method == 'POST':
+        if action == 'process':
+            if not is_worker_request(event):
+                return {
+                    'statusCode': 401,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Unauthorized'})
+                }
+            return process_pending_updates(event)
+        elif method == 'POST':
+            if not is_telegram_request(event):
+                return {
+                    'statusCode': 401,
+                    'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+                    'body': json.dumps({'error': 'Unauthorized'})
+                }
+            
             body_str = event.get('body', '{}')
             if body_str:
                 body = json.loads(body_str)
             else:
                 body = {}
             
-            if 'message' in body:
+            if 'update_id' in body:
                 return handle_webhook(body)
             else:
                 return {
@@ -81,49 +268,277 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         }
 
 def handle_webhook(update: Dict[str, Any]) -> Dict[str, Any]:
-    message = update.get('message', {})
-    chat_id = message.get('chat', {}).get('id')
-    text = message.get('text', '')
+    """Persist the raw update keyed by update_id and acknowledge, processing happens in process_pending_updates"""
+    update_id = update.get('update_id')
     
-    if not chat_id:
+    if update_id is None:
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
             'body': json.dumps({'ok': True})
         }
     
-    if text.startswith('/start'):
-        conn = get_db_connection()
-        cur = conn.cursor()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute(
+            """INSERT INTO t_p59845625_taskbuddy_project.telegram_updates (update_id, payload) 
+               VALUES (%s, %s) ON CONFLICT (update_id) DO NOTHING""",
+            (update_id, json.dumps(update))
+        )
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({'ok': True})
+    }
+
+def process_pending_updates(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Worker entry point: claim a batch of stored updates and run them through process_update"""
+    query_params = event.get('queryStringParameters', {})
+    
+    try:
+        batch_size = max(1, min(int(query_params.get('batch', 100)), 1000))
+    except (TypeError, ValueError):
+        batch_size = 100
+    
+    conn = get_db_connection(COMMAND_BUDGET_MS)
+    cur = conn.cursor()
+    shards = open_shard_connections(conn)
+    
+    try:
+        cur.execute(
+            """UPDATE t_p59845625_taskbuddy_project.telegram_updates 
+               SET status = 'processing', attempts = attempts + 1, claimed_at = CURRENT_TIMESTAMP 
+               WHERE update_id IN (
+                   SELECT update_id FROM t_p59845625_taskbuddy_project.telegram_updates 
+                   WHERE status = 'pending' 
+                      OR (status = 'processing' AND claimed_at < CURRENT_TIMESTAMP - INTERVAL '5 minutes') 
+                   ORDER BY update_id 
+                   LIMIT %s 
+                   FOR UPDATE SKIP LOCKED
+               ) 
+               RETURNING update_id, payload""",
+            (batch_size,)
+        )
+        claimed = sorted(cur.fetchall())
+        conn.commit()
         
-        try:
-            parts = text.split()
-            if len(parts) > 1:
-                user_id = int(parts[1])
-                
+        processed = []
+        failed = []
+        
+        # Each update commits its side effects, its queued replies and its 'done' mark together,
+        # so a crash mid-batch never leaves a handled update to be reclaimed and replayed.
+        # On a shard other than DATABASE_URL the effects commit first; a crash before the inbox commit replays that one update
+        for update_id, payload in claimed:
+            work = conn
+            try:
+                shard, moving = update_shard(cur, shards, payload)
+                work = shards[shard]
+                work_cur = work.cursor()
+                try:
+                    process_update(work_cur, payload, moving)
+                finally:
+                    work_cur.close()
+                if work is not conn:
+                    work.commit()
+                unlink_chat_elsewhere(shards, shard, payload)
                 cur.execute(
-                    "UPDATE t_p59845625_taskbuddy_project.users SET telegram_chat_id = %s WHERE id = %s",
-                    (chat_id, user_id)
+                    """UPDATE t_p59845625_taskbuddy_project.telegram_updates 
+                       SET status = 'done', processed_at = CURRENT_TIMESTAMP 
+                       WHERE update_id = %s""",
+                    (update_id,)
                 )
                 conn.commit()
-                
-                send_telegram_message(
-                    chat_id,
-                    '<b>✅ Telegram успешно подключен!</b>\n\n'
-                    'Теперь вы будете получать уведомления о ваших задачах прямо в Telegram.'
-                )
-            else:
-                send_telegram_message(
-                    chat_id,
-                    '<b>👋 Добро пожаловать в TaskBuddy Bot!</b>\n\n'
-                    'Для подключения уведомлений используйте ссылку из настроек профиля.'
+                processed.append(update_id)
+            except Exception as e:
+                if work is not conn:
+                    work.rollback()
+                conn.rollback()
+                cur.execute(
+                    """UPDATE t_p59845625_taskbuddy_project.telegram_updates 
+                       SET status = CASE WHEN attempts >= %s THEN 'failed' ELSE 'pending' END, last_error = %s 
+                       WHERE update_id = %s""",
+                    (MAX_UPDATE_ATTEMPTS, str(e), update_id)
                 )
-        finally:
-            cur.close()
-            conn.close()
+                conn.commit()
+                failed.append(update_id)
+        
+        outbox_sent = outbox_failed = 0
+        for shard_conn in shards:
+            shard_cur = shard_conn.cursor()
+            try:
+                sent, failed_sends = deliver_outbox(shard_conn, shard_cur, batch_size)
+            finally:
+                shard_cur.close()
+            outbox_sent += sent
+            outbox_failed += failed_sends
+        
+        return {
+            'statusCode': 200,
+            'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+            'body': json.dumps({
+                'success': True,
+                'processed': len(processed),
+                'failed': len(failed),
+                'outboxSent': outbox_sent,
+                'outboxFailed': outbox_failed,
+                'metrics': COMMAND_METRICS
+            })
+        }
+    finally:
+        cur.close()
+        for shard_conn in shards:
+            if shard_conn is not conn:
+                shard_conn.close()
+        conn.close()
+
+def deliver_outbox(conn, cur, batch_size: int):
+    """Send a batch of queued fan-out messages; claimed rows are locked, so concurrent workers split the queue"""
+    cur.execute(
+        """SELECT id, chat_id, message FROM t_p59845625_taskbuddy_project.telegram_outbox 
+           WHERE status = 'pending' 
+           ORDER BY id 
+           LIMIT %s 
+           FOR UPDATE SKIP LOCKED""",
+        (batch_size,)
+    )
+    claimed = cur.fetchall()
     
-    return {
-        'statusCode': 200,
-        'headers': {'Content-Type': 'application/json'},
-        'body': json.dumps({'ok': True})
-    }
\ No newline at end of file
+    sent = []
+    failed = []
+    for message_id, chat_id, text in claimed:
+        (sent if send_telegram_message(chat_id, text) else failed).append(message_id)
+    
+    if sent:
+        cur.execute(
+            """UPDATE t_p59845625_taskbuddy_project.telegram_outbox 
+               SET status = 'sent', attempts = attempts + 1, sent_at = CURRENT_TIMESTAMP 
+               WHERE id = ANY(%s)""",
+            (sent,)
+        )
+    if failed:
+        cur.execute(
+            """UPDATE t_p59845625_taskbuddy_project.telegram_outbox 
+               SET attempts = attempts + 1, status = CASE WHEN attempts + 1 >= %s THEN 'failed' ELSE 'pending' END 
+               WHERE id = ANY(%s)""",
+            (MAX_UPDATE_ATTEMPTS, failed)
+        )
+    conn.commit()
+    
+    return len(sent), len(failed)
+
+def process_update(cur, update: Dict[str, Any], moving: bool = False):
+    message = update.get('message', {})
+    chat_id = message.get('chat', {}).get('id')
+    text = message.get('text', '')
+    
+    if not chat_id or not text.startswith('/'):
+        return
+    
+    # tools/rebalance_shards.py is copying the account; a change made on the old shard now would be lost
+    if moving:
+        queue_reply(cur, chat_id, MOVING_TEXT)
+        return
+    
+    parts = text.split()
+    command = parts[0].split('@')[0].lower()
+    command_handler = COMMANDS.get(command)
+    
+    if not command_handler:
+        queue_reply(cur, chat_id, HELP_TEXT)
+        return
+    
+    started = time.perf_counter()
+    ok = False
+    try:
+        reply = command_handler(cur, chat_id, parts[1:])
+        ok = True
+    finally:
+        record_command_metric(command, (time.perf_counter() - started) * 1000, ok)
+    
+    queue_reply(cur, chat_id, reply)
+
+def queue_reply(cur, chat_id: int, text: str):
+    """Replies go through the outbox in the update's transaction and are sent by deliver_outbox after it commits"""
+    cur.execute(
+        "INSERT INTO t_p59845625_taskbuddy_project.telegram_outbox (chat_id, message) VALUES (%s, %s)",
+        (chat_id, text)
+    )
+
+def record_command_metric(command: str, elapsed_ms: float, ok: bool):
+    with COMMAND_METRICS_LOCK:
+        metric = COMMAND_METRICS.setdefault(command, {'count': 0, 'errors': 0, 'overBudget': 0, 'totalMs': 0.0, 'maxMs': 0.0})
+        metric['count'] += 1
+        metric['totalMs'] += elapsed_ms
+        metric['maxMs'] = max(metric['maxMs'], elapsed_ms)
+        if not ok:
+            metric['errors'] += 1
+        if elapsed_ms > COMMAND_BUDGET_MS:
+            metric['overBudget'] += 1
+
+def format_goal_list(rows, empty_text: str) -> str:
+    if not rows:
+        return NOT_LINKED_TEXT
+    
+    goals = [row for row in rows if row[0] is not None]
+    if not goals:
+        return empty_text
+    
+    lines = []
+    for goal_id, title, end_date in goals:
+        deadline = f' — до {end_date.strftime("%d.%m")}' if end_date else ''
+        lines.append(f'#{goal_id} {html.escape(title)}{deadline}')
+    return '\n'.join(lines)
+
+def command_start(cur, chat_id: int, args: List[str]) -> str:
+    if not args:
+        return ('<b>👋 Добро пожаловать в TaskBuddy Bot!</b>\n\n'
+                'Для подключения уведомлений используйте ссылку из настроек профиля.')
+    
+    cur.execute(LINK_CHAT_QUERY, {'token': args[0], 'chat_id': chat_id})
+    if not cur.fetchone():
+        return ('Ссылка для подключения недействительна или устарела.\n\n'
+                'Откройте настройки профиля и нажмите «Подключить Telegram» ещё раз.')
+    
+    return ('<b>✅ Telegram успешно подключен!</b>\n\n'
+            'Теперь вы будете получать уведомления о ваших задачах прямо в Telegram.')
+
+def command_list(cur, chat_id: int, args: List[str]) -> str:
+    cur.execute(LIST_GOALS_QUERY, (chat_id,))
+    return '<b>📋 Активные задачи</b>\n\n' + format_goal_list(cur.fetchall(), 'Активных задач нет 🎉')
+
+def command_today(cur, chat_id: int, args: List[str]) -> str:
+    cur.execute(TODAY_GOALS_QUERY, (chat_id,))
+    return '<b>📅 Задачи на сегодня</b>\n\n' + format_goal_list(cur.fetchall(), 'На сегодня задач нет')
+
+def command_overdue(cur, chat_id: int, args: List[str]) -> str:
+    cur.execute(OVERDUE_GOALS_QUERY, (chat_id,))
+    return '<b>⏰ Просроченные задачи</b>\n\n' + format_goal_list(cur.fetchall(), 'Просроченных задач нет 👍')
+
+def command_done(cur, chat_id: int, args: List[str]) -> str:
+    goal_id = args[0].lstrip('#') if args else ''
+    if not goal_id.isdigit():
+        return 'Укажите номер задачи: /done 42'
+    
+    cur.execute(COMPLETE_GOAL_QUERY, {'chat_id': chat_id, 'goal_id': int(goal_id)})
+    row = cur.fetchone()
+    
+    if not row:
+        return 'Задача не найдена'
+    if row[2] == 'completed':
+        return f'Задача <b>{html.escape(row[1])}</b> уже выполнена'
+    return f'✅ <b>Задача выполнена!</b>\n\n🎉 Поздравляем! Вы завершили: <b>{html.escape(row[1])}</b>'
+
+COMMANDS = {
+    '/start': command_start,
+    '/list': command_list,
+    '/today': command_today,
+    '/overdue': command_overdue,
+    '/done': command_done
+}
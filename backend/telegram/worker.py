@@ -0,0 +1,113 @@
+'''
+Business: Long-polling Telegram worker, alternative to the webhook function
+Args: command line flags --workers, --poll-timeout, --batch, --once, --delete-webhook
+Returns: runs until interrupted, processing updates through the same handlers as the webhook
+'''
+
+import argparse
+import json
+import logging
+import math
+import sys
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List
+from psycopg2.extras import execute_values
+
+from index import get_api_url, get_bot_token, get_db_connection, process_pending_updates
+
+logger = logging.getLogger('telegram.worker')
+
+def call_api(method: str, params: Dict[str, Any], timeout: float) -> Any:
+    url = f'{get_api_url()}/bot{get_bot_token()}/{method}'
+    response = requests.post(url, json=params, timeout=timeout)
+    response.raise_for_status()
+    data = response.json()
+    if not data.get('ok'):
+        raise RuntimeError(f'Telegram API {method} failed: {data.get("description")}')
+    return data.get('result')
+
+def load_offset() -> int:
+    """Resume after the newest update already stored in the inbox"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        cur.execute("SELECT COALESCE(MAX(update_id) + 1, 0) FROM t_p59845625_taskbuddy_project.telegram_updates")
+        return cur.fetchone()[0]
+    finally:
+        cur.close()
+        conn.close()
+
+def store_updates(updates: List[Dict[str, Any]]):
+    """Insert a fetched batch into the inbox in one statement, duplicates are dropped by update_id"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    
+    try:
+        execute_values(
+            cur,
+            """INSERT INTO t_p59845625_taskbuddy_project.telegram_updates (update_id, payload) 
+               VALUES %s ON CONFLICT (update_id) DO NOTHING""",
+            [(update['update_id'], json.dumps(update)) for update in updates]
+        )
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+
+def process_stored(pool: ThreadPoolExecutor, workers: int, pending: int):
+    """Drain the inbox concurrently, SKIP LOCKED claims give each worker a disjoint slice"""
+    share = max(1, math.ceil(pending / workers))
+    event = {'queryStringParameters': {'batch': str(share)}}
+    list(pool.map(lambda _: process_pending_updates(event), range(workers)))
+
+def run(workers: int, poll_timeout: int, batch: int, once: bool):
+    offset = load_offset()
+    
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            try:
+                updates = call_api('getUpdates', {
+                    'offset': offset,
+                    'limit': batch,
+                    'timeout': poll_timeout,
+                    'allowed_updates': ['message']
+                }, timeout=poll_timeout + 10)
+            except (requests.RequestException, RuntimeError) as e:
+                if once:
+                    raise
+                logger.warning('getUpdates failed, retrying: %s', e)
+                time.sleep(3)
+                continue
+            
+            if updates:
+                store_updates(updates)
+                offset = max(update['update_id'] for update in updates) + 1
+                process_stored(pool, workers, len(updates))
+            
+            if once:
+                break
+
+def main():
+    parser = argparse.ArgumentParser(description='TaskBuddy Telegram long-polling worker')
+    parser.add_argument('--workers', type=int, default=4, help='concurrent update processors')
+    parser.add_argument('--poll-timeout', type=int, default=25, help='getUpdates long-poll timeout, seconds')
+    parser.add_argument('--batch', type=int, default=100, help='max updates per getUpdates call')
+    parser.add_argument('--once', action='store_true', help='process a single getUpdates batch and exit, non-zero if it fails')
+    parser.add_argument('--delete-webhook', action='store_true', help='remove the webhook, getUpdates is refused while one is set')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    
+    try:
+        if args.delete_webhook:
+            call_api('deleteWebhook', {'drop_pending_updates': False}, timeout=10)
+        run(args.workers, args.poll_timeout, args.batch, args.once)
+    except (requests.RequestException, RuntimeError) as e:
+        # Only reachable with --once or from deleteWebhook, the polling loop itself retries forever
+        logger.error('Telegram API call failed: %s', e)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+-- Create per-user cache of dashboard analytics rollups
+CREATE TABLE IF NOT EXISTS user_analytics_cache (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    weeks INTEGER NOT NULL,
+    data JSONB NOT NULL,
+    computed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (user_id, weeks)
+);
@@ -0,0 +1,23 @@
+-- Create daily activity rollup for progress charts
+CREATE TABLE IF NOT EXISTS goal_activity_daily (
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    day DATE NOT NULL,
+    created INTEGER NOT NULL DEFAULT 0,
+    completed INTEGER NOT NULL DEFAULT 0,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, day)
+);
+
+-- Backfill rollup from existing goals
+INSERT INTO goal_activity_daily (user_id, day, created, completed, deleted)
+SELECT user_id, day, SUM(created), SUM(completed), SUM(deleted)
+FROM (
+    SELECT user_id, created_at::date AS day, 1 AS created, 0 AS completed, 0 AS deleted FROM goals
+    UNION ALL
+    SELECT user_id, updated_at::date, 0, 1, 0 FROM goals WHERE status = 'completed'
+    UNION ALL
+    SELECT user_id, updated_at::date, 0, 0, 1 FROM goals WHERE status = 'deleted'
+) a
+WHERE day IS NOT NULL
+GROUP BY user_id, day
+ON CONFLICT (user_id, day) DO NOTHING;
@@ -0,0 +1,12 @@
+-- Store recurrence rule once per goal
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS recurrence VARCHAR(20);
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS recurrence_interval INTEGER DEFAULT 1;
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS recurrence_until DATE;
+
+-- Only completed occurrences of recurring goals are persisted
+CREATE TABLE IF NOT EXISTS goal_occurrences (
+    goal_id INTEGER NOT NULL REFERENCES goals(id),
+    occurrence_date DATE NOT NULL,
+    completed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (goal_id, occurrence_date)
+);
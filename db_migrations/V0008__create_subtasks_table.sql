@@ -0,0 +1,16 @@
+-- Create subtasks (checklist items) under goals
+CREATE TABLE IF NOT EXISTS subtasks (
+    id SERIAL PRIMARY KEY,
+    goal_id INTEGER NOT NULL REFERENCES goals(id),
+    title VARCHAR(255) NOT NULL,
+    is_done BOOLEAN NOT NULL DEFAULT FALSE,
+    position INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_subtasks_goal_id ON subtasks(goal_id);
+
+-- Keep subtask counters on goals so progress is updated by deltas
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS subtasks_total INTEGER NOT NULL DEFAULT 0;
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS subtasks_done INTEGER NOT NULL DEFAULT 0;
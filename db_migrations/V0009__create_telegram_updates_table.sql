@@ -0,0 +1,14 @@
+-- Create inbox of raw Telegram updates, update_id dedupes webhook redeliveries
+CREATE TABLE IF NOT EXISTS telegram_updates (
+    update_id BIGINT PRIMARY KEY,
+    payload JSONB NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    last_error TEXT,
+    received_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    claimed_at TIMESTAMP,
+    processed_at TIMESTAMP
+);
+
+-- Create index for claiming unprocessed updates
+CREATE INDEX IF NOT EXISTS idx_telegram_updates_unprocessed ON telegram_updates(update_id) WHERE status IN ('pending', 'processing');
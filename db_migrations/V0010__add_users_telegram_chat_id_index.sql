@@ -0,0 +1,2 @@
+-- Create index for resolving bot chats to users
+CREATE INDEX IF NOT EXISTS idx_users_telegram_chat_id ON users(telegram_chat_id) WHERE telegram_chat_id IS NOT NULL;
@@ -0,0 +1,16 @@
+-- Drop indexes that duplicate UNIQUE constraints
+DROP INDEX IF EXISTS idx_users_email;
+DROP INDEX IF EXISTS idx_tokens_token;
+DROP INDEX IF EXISTS idx_user_settings_user_id;
+
+-- Drop bare boolean index, unread counts are always scoped by user
+DROP INDEX IF EXISTS idx_notifications_is_read;
+
+-- Goal lists are read per user newest first, status filters back stats and reminders
+CREATE INDEX IF NOT EXISTS idx_goals_user_created ON goals(user_id, created_at DESC);
+CREATE INDEX IF NOT EXISTS idx_goals_user_status ON goals(user_id, status);
+DROP INDEX IF EXISTS idx_goals_user_id;
+
+-- Notification feed is read per user newest first
+CREATE INDEX IF NOT EXISTS idx_notifications_user_created ON notifications(user_id, created_at DESC);
+DROP INDEX IF EXISTS idx_notifications_user_id;
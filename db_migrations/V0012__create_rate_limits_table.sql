@@ -0,0 +1,7 @@
+-- Create shared fixed-window request counters for rate limiting across function instances
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key VARCHAR(150) NOT NULL,
+    window_id BIGINT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (key, window_id)
+);
@@ -0,0 +1,12 @@
+-- Overdue sweeper finds open goals past their deadline by status, then end_date range
+CREATE INDEX IF NOT EXISTS idx_goals_status_end_date ON goals(status, end_date);
+
+-- Create single-row progress record of the overdue sweeper
+CREATE TABLE IF NOT EXISTS overdue_sweep_state (
+    id SMALLINT PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+    cutoff DATE NOT NULL,
+    goals_marked INTEGER NOT NULL DEFAULT 0,
+    users_notified INTEGER NOT NULL DEFAULT 0,
+    started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
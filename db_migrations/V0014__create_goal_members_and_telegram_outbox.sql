@@ -0,0 +1,34 @@
+-- Create membership of users in goals shared with them by the owner
+CREATE TABLE IF NOT EXISTS goal_members (
+    goal_id INTEGER NOT NULL REFERENCES goals(id),
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    role VARCHAR(20) NOT NULL DEFAULT 'editor',
+    added_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    -- Copy of goals.created_at (never updated) so the shared half is ordered by this table's own index
+    goal_created_at TIMESTAMP NOT NULL,
+    PRIMARY KEY (goal_id, user_id)
+);
+
+-- Shared half of the visible goals query is a keyset scan on the member's (goal_created_at, goal_id)
+CREATE INDEX IF NOT EXISTS idx_goal_members_user ON goal_members(user_id, goal_created_at DESC, goal_id DESC);
+
+-- Owned half of the visible goals query is a keyset scan on (created_at, id)
+CREATE INDEX IF NOT EXISTS idx_goals_user_created_id ON goals(user_id, created_at DESC, id DESC);
+DROP INDEX IF EXISTS idx_goals_user_created;
+
+-- Sharing looks the invitee up by case-insensitive email
+CREATE INDEX IF NOT EXISTS idx_users_lower_email ON users(lower(email));
+
+-- Create queue of Telegram messages fanned out by goal mutations, drained by the telegram worker
+CREATE TABLE IF NOT EXISTS telegram_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    chat_id BIGINT NOT NULL,
+    message TEXT NOT NULL,
+    status VARCHAR(20) DEFAULT 'pending',
+    attempts INTEGER DEFAULT 0,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    sent_at TIMESTAMP
+);
+
+-- Create index for claiming undelivered messages
+CREATE INDEX IF NOT EXISTS idx_telegram_outbox_pending ON telegram_outbox(id) WHERE status = 'pending';
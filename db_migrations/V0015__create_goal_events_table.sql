@@ -0,0 +1,61 @@
+-- Create append-only log of goal changes, diff holds only changed fields as {"column": [old, new]}
+CREATE TABLE IF NOT EXISTS goal_events (
+    id BIGSERIAL,
+    goal_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    actor_id INTEGER,
+    kind VARCHAR(20) NOT NULL,
+    diff JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (created_at);
+
+-- Time-range scans over whole months stay cheap with a BRIN summary instead of a btree
+CREATE INDEX IF NOT EXISTS idx_goal_events_created_brin ON goal_events USING BRIN (created_at);
+
+-- History API reads one owner's or one goal's events inside a time range
+CREATE INDEX IF NOT EXISTS idx_goal_events_user_created ON goal_events(user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_goal_events_goal_created ON goal_events(goal_id, created_at);
+
+-- Catches rows outside the prepared months so writes never fail
+CREATE TABLE IF NOT EXISTS goal_events_default PARTITION OF goal_events DEFAULT;
+
+-- Create monthly partitions named goal_events_yYYYYmMM from this month up to months_ahead
+CREATE OR REPLACE FUNCTION create_goal_events_partitions(months_ahead INTEGER) RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE;
+    created INTEGER := 0;
+BEGIN
+    FOR i IN 0..months_ahead LOOP
+        month_start := (date_trunc('month', CURRENT_DATE) + make_interval(months => i))::date;
+        IF to_regclass(format('goal_events_y%sm%s', to_char(month_start, 'YYYY'), to_char(month_start, 'MM'))) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF goal_events FOR VALUES FROM (%L) TO (%L)',
+                           format('goal_events_y%sm%s', to_char(month_start, 'YYYY'), to_char(month_start, 'MM')),
+                           month_start, (month_start + INTERVAL '1 month')::date);
+            created := created + 1;
+        END IF;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+-- Drop whole monthly partitions older than cutoff, no row-by-row DELETE
+CREATE OR REPLACE FUNCTION drop_goal_events_partitions_before(cutoff DATE) RETURNS INTEGER AS $$
+DECLARE
+    partition_name TEXT;
+    dropped INTEGER := 0;
+BEGIN
+    FOR partition_name IN
+        SELECT c.relname FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'goal_events'::regclass
+          AND c.relname ~ '^goal_events_y\d{4}m\d{2}$'
+          AND to_date(substring(c.relname FROM 14 FOR 4) || substring(c.relname FROM 19 FOR 2), 'YYYYMM') < date_trunc('month', cutoff)
+    LOOP
+        EXECUTE format('DROP TABLE %I', partition_name);
+        dropped := dropped + 1;
+    END LOOP;
+    RETURN dropped;
+END;
+$$ LANGUAGE plpgsql SET search_path FROM CURRENT;
+
+SELECT create_goal_events_partitions(12);
@@ -0,0 +1,11 @@
+-- Create single-use tokens proving a Telegram /start came from the account that opened the link
+CREATE TABLE IF NOT EXISTS telegram_link_tokens (
+    token VARCHAR(64) PRIMARY KEY,
+    user_id INTEGER NOT NULL REFERENCES users(id),
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    expires_at TIMESTAMP NOT NULL,
+    used_at TIMESTAMP
+);
+
+-- Create index for replacing a user's outstanding tokens when a new link is issued
+CREATE INDEX IF NOT EXISTS idx_telegram_link_tokens_user_id ON telegram_link_tokens(user_id);
@@ -0,0 +1,17 @@
+-- Create directory of which shard (index into SHARD_DSNS) holds each user, read on DATABASE_URL; user ids are allocated here
+CREATE TABLE IF NOT EXISTS user_shards (
+    user_id SERIAL PRIMARY KEY,
+    email VARCHAR(255) UNIQUE NOT NULL,
+    shard SMALLINT NOT NULL DEFAULT 0,
+    -- Set by tools/rebalance_shards.py while the user's rows are copied; handlers refuse the user's writes meanwhile
+    moving BOOLEAN NOT NULL DEFAULT FALSE,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Every existing user lives on the database this migration runs on, shard 0
+INSERT INTO user_shards (user_id, email, shard)
+SELECT id, lower(email), 0 FROM users
+ON CONFLICT DO NOTHING;
+
+-- Continue user ids after the existing users so registrations never reuse one
+SELECT setval(pg_get_serial_sequence('user_shards', 'user_id'), (SELECT COALESCE(MAX(user_id), 0) + 1 FROM user_shards), false);
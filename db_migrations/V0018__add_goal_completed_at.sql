@@ -0,0 +1,5 @@
+-- Record when a goal was completed; set while status is 'completed', cleared when it is reopened
+ALTER TABLE goals ADD COLUMN IF NOT EXISTS completed_at TIMESTAMP;
+
+-- Backfill completed goals with their last update, the best estimate the rows hold
+UPDATE goals SET completed_at = updated_at WHERE status = 'completed' AND completed_at IS NULL;
@@ -12,18 +12,42 @@ export interface Goal {
   progress: number;
   createdAt: string;
   updatedAt: string;
+  recurrence?: 'daily' | 'weekly' | 'monthly' | null;
+  recurrenceInterval?: number;
+  recurrenceUntil?: string | null;
+  subtasks?: Subtask[];
+  shared?: boolean;
+  role?: 'owner' | 'editor' | 'viewer';
+}
+
+export interface Subtask {
+  id: number;
+  goalId?: number;
+  title: string;
+  isDone: boolean;
+  position: number;
 }
 
 const getAuthHeaders = () => {
   const token = localStorage.getItem('token');
+  const lastWrite = localStorage.getItem('lastWrite');
   return {
     'Content-Type': 'application/json',
     'X-Auth-Token': token || '',
+    ...(lastWrite ? { 'X-Last-Write': lastWrite } : {}),
   };
 };
 
-export const getGoals = async (): Promise<Goal[]> => {
-  const response = await fetch(GOALS_API_URL, {
+const rememberLastWrite = (response: Response) => {
+  const lastWrite = response.headers.get('X-Last-Write');
+  if (lastWrite) {
+    localStorage.setItem('lastWrite', lastWrite);
+  }
+};
+
+export const getGoals = async (fields?: (keyof Goal)[]): Promise<Goal[]> => {
+  const url = fields?.length ? `${GOALS_API_URL}?fields=${fields.join(',')}` : GOALS_API_URL;
+  const response = await fetch(url, {
     method: 'GET',
     headers: getAuthHeaders(),
   });
@@ -47,11 +71,17 @@ export const createGoal = async (goal: Partial<Goal>): Promise<Goal> => {
     throw new Error('Ошибка создания цели');
   }
 
+  rememberLastWrite(response);
+
   const data = await response.json();
   return data.goal;
 };
 
 export const updateGoal = async (goal: Partial<Goal>): Promise<Goal> => {
+  if (goal.id !== undefined && goal.status !== undefined) {
+    await flushGoalProgress(goal.id);
+  }
+
   const response = await fetch(GOALS_API_URL, {
     method: 'PUT',
     headers: getAuthHeaders(),
@@ -62,10 +92,74 @@ export const updateGoal = async (goal: Partial<Goal>): Promise<Goal> => {
     throw new Error('Ошибка обновления цели');
   }
 
+  rememberLastWrite(response);
+
   const data = await response.json();
   return data.goal;
 };
 
+const PROGRESS_DEBOUNCE_MS = 300;
+const PROGRESS_MAX_DELAY_MS = 1000;
+
+interface PendingProgress {
+  progress: number;
+  firstQueuedAt: number;
+  timer: ReturnType<typeof setTimeout>;
+  waiters: { resolve: (goal: Goal) => void; reject: (error: unknown) => void }[];
+}
+
+const pendingProgress = new Map<number, PendingProgress>();
+const inFlightProgress = new Map<number, Promise<Goal>>();
+
+// Sends the latest queued progress for a goal; requests for one goal never overlap, so the last value wins
+export const flushGoalProgress = (id: number): Promise<void> => {
+  const pending = pendingProgress.get(id);
+  if (!pending) {
+    const inFlight = inFlightProgress.get(id);
+    return inFlight ? inFlight.then(() => undefined, () => undefined) : Promise.resolve();
+  }
+
+  clearTimeout(pending.timer);
+  pendingProgress.delete(id);
+
+  const previous = inFlightProgress.get(id) ?? Promise.resolve();
+  const request = previous
+    .catch(() => undefined)
+    .then(() => updateGoal({ id, progress: pending.progress }));
+  inFlightProgress.set(id, request);
+
+  request.then(
+    goal => pending.waiters.forEach(waiter => waiter.resolve(goal)),
+    error => pending.waiters.forEach(waiter => waiter.reject(error))
+  ).finally(() => {
+    if (inFlightProgress.get(id) === request) {
+      inFlightProgress.delete(id);
+    }
+  });
+
+  return request.then(() => undefined, () => undefined);
+};
+
+// Coalesces rapid slider changes into one PUT per goal, sent at most PROGRESS_MAX_DELAY_MS after the first change
+export const updateGoalProgress = (id: number, progress: number): Promise<Goal> =>
+  new Promise((resolve, reject) => {
+    const now = Date.now();
+    const pending = pendingProgress.get(id);
+    const firstQueuedAt = pending ? pending.firstQueuedAt : now;
+
+    if (pending) {
+      clearTimeout(pending.timer);
+    }
+
+    const delay = Math.max(0, Math.min(PROGRESS_DEBOUNCE_MS, firstQueuedAt + PROGRESS_MAX_DELAY_MS - now));
+    pendingProgress.set(id, {
+      progress,
+      firstQueuedAt,
+      timer: setTimeout(() => flushGoalProgress(id), delay),
+      waiters: [...(pending?.waiters ?? []), { resolve, reject }],
+    });
+  });
+
 export const deleteGoal = async (id: number): Promise<void> => {
   const response = await fetch(`${GOALS_API_URL}?id=${id}`, {
     method: 'DELETE',
@@ -75,4 +169,195 @@ export const deleteGoal = async (id: number): Promise<void> => {
   if (!response.ok) {
     throw new Error('Ошибка удаления цели');
   }
+
+  rememberLastWrite(response);
+};
+
+export interface GoalAnalytics {
+  weeks: number;
+  totalGoals: number;
+  completedGoals: number;
+  completionRate: number;
+  overdueGoals: number;
+  byCategory: Record<string, { total: number; completed: number }>;
+  byPriority: Record<string, { total: number; completed: number }>;
+  completionsPerDay: { date: string; count: number }[];
+}
+
+export const getGoalAnalytics = async (weeks = 4): Promise<GoalAnalytics> => {
+  const response = await fetch(`${GOALS_API_URL}?action=analytics&weeks=${weeks}`, {
+    method: 'GET',
+    headers: getAuthHeaders(),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка загрузки статистики');
+  }
+
+  const data = await response.json();
+  return data.analytics;
+};
+
+export interface GoalActivityDay {
+  date: string;
+  created: number;
+  completed: number;
+  deleted: number;
+}
+
+export const getGoalActivity = async (from?: string, to?: string): Promise<GoalActivityDay[]> => {
+  const params = new URLSearchParams({ action: 'activity' });
+  if (from) params.set('from', from);
+  if (to) params.set('to', to);
+
+  const response = await fetch(`${GOALS_API_URL}?${params.toString()}`, {
+    method: 'GET',
+    headers: getAuthHeaders(),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка загрузки активности');
+  }
+
+  const data = await response.json();
+  return data.activity;
+};
+
+// Large exports arrive in pages linked by X-Export-Cursor; the bodies concatenate into one file
+export const exportGoalData = async (format: 'jsonl' | 'csv' = 'jsonl', compress = false): Promise<Blob> => {
+  const parts: Blob[] = [];
+  let cursor: string | null = null;
+  let type = '';
+
+  do {
+    const params = new URLSearchParams({ action: 'export', format });
+    if (compress) params.set('gzip', '1');
+    if (cursor) params.set('cursor', cursor);
+
+    const response = await fetch(`${GOALS_API_URL}?${params.toString()}`, {
+      method: 'GET',
+      headers: getAuthHeaders(),
+    });
+
+    if (!response.ok) {
+      throw new Error('Ошибка экспорта данных');
+    }
+
+    type = response.headers.get('Content-Type') || type;
+    parts.push(await response.blob());
+    cursor = response.headers.get('X-Export-Cursor');
+  } while (cursor);
+
+  return new Blob(parts, { type });
+};
+
+export interface GoalImportResult {
+  imported: number;
+  duplicates: number;
+  invalid: number;
+  errors: { row: number; error: string }[];
+}
+
+export const importGoals = async (content: string, format: 'csv' | 'json' | 'jsonl' = 'csv'): Promise<GoalImportResult> => {
+  const params = new URLSearchParams({ action: 'import', format });
+
+  const response = await fetch(`${GOALS_API_URL}?${params.toString()}`, {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: content,
+  });
+
+  if (!response.ok) {
+    const data = await response.json().catch(() => ({}));
+    throw new Error(data.error || 'Ошибка импорта задач');
+  }
+
+  rememberLastWrite(response);
+
+  return response.json();
+};
+
+export interface GoalPage {
+  goals: Goal[];
+  nextCursor: string | null;
+}
+
+export const getVisibleGoals = async (cursor?: string | null, limit = 50): Promise<GoalPage> => {
+  const params = new URLSearchParams({ action: 'visible', limit: String(limit) });
+  if (cursor) params.set('cursor', cursor);
+
+  const response = await fetch(`${GOALS_API_URL}?${params.toString()}`, {
+    method: 'GET',
+    headers: getAuthHeaders(),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка загрузки целей');
+  }
+
+  return response.json();
+};
+
+export const shareGoal = async (goalId: number, email: string, role: 'editor' | 'viewer' = 'editor'): Promise<void> => {
+  const response = await fetch(`${GOALS_API_URL}?action=members`, {
+    method: 'POST',
+    headers: getAuthHeaders(),
+    body: JSON.stringify({ goalId, email, role }),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка при открытии доступа к задаче');
+  }
+
+  rememberLastWrite(response);
+};
+
+export const removeGoalMember = async (goalId: number, userId: number): Promise<void> => {
+  const params = new URLSearchParams({ action: 'members', goalId: String(goalId), userId: String(userId) });
+
+  const response = await fetch(`${GOALS_API_URL}?${params.toString()}`, {
+    method: 'DELETE',
+    headers: getAuthHeaders(),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка при удалении участника');
+  }
+
+  rememberLastWrite(response);
+};
+
+export interface GoalEvent {
+  id: number;
+  goalId: number;
+  actorId: number | null;
+  kind: 'created' | 'updated' | 'deleted' | 'imported' | 'overdue' | 'reopened';
+  changes: Record<string, [unknown, unknown] | unknown>;
+  createdAt: string;
+}
+
+export interface GoalHistoryPage {
+  events: GoalEvent[];
+  nextCursor: string | null;
+}
+
+export const getGoalHistory = async (
+  options: { from?: string; to?: string; goalId?: number; cursor?: string | null } = {}
+): Promise<GoalHistoryPage> => {
+  const params = new URLSearchParams({ action: 'history' });
+  if (options.from) params.set('from', options.from);
+  if (options.to) params.set('to', options.to);
+  if (options.goalId !== undefined) params.set('goalId', String(options.goalId));
+  if (options.cursor) params.set('cursor', options.cursor);
+
+  const response = await fetch(`${GOALS_API_URL}?${params.toString()}`, {
+    method: 'GET',
+    headers: getAuthHeaders(),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка загрузки истории изменений');
+  }
+
+  return response.json();
 };
@@ -10,13 +10,22 @@ export interface Notification {
 }
 
 const getAuthHeaders = () => {
-  const token = localStorage.getItem('authToken');
+  const token = localStorage.getItem('token');
+  const lastWrite = localStorage.getItem('lastWrite');
   return {
     'Content-Type': 'application/json',
     'X-Auth-Token': token || '',
+    ...(lastWrite ? { 'X-Last-Write': lastWrite } : {}),
   };
 };
 
+const rememberLastWrite = (response: Response) => {
+  const lastWrite = response.headers.get('X-Last-Write');
+  if (lastWrite) {
+    localStorage.setItem('lastWrite', lastWrite);
+  }
+};
+
 export const getNotifications = async (): Promise<{ notifications: Notification[]; unreadCount: number }> => {
   const response = await fetch(NOTIFICATIONS_API_URL, {
     method: 'GET',
@@ -42,6 +51,8 @@ export const markAsRead = async (id: number): Promise<void> => {
   if (!response.ok) {
     throw new Error('Ошибка обновления уведомления');
   }
+
+  rememberLastWrite(response);
 };
 
 export const deleteNotification = async (id: number): Promise<void> => {
@@ -53,4 +64,6 @@ export const deleteNotification = async (id: number): Promise<void> => {
   if (!response.ok) {
     throw new Error('Ошибка удаления уведомления');
   }
+
+  rememberLastWrite(response);
 };
\ No newline at end of file
@@ -16,12 +16,21 @@ export interface Profile {
 
 const getAuthHeaders = () => {
   const token = localStorage.getItem('token');
+  const lastWrite = localStorage.getItem('lastWrite');
   return {
     'Content-Type': 'application/json',
     'X-Auth-Token': token || '',
+    ...(lastWrite ? { 'X-Last-Write': lastWrite } : {}),
   };
 };
 
+const rememberLastWrite = (response: Response) => {
+  const lastWrite = response.headers.get('X-Last-Write');
+  if (lastWrite) {
+    localStorage.setItem('lastWrite', lastWrite);
+  }
+};
+
 export const getProfile = async (): Promise<Profile> => {
   const response = await fetch(PROFILE_API_URL, {
     method: 'GET',
@@ -47,6 +56,26 @@ export const updateProfile = async (updates: Partial<Profile>): Promise<Profile>
     throw new Error('Ошибка обновления профиля');
   }
 
+  rememberLastWrite(response);
+
   const data = await response.json();
   return data.profile;
 };
+
+export interface TelegramLink {
+  token: string;
+  expiresAt: string;
+}
+
+export const createTelegramLink = async (): Promise<TelegramLink> => {
+  const response = await fetch(`${PROFILE_API_URL}?action=telegram_link`, {
+    method: 'POST',
+    headers: getAuthHeaders(),
+  });
+
+  if (!response.ok) {
+    throw new Error('Ошибка создания ссылки для Telegram');
+  }
+
+  return response.json();
+};
@@ -1,4 +1,4 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import { useNavigate } from 'react-router-dom';
 import { Button } from '@/components/ui/button';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card';
@@ -8,12 +8,13 @@ import { Tabs, TabsList, TabsTrigger } from '@/components/ui/tabs';
 import { Calendar } from '@/components/ui/calendar';
 import Icon from '@/components/ui/icon';
 import { Checkbox } from '@/components/ui/checkbox';
+import { Slider } from '@/components/ui/slider';
 import AddTaskDialog from '@/components/AddTaskDialog';
 import EditTaskDialog from '@/components/EditTaskDialog';
 import DeleteTaskDialog from '@/components/DeleteTaskDialog';
 import TaskMenu from '@/components/TaskMenu';
 import { useToast } from '@/hooks/use-toast';
-import { getGoals, createGoal, updateGoal, deleteGoal, Goal } from '@/lib/goals';
+import { getGoals, createGoal, updateGoal, updateGoalProgress, flushGoalProgress, deleteGoal, Goal } from '@/lib/goals';
 import { getAuthData, logout } from '@/lib/auth';
 
 interface Task {
@@ -22,6 +23,7 @@ interface Task {
   category: 'work' | 'study' | 'home' | 'personal' | 'projects';
   priority: 'high' | 'medium' | 'low';
   completed: boolean;
+  progress: number;
   dueDate: string;
   mode: 'personal' | 'study';
 }
@@ -42,12 +44,17 @@ const AppPage = () => {
   
   const [tasks, setTasks] = useState<Task[]>([]);
   const [loading, setLoading] = useState(true);
+  const latestProgress = useRef(new Map<string, Promise<Goal>>());
   const { user } = getAuthData();
 
   useEffect(() => {
     loadGoals();
   }, []);
 
+  useEffect(() => () => {
+    latestProgress.current.forEach((_, id) => flushGoalProgress(parseInt(id)));
+  }, []);
+
   const loadGoals = async () => {
     try {
       setLoading(true);
@@ -69,6 +76,7 @@ const AppPage = () => {
             category: category as Task['category'],
             priority: priority as Task['priority'],
             completed: goal.status === 'completed',
+            progress: goal.progress || 0,
             dueDate: goal.endDate || new Date().toISOString().split('T')[0],
             mode: mode as Task['mode']
           };
@@ -133,6 +141,23 @@ const AppPage = () => {
     }
   };
 
+  // Slider drags are coalesced by updateGoalProgress; only the latest request for a task reports a failure
+  const handleProgressChange = (id: string, progress: number) => {
+    setTasks(prev => prev.map(t => t.id === id ? { ...t, progress } : t));
+
+    const request = updateGoalProgress(parseInt(id), progress);
+    latestProgress.current.set(id, request);
+    request.catch(() => {
+      if (latestProgress.current.get(id) === request) {
+        toast({
+          title: 'Ошибка',
+          description: 'Не удалось сохранить прогресс',
+          variant: 'destructive'
+        });
+      }
+    });
+  };
+
   const handleAddTask = async (newTask: {
     title: string;
     category: string;
@@ -157,6 +182,7 @@ const AppPage = () => {
         category: goal.category as Task['category'],
         priority: goal.priority as Task['priority'],
         completed: false,
+        progress: goal.progress || 0,
         dueDate: goal.endDate || new Date().toISOString().split('T')[0],
         mode: newTask.mode as Task['mode']
       };
@@ -175,7 +201,7 @@ const AppPage = () => {
     }
   };
 
-  const handleEditTask = async (updatedTask: Task) => {
+  const handleEditTask = async (updatedTask: Omit<Task, 'progress'>) => {
     try {
       await updateGoal({
         id: parseInt(updatedTask.id),
@@ -186,7 +212,7 @@ const AppPage = () => {
         status: updatedTask.completed ? 'completed' : 'pending'
       });
       
-      setTasks(tasks.map(task => task.id === updatedTask.id ? updatedTask : task));
+      setTasks(tasks.map(task => task.id === updatedTask.id ? { ...task, ...updatedTask } : task));
       toast({
         title: 'Задача обновлена! ✏️',
         description: `"${updatedTask.title}" успешно изменена`,
@@ -529,6 +555,21 @@ const AppPage = () => {
                                 })}
                               </span>
                             </div>
+                            {!task.completed && (
+                              <div className="flex items-center gap-3 mt-3">
+                                <Slider
+                                  value={[task.progress]}
+                                  max={100}
+                                  step={5}
+                                  onValueChange={([value]) => handleProgressChange(task.id, value)}
+                                  onValueCommit={() => flushGoalProgress(parseInt(task.id))}
+                                  className="flex-1"
+                                />
+                                <span className="text-xs text-muted-foreground font-medium w-10 text-right">
+                                  {task.progress}%
+                                </span>
+                              </div>
+                            )}
                           </div>
                           <TaskMenu
                             onEdit={() => openEditDialog(task)}
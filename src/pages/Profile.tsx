@@ -13,7 +13,7 @@ import { Badge } from "@/components/ui/badge";
 import { Progress } from "@/components/ui/progress";
 import Icon from "@/components/ui/icon";
 import { Separator } from "@/components/ui/separator";
-import { getProfile, Profile as ProfileData } from "@/lib/profile";
+import { createTelegramLink, getProfile, Profile as ProfileData } from "@/lib/profile";
 import { getAuthData, logout } from "@/lib/auth";
 import { useToast } from "@/hooks/use-toast";
 
@@ -44,6 +44,27 @@ const Profile = () => {
     }
   };
 
+  const connectTelegram = async () => {
+    // Open the tab synchronously so the popup blocker allows it, then point it at the bot
+    const botWindow = window.open("", "_blank");
+    try {
+      const { token } = await createTelegramLink();
+      const botUrl = `https://t.me/TaskBody_bot?start=${token}`;
+      if (botWindow) {
+        botWindow.location.href = botUrl;
+      } else {
+        window.location.href = botUrl;
+      }
+    } catch (error) {
+      botWindow?.close();
+      toast({
+        title: "Ошибка",
+        description: "Не удалось создать ссылку для подключения Telegram",
+        variant: "destructive",
+      });
+    }
+  };
+
   const stats = {
     totalTasks: profile?.stats?.totalGoals || 0,
     completedTasks: profile?.stats?.completedGoals || 0,
@@ -292,10 +313,7 @@ const Profile = () => {
                 </div>
                 <Button
                   className="w-full gap-2"
-                  onClick={() => {
-                    const botUrl = `https://t.me/TaskBody_bot?start=${profile?.id || user?.id || 0}`;
-                    window.open(botUrl, "_blank");
-                  }}
+                  onClick={connectTelegram}
                 >
                   <svg
                     className="w-5 h-5"
@@ -0,0 +1,121 @@
+'''
+Business: Check every handler's QUERIES catalog against the schema built by db_migrations
+Args: --dsn (PREPARE each entry against a database, defaults to DATABASE_URL), --migrations (apply db_migrations
+      inside the check transaction first, for an empty scratch database), --static (only the offline table check)
+Returns: prints one line per catalog entry; exit code 1 when any entry fails
+'''
+
+import argparse
+import importlib.util
+import os
+import re
+import sys
+import psycopg2
+from typing import Dict, List, Tuple
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+MIGRATIONS_DIR = os.path.join(ROOT_DIR, 'db_migrations')
+
+SCHEMA = 't_p59845625_taskbuddy_project'
+
+# Functions that keep a QUERIES catalog executed through execute_query
+CATALOG_SERVICES = ('goals', 'notifications', 'profile')
+
+def load_handler(name: str):
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f'check_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def catalog_queries() -> Dict[str, str]:
+    """Every QUERIES entry keyed service.name, exactly the SQL the handlers run"""
+    return {
+        f'{service}.{name}': sql
+        for service in CATALOG_SERVICES
+        for name, sql in load_handler(service).QUERIES.items()
+    }
+
+def migration_files() -> List[str]:
+    files = [f for f in os.listdir(MIGRATIONS_DIR) if re.match(r'V\d+__.*\.sql$', f)]
+    return [os.path.join(MIGRATIONS_DIR, f) for f in sorted(files, key=lambda f: int(f[1:f.index('__')]))]
+
+def migrated_tables() -> set:
+    tables = set()
+    for path in migration_files():
+        with open(path) as f:
+            tables.update(re.findall(r'CREATE (?:UNLOGGED )?TABLE IF NOT EXISTS (\w+)', f.read()))
+    return tables
+
+def check_static(queries: Dict[str, str]) -> List[Tuple[str, str]]:
+    """Offline check: every schema-qualified relation a query names is created by some migration"""
+    tables = migrated_tables()
+    failures = []
+    for name, sql in queries.items():
+        missing = sorted(set(re.findall(rf'{SCHEMA}\.(\w+)', sql)) - tables)
+        if missing:
+            failures.append((name, f"unknown tables: {', '.join(missing)}"))
+    return failures
+
+def to_prepared(sql: str) -> str:
+    """Same %s -> $n rewrite execute_query applies before PREPARE"""
+    counter = iter(range(1, sql.count('%s') + 1))
+    return re.sub(r'%s', lambda _: f'${next(counter)}', sql)
+
+def check_prepared(dsn: str, queries: Dict[str, str], apply_migrations: bool) -> List[Tuple[str, str]]:
+    """PREPARE parses and analyses each entry (tables, columns, types) without needing parameter values"""
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    failures = []
+    
+    try:
+        if apply_migrations:
+            cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+            cur.execute(f"SET LOCAL search_path TO {SCHEMA}")
+            for path in migration_files():
+                with open(path) as f:
+                    cur.execute(f.read())
+        
+        for index, (name, sql) in enumerate(queries.items()):
+            cur.execute("SAVEPOINT catalog_entry")
+            try:
+                cur.execute(f"PREPARE catalog_check_{index} AS {to_prepared(sql)}")
+                cur.execute(f"DEALLOCATE catalog_check_{index}")
+            except psycopg2.Error as e:
+                failures.append((name, str(e).strip().splitlines()[0]))
+                cur.execute("ROLLBACK TO SAVEPOINT catalog_entry")
+    finally:
+        # Migrations applied for the check are rolled back with everything else
+        conn.rollback()
+        cur.close()
+        conn.close()
+    
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--migrations', action='store_true')
+    parser.add_argument('--static', action='store_true')
+    args = parser.parse_args()
+    
+    queries = catalog_queries()
+    failures = check_static(queries)
+    mode = 'static'
+    if not args.static and args.dsn:
+        failures += check_prepared(args.dsn, queries, args.migrations)
+        mode = 'prepared'
+    
+    failed = {name for name, _ in failures}
+    for name in queries:
+        print(f"{name:45s} {'FAIL' if name in failed else 'ok'}")
+    for name, error in failures:
+        print(f'  {name}: {error}')
+    
+    print(f'{len(queries)} catalog entries checked ({mode}), {len(failed)} failed')
+    if failures:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+'''
+Business: Explain the backend handlers' read queries against a seeded database and report index problems
+Args: --dsn (defaults to DATABASE_URL), --save results.json, --baseline results.json
+Returns: prints sequential scans, per-query timings and never-used indexes
+'''
+
+import argparse
+import json
+import os
+import psycopg2
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+
+from check_queries import catalog_queries, load_handler
+
+SCHEMA = 't_p59845625_taskbuddy_project'
+
+ANALYTICS_WEEKS = 4
+
+# Sample parameter names, in placeholder order, for every QUERIES entry; a new entry must be listed here
+CATALOG_PARAMS = {
+    'goals.user_id_by_token': ('token',),
+    'goals.goals_by_user': ('user_id',),
+    'goals.analytics_cache': ('user_id', 'weeks'),
+    'notifications.user_context_by_token': ('token',),
+    'notifications.user_context_by_id': ('user_id',),
+    'notifications.notifications_by_user': ('user_id',),
+    'profile.user_id_by_token': ('token',),
+    'profile.profile_by_user': ('user_id',),
+    'profile.goal_stats_by_user': ('user_id',)
+}
+
+def handler_queries() -> Dict[str, Tuple[str, Tuple[str, ...]]]:
+    """Read paths as (sql, parameter names), imported from the handlers so plans are of the SQL that actually runs"""
+    queries = {}
+    seen = set()
+    for name, sql in catalog_queries().items():
+        if name not in CATALOG_PARAMS:
+            raise KeyError(f'{name} has no entry in CATALOG_PARAMS')
+        # Shared entries such as user_id_by_token are identical in every service, explain them once
+        if sql not in seen:
+            seen.add(sql)
+            queries[name] = (sql, CATALOG_PARAMS[name])
+    
+    auth = load_handler('auth')
+    goals = load_handler('goals')
+    notifications = load_handler('notifications')
+    telegram = load_handler('telegram')
+    queries.update({
+        'auth.login_user': (auth.LOGIN_QUERY, ('email',)),
+        'goals.compute_analytics': (goals.ANALYTICS_QUERY, ('analytics_days', 'user_id', 'user_id', 'analytics_days')),
+        'notifications.check_and_send_reminders': (notifications.REMINDER_CANDIDATES_QUERY, ('tomorrow',)),
+        'telegram.list_goals': (telegram.LIST_GOALS_QUERY, ('chat_id',)),
+        'telegram.today_goals': (telegram.TODAY_GOALS_QUERY, ('chat_id',)),
+        'telegram.overdue_goals': (telegram.OVERDUE_GOALS_QUERY, ('chat_id',))
+    })
+    return queries
+
+def sample_params(cur) -> Dict[str, Any]:
+    """Pick the heaviest user so plans reflect the worst case"""
+    cur.execute(f"SELECT user_id FROM {SCHEMA}.goals GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1")
+    row = cur.fetchone()
+    user_id = row[0] if row else 0
+    
+    cur.execute(f"SELECT email, telegram_chat_id FROM {SCHEMA}.users WHERE id = %s", (user_id,))
+    row = cur.fetchone() or ('', None)
+    email, chat_id = row
+    
+    cur.execute(f"SELECT token FROM {SCHEMA}.tokens WHERE user_id = %s LIMIT 1", (user_id,))
+    token = (cur.fetchone() or ('',))[0]
+    
+    return {
+        'user_id': user_id,
+        'email': email,
+        'chat_id': chat_id or 0,
+        'token': token,
+        'weeks': ANALYTICS_WEEKS,
+        'analytics_days': ANALYTICS_WEEKS * 7 - 1,
+        'tomorrow': (date.today() + timedelta(days=1)).isoformat()
+    }
+
+def walk_plan(node: Dict[str, Any], found: List[Dict[str, Any]]):
+    if node.get('Node Type') == 'Seq Scan':
+        found.append({
+            'relation': node.get('Relation Name'),
+            'rows': node.get('Actual Rows', 0) * node.get('Actual Loops', 1),
+            'removedByFilter': node.get('Rows Removed by Filter', 0)
+        })
+    for child in node.get('Plans', []):
+        walk_plan(child, found)
+
+def explain(cur, sql: str, params: tuple) -> Dict[str, Any]:
+    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql, params)
+    plan = cur.fetchone()[0][0]
+    seq_scans = []
+    walk_plan(plan['Plan'], seq_scans)
+    return {
+        'executionMs': plan.get('Execution Time'),
+        'planningMs': plan.get('Planning Time'),
+        'sharedHit': plan['Plan'].get('Shared Hit Blocks', 0),
+        'sharedRead': plan['Plan'].get('Shared Read Blocks', 0),
+        'seqScans': seq_scans
+    }
+
+def unused_indexes(cur) -> List[Dict[str, Any]]:
+    """The explains run in this still-open transaction, whose scans only reach pg_stat_user_indexes after it ends,
+    so the transaction's own counts (pg_stat_get_xact_numscans) are added"""
+    cur.execute(
+        """SELECT s.relname, s.indexrelname, s.idx_scan + pg_stat_get_xact_numscans(s.indexrelid), 
+                  pg_relation_size(s.indexrelid), i.indisunique 
+           FROM pg_stat_user_indexes s JOIN pg_index i ON i.indexrelid = s.indexrelid 
+           WHERE s.schemaname = %s AND s.idx_scan + pg_stat_get_xact_numscans(s.indexrelid) = 0 
+           ORDER BY pg_relation_size(s.indexrelid) DESC""",
+        (SCHEMA,)
+    )
+    return [
+        {'table': table, 'index': index, 'scans': scans, 'bytes': size, 'unique': unique}
+        for table, index, scans, size, unique in cur.fetchall()
+    ]
+
+def print_report(results: Dict[str, Any], baseline: Optional[Dict[str, Any]]):
+    print(f"{'query':45} {'exec ms':>10} {'baseline':>10} {'change':>8}  seq scans")
+    for name, result in results['queries'].items():
+        before = (baseline or {}).get('queries', {}).get(name, {}).get('executionMs')
+        change = f"{(result['executionMs'] / before - 1) * 100:+.0f}%" if before else ''
+        scans = ', '.join(f"{scan['relation']} ({scan['removedByFilter']} filtered)" for scan in result['seqScans'])
+        print(f"{name:45} {result['executionMs']:>10.2f} {before or '':>10} {change:>8}  {scans}")
+    
+    if results['unusedIndexes']:
+        print('\nIndexes never scanned since stats reset:')
+        for index in results['unusedIndexes']:
+            kind = ' (unique constraint)' if index['unique'] else ''
+            print(f"  {index['table']}.{index['index']}: {index['bytes']} bytes{kind}")
+
+def main():
+    parser = argparse.ArgumentParser(description='Index advisor for the TaskBuddy schema')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--save', help='write results as JSON, e.g. before applying a migration')
+    parser.add_argument('--baseline', help='compare timings with a previously saved run')
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(args.dsn)
+    cur = conn.cursor()
+    
+    try:
+        params = sample_params(cur)
+        queries = {
+            name: explain(cur, sql, tuple(params[key] for key in keys))
+            for name, (sql, keys) in handler_queries().items()
+        }
+        results = {'params': params, 'queries': queries, 'unusedIndexes': unused_indexes(cur)}
+    finally:
+        conn.rollback()
+        cur.close()
+        conn.close()
+    
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    
+    print_report(results, baseline)
+    
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, default=str)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+'''
+Business: Load-test the unified router's synchronous and asyncio modes with concurrent GET list requests
+Args: --target name=url (repeatable; load-test deployed routers, e.g. sync=... async=..., with --token),
+      without --target both modes serve /goals in-process from a fake database whose every query waits --db-ms;
+      --concurrency, --requests, --path (deployed targets only, default /goals)
+Returns: prints throughput and p50/p95/p99 latency per mode
+'''
+
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import os
+import statistics
+import sys
+import threading
+import time
+import requests
+from typing import Any, Callable, Dict, List
+
+from microbench import TOKEN, FakeConnection, FakeCursor, goal_row
+
+API_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend', 'api')
+sys.path.insert(0, API_DIR)
+
+LIST_ROWS = [goal_row(i) for i in range(20)]
+
+class SlowCursor(FakeCursor):
+    """psycopg2 stand-in whose statements block the calling thread for the simulated query time"""
+
+    def __init__(self, delay: float):
+        super().__init__(one=(1,), many=LIST_ROWS)
+        self.delay = delay
+
+    def execute(self, sql, params=None):
+        time.sleep(self.delay)
+
+class SlowAsyncConnection:
+    """asyncpg stand-in whose queries await the simulated query time, leaving the loop free"""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+
+    async def fetchval(self, sql, *args):
+        await asyncio.sleep(self.delay)
+        return 1
+
+    async def fetch(self, sql, *args):
+        await asyncio.sleep(self.delay)
+        return LIST_ROWS
+
+class SlowAsyncPool:
+    """asyncpg pool stand-in capped at POOL_MAX_SIZE connections, like the real pool"""
+
+    def __init__(self, size: int, delay: float):
+        self.slots = asyncio.Semaphore(size)
+        self.delay = delay
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        async with self.slots:
+            yield SlowAsyncConnection(self.delay)
+
+def run_load(call: Callable[[], Dict[str, Any]], concurrency: int, total: int) -> Dict[str, Any]:
+    """`total` calls from `concurrency` client threads; latency includes any queueing inside the instance"""
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    lock = threading.Lock()
+
+    def one():
+        start = time.perf_counter()
+        status = call()['statusCode']
+        elapsed = (time.perf_counter() - start) * 1000
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as clients:
+        list(clients.map(lambda _: one(), range(total)))
+    wall = time.perf_counter() - start
+
+    cuts = statistics.quantiles(latencies, n=100)
+    return {'rps': total / wall, 'p50': cuts[49], 'p95': cuts[94], 'p99': cuts[98], 'statuses': statuses}
+
+def in_process_modes(db_ms: float) -> Dict[str, Callable[[], Dict[str, Any]]]:
+    """One warm sync instance, invoked one request at a time as the platform does, and one asyncio instance"""
+    import index as router
+    import aio
+
+    delay = db_ms / 1000
+    event = {'httpMethod': 'GET', 'path': '/goals', 'headers': {'X-Auth-Token': TOKEN}, 'queryStringParameters': {}}
+
+    module = aio.load_service('goals')
+    conn = FakeConnection(SlowCursor(delay))
+    module.get_db_connection = lambda *args, **kwargs: conn
+    module.RATE_LIMITS = {name: (10 ** 9, window) for name, (_, window) in module.RATE_LIMITS.items()}
+
+    pool = None
+
+    async def get_pool(dsn):
+        nonlocal pool
+        if pool is None:
+            pool = SlowAsyncPool(aio.POOL_MAX_SIZE, delay)
+        return pool
+
+    aio.get_pool = get_pool
+    instance = threading.Lock()
+
+    # Every request resolves its token, as with many distinct users, so each one makes two queries in either mode
+    def sync_call():
+        router._token_cache.clear()
+        with instance:
+            return router.handler(event, None)
+
+    def async_call():
+        router._token_cache.clear()
+        return aio.handler(event, None)
+
+    return {'sync': sync_call, 'async': async_call}
+
+def deployed_target(url: str, token: str, path: str) -> Callable[[], Dict[str, Any]]:
+    local = threading.local()
+
+    def call():
+        if not hasattr(local, 'session'):
+            local.session = requests.Session()
+        response = local.session.get(url.rstrip('/') + path, headers={'X-Auth-Token': token}, timeout=30)
+        return {'statusCode': response.status_code}
+    return call
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--target', action='append', default=[])
+    parser.add_argument('--token', default=os.environ.get('LOADTEST_TOKEN', ''))
+    parser.add_argument('--path', default='/goals')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--db-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    if args.target:
+        modes = {name: deployed_target(url, args.token, args.path)
+                 for name, _, url in (target.partition('=') for target in args.target)}
+        print(f'{len(modes)} deployed target(s), path {args.path}')
+    else:
+        modes = in_process_modes(args.db_ms)
+        print(f'in-process, fake database with {args.db_ms:g} ms per query, path /goals')
+
+    for name, call in modes.items():
+        result = run_load(call, args.concurrency, args.requests)
+        statuses = ', '.join(f'{status}x{count}' for status, count in sorted(result['statuses'].items()))
+        print(f"{name:8s} {result['rps']:9.1f} req/s  p50 {result['p50']:8.1f} ms  p95 {result['p95']:8.1f} ms  "
+              f"p99 {result['p99']:8.1f} ms  [{statuses}]")
+
+if __name__ == '__main__':
+    main()
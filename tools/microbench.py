@@ -0,0 +1,532 @@
+'''
+Business: Measure the Python-side cost of handler hot paths with the database replaced by a fake cursor
+Args: --check (fail on regression against microbench_thresholds.json), --update (rewrite thresholds), --only name
+Returns: prints microseconds per call for each benchmark and the round trips of each goal mutation;
+         exit code 1 when --check finds a regression
+'''
+
+import argparse
+import base64
+import gzip
+import importlib.util
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import date, datetime
+from typing import Any, Callable, Dict, List, Optional
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+THRESHOLDS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'microbench_thresholds.json')
+
+REPEATS = 7
+# Thresholds are stored with headroom so slower CI machines do not flap; --update applies it
+THRESHOLD_HEADROOM = 2.0
+
+NOW = datetime(2026, 1, 15, 12, 0, 0)
+TOKEN = 'g_pYRyE-HCs1a4GrcZoRb-FWijCYwNY60mGFA_T92w8'
+# Trailing WRITE_LSN column of a write statement's row
+WRITE_LSN = '0/16B3748'
+
+def goal_row(goal_id: int) -> tuple:
+    """Row in GOAL_COLUMNS order plus the subtasks aggregate"""
+    return (goal_id, f'Цель номер {goal_id}', 'Описание задачи ' * 8, 'work', 'medium', 'pending',
+            date(2026, 1, 1), date(2026, 2, 1), 40, NOW, NOW, None, 1, None,
+            [{'id': goal_id * 10, 'title': 'Шаг', 'isDone': False, 'position': 0}])
+
+class FakeCursor:
+    """Answers every execute with canned rows so only the handler's own Python work is timed"""
+
+    def __init__(self, one: Optional[tuple] = None, many: Optional[List[tuple]] = None):
+        self.one = one
+        self.many = many or []
+        self.connection = None
+
+    def execute(self, sql, params=None):
+        pass
+
+    def fetchone(self):
+        return self.one
+
+    def fetchall(self):
+        return self.many
+
+    def close(self):
+        pass
+
+class CountingCursor(FakeCursor):
+    """FakeCursor that counts the statements sent, each one a round trip to a real server"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.statements = 0
+
+    def execute(self, sql, params=None):
+        self.statements += 1
+
+class FakeConnection:
+    closed = False
+
+    def __init__(self, cursor: FakeCursor):
+        self._cursor = cursor
+        self.commits = 0
+        cursor.connection = self
+
+    def cursor(self, *args, **kwargs):
+        return self._cursor
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+class FakeNamedCursor:
+    """Server-side cursor stand-in: rows with ids 1..count are built lazily, itersize at a time, after the keyset
+    id passed as the last parameter, so the fake holds no history"""
+
+    def __init__(self, make_row: Callable[[int], tuple], count: int):
+        self.make_row = make_row
+        self.count = count
+        self.itersize = 2000
+        self.after = 0
+
+    def execute(self, sql, params=None):
+        self.after = params[-1] if params else 0
+
+    def __iter__(self):
+        for start in range(self.after + 1, self.count + 1, self.itersize):
+            yield from [self.make_row(i) for i in range(start, min(start + self.itersize, self.count + 1))]
+
+    def close(self):
+        pass
+
+class ExportConnection(FakeConnection):
+    """Serves `rows` goals and as many notifications to the export's named cursors"""
+
+    def __init__(self, rows: int):
+        super().__init__(FakeCursor())
+        self.rows = rows
+
+    def cursor(self, name=None, *args, **kwargs):
+        if name == 'export_goal':
+            return FakeNamedCursor(varied_goal_row, self.rows)
+        if name == 'export_notification':
+            return FakeNamedCursor(export_notification_row, self.rows)
+        return self._cursor
+
+def varied_goal_row(i: int) -> tuple:
+    """Goal whose text varies per row, so compression sees realistic rather than repeated data"""
+    words = ' '.join(f'{(i * 2654435761 + k * 40503) % 4294967296:x}' for k in range(6))
+    return (i, f'Цель {i} {words[:17]}', words, 'work', 'medium', 'pending',
+            date(2026, 1, 1), date(2026, 2, 1), i % 101, NOW, NOW, None, 1, None)
+
+def export_notification_row(i: int) -> tuple:
+    return (i, 'Новая задача добавлена', f'Задача "Цель {i}" успешно создана', 'task_created', i % 2 == 0, NOW)
+
+def load_handler(name: str):
+    path = os.path.join(BACKEND_DIR, name, 'index.py')
+    spec = importlib.util.spec_from_file_location(f'bench_{name}', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def use_fake_db(module, cursor: FakeCursor):
+    conn = FakeConnection(cursor)
+    module.get_db_connection = lambda *args, **kwargs: conn
+    # Handlers treat it as their pooled connection, so QUERIES run through PREPARE/EXECUTE as in production
+    if hasattr(module, '_pooled_connections'):
+        module._pooled_connections[0] = conn
+        module._prepared_statements[0] = set()
+    if hasattr(module, 'get_read_connection'):
+        module.get_read_connection = lambda headers: conn
+    if hasattr(module, 'get_write_headers'):
+        module.get_write_headers = lambda lsn: {}
+
+def uncached(fn: Callable[[], Any], *caches: dict) -> Callable[[], Any]:
+    """Empty the given caches before every call so a lookup is timed on its database path, not on a hit"""
+    def run():
+        for cache in caches:
+            cache.clear()
+        return fn()
+    return run
+
+LIST_SIZES = (10, 100, 1000)
+LIST_ENCODINGS = ('identity', 'gzip', 'br')
+# The sparse fieldset a compact list view asks for
+LIST_FIELDS = 'title,status,endDate'
+
+def list_handler(size: int, sparse: bool = False):
+    """goals handler whose cursor returns `size` full rows, or (id, title, status, end_date) for LIST_FIELDS"""
+    module = load_handler('goals')
+    rows = [varied_goal_row(i) + ([{'id': i * 10, 'title': 'Шаг', 'isDone': False, 'position': 0}],)
+            for i in range(size)]
+    if sparse:
+        rows = [(row[0], row[1], row[5], row[7]) for row in rows]
+    use_fake_db(module, FakeCursor(many=rows))
+    return module
+
+def list_event(encoding: str, sparse: bool = False) -> dict:
+    return {'headers': {'Accept-Encoding': encoding}, 'queryStringParameters': {'fields': LIST_FIELDS} if sparse else {}}
+
+def wire_bytes(response: dict) -> int:
+    """Bytes the client receives: the gateway decodes a base64 body before sending it"""
+    if response.get('isBase64Encoded'):
+        return len(base64.b64decode(response['body']))
+    return len(response['body'].encode('utf-8'))
+
+def build_payload_sizes() -> Dict[str, Dict[str, int]]:
+    """Wire bytes of get_goals per list size, full and sparse, for each encoding the handler can produce"""
+    sizes = {}
+    for size in LIST_SIZES:
+        for sparse in (False, True):
+            module = list_handler(size, sparse)
+            encodings = [e for e in LIST_ENCODINGS if e != 'br' or module.brotli is not None]
+            name = f"goals.list_{size}{'_fields' if sparse else ''}"
+            sizes[name] = {e: wire_bytes(module.get_goals(list_event(e, sparse), 1)) for e in encodings}
+    return sizes
+
+def build_benchmarks() -> Dict[str, Callable[[], Any]]:
+    goals = load_handler('goals')
+    profile = load_handler('profile')
+    notifications = load_handler('notifications')
+
+    update_event = {
+        'httpMethod': 'PUT',
+        'headers': {'X-Auth-Token': TOKEN, 'Content-Type': 'application/json'},
+        'queryStringParameters': {},
+        'body': json.dumps({'id': 1, 'title': 'Новая цель', 'status': 'completed', 'priority': 'high',
+                            'endDate': '2026-03-01', 'description': 'Подробное описание ' * 10})
+    }
+    profile_event = {'body': json.dumps({'username': 'runner', 'bio': 'Люблю бегать', 'avatarUrl': 'https://x/a.png'})}
+    settings_event = {'body': json.dumps({'notifications': True, 'telegramNotifications': False, 'reminderTime': '09:00'})}
+
+    rows_small = [goal_row(i) for i in range(10)]
+    rows_large = [goal_row(i) for i in range(1000)]
+    payloads = {size: {'goals': [dict(goals.goal_from_row(row), subtasks=row[14]) for row in rows_large[:size]]}
+                for size in (10, 100, 1000)}
+
+    # One cursor per module: a cursor belongs to a single connection, which execute_query checks
+    for module in (goals, profile, notifications):
+        use_fake_db(module, FakeCursor(one=(1, True, False, True, '1day')))
+    auth_headers = {'x-auth-token': TOKEN}
+
+    goals_update = load_handler('goals')
+    use_fake_db(goals_update, FakeCursor(one=goal_row(1)[:14] + ('pending', 1, None, True, WRITE_LSN)))
+    goals_list = load_handler('goals')
+    use_fake_db(goals_list, FakeCursor(many=rows_small))
+    profile_update = load_handler('profile')
+    use_fake_db(profile_update, FakeCursor(one=(1, 'runner@example.com', 'runner', None, 'bio', None, NOW, WRITE_LSN)))
+    settings_update = load_handler('notifications')
+    use_fake_db(settings_update, FakeCursor(one=(True, False, False, '09:00', WRITE_LSN)))
+
+    # The same GET list through a function's own handler and through the unified router, token cache warm
+    list_event_get = {'httpMethod': 'GET', 'headers': {'X-Auth-Token': TOKEN}, 'queryStringParameters': {}}
+    goals_direct = load_handler('goals')
+    use_fake_db(goals_direct, FakeCursor(one=(1,), many=rows_small))
+    router = load_handler('api')
+    router_goals = router.load_service('goals')
+    router_conn = FakeConnection(FakeCursor(one=(1,), many=rows_small))
+    router._local.connections, router._local.prepared_statements = {0: router_conn}, {0: set()}
+    router_goals.get_write_headers = lambda lsn: {}
+    router_event = {**list_event_get, 'path': '/goals'}
+    # Lists are rate limited per user; lift the limit so every timed call is served, the bucket check still runs
+    for module in (goals_direct, router_goals):
+        module.RATE_LIMITS = {**module.RATE_LIMITS, 'goals_list': (10 ** 9, 60)}
+
+    lists = {size: list_handler(size) for size in (100, 1000)}
+    sparse_list = list_handler(1000, sparse=True)
+
+    benchmarks = {
+        'event.parse_body': lambda: json.loads(update_event['body']),
+        'auth.goals_token_lookup': lambda: goals.get_user_id_from_token(auth_headers),
+        'auth.profile_token_lookup': lambda: profile.get_user_id_from_token(auth_headers),
+        'auth.notifications_token_lookup': uncached(lambda: notifications.get_user_id_from_token(auth_headers),
+                                                    notifications._token_users, notifications._user_contexts),
+        'goals.update_goal': lambda: goals_update.update_goal(update_event, 1),
+        'goals.get_goals_10': lambda: goals_list.get_goals({'headers': {}, 'queryStringParameters': {}}, 1),
+        'profile.update_profile': lambda: profile_update.update_profile(profile_event, 1),
+        'notifications.update_settings': lambda: settings_update.update_settings(settings_event, 1),
+        'goals.goal_from_row_1000': lambda: [goals.goal_from_row(row) for row in rows_large],
+        'json.dumps_goals_10': lambda: json.dumps(payloads[10]),
+        'json.dumps_goals_100': lambda: json.dumps(payloads[100]),
+        'json.dumps_goals_1000': lambda: json.dumps(payloads[1000]),
+        'api.direct_goals_list': lambda: goals_direct.handler(list_event_get, None),
+        'api.router_goals_list': lambda: router.handler(router_event, None),
+        'goals.get_goals_1000_fields': lambda: sparse_list.get_goals(list_event('identity', sparse=True), 1),
+    }
+    for size, module in lists.items():
+        for encoding in LIST_ENCODINGS:
+            if encoding != 'br' or module.brotli is not None:
+                benchmarks[f'goals.get_goals_{size}_{encoding}'] = \
+                    lambda module=module, event=list_event(encoding): module.get_goals(event, 1)
+    return benchmarks
+
+# Goal mutations run as one fused statement on one connection, also with replicas configured, when the write's
+# X-Last-Write position comes back in that statement; more means a round trip crept back in
+ROUND_TRIP_BUDGETS = {
+    'goals.create_goal': 1,
+    'goals.update_goal': 1,
+    'goals.delete_goal': 1,
+    'goals.create_goal_replicas': 1,
+    'goals.update_goal_replicas': 1,
+    'goals.delete_goal_replicas': 1,
+}
+
+def count_round_trips(cursor: CountingCursor, call: Callable[[Any], Any], replicas: bool = False) -> Dict[str, int]:
+    """Statements, commits and connections of one warm call, as a real server would see them; with `replicas`
+    the handler builds its real X-Last-Write header, which must carry the statement's LSN"""
+    module = load_handler('goals')
+    write_headers = module.get_write_headers
+    use_fake_db(module, cursor)
+    if replicas:
+        module.get_replica_dsns = lambda: ['host=replica']
+        module.get_write_headers = write_headers
+    conn = module.get_db_connection()
+    opened = []
+    module.get_db_connection = lambda *args, **kwargs: opened.append(conn) or conn
+    module.get_read_connection = lambda headers: opened.append(conn) or conn
+
+    call(module)
+    opened.clear()
+    cursor.statements = conn.commits = 0
+    response = call(module)
+    trips = {'statements': cursor.statements, 'commits': conn.commits, 'connections': len(opened)}
+    if replicas:
+        trips['lastWrite'] = response['headers'].get('X-Last-Write') == WRITE_LSN
+    return trips
+
+def build_round_trips() -> Dict[str, Dict[str, int]]:
+    created = goal_row(1)[:14] + (None, True, WRITE_LSN)
+    updated = goal_row(1)[:14] + ('pending', 1, None, True, WRITE_LSN)
+    create_event = {'body': json.dumps({'title': 'Новая цель', 'category': 'work', 'endDate': '2026-03-01'})}
+    update_event = {'body': json.dumps({'id': 1, 'title': 'Новая цель', 'status': 'completed'})}
+    delete_event = {'queryStringParameters': {'id': '1'}}
+    calls = {
+        'goals.create_goal': (created, lambda m: m.create_goal(create_event, 1)),
+        'goals.update_goal': (updated, lambda m: m.update_goal(update_event, 1)),
+        'goals.delete_goal': ((1, WRITE_LSN), lambda m: m.delete_goal(delete_event, 1)),
+    }
+
+    return {
+        **{name: count_round_trips(CountingCursor(one=row), call) for name, (row, call) in calls.items()},
+        **{f'{name}_replicas': count_round_trips(CountingCursor(one=row), call, replicas=True)
+           for name, (row, call) in calls.items()},
+    }
+
+# History sizes for the export memory check; the largest must peak no higher than EXPORT_MEMORY_GROWTH x the middle one
+EXPORT_ROWS = (10_000, 100_000, 1_000_000)
+EXPORT_MEMORY_GROWTH = 1.1
+# History walked page by page to the last cursor; big enough that gzip output spans several pages too
+EXPORT_PAGED_ROWS = 100_000
+# Peak memory follows the page size, not the row count; a smaller page keeps the gzip runs short
+EXPORT_BENCH_MAX_BYTES = 512 * 1024
+
+def export_handler(rows: int):
+    goals = load_handler('goals')
+    conn = ExportConnection(rows)
+    goals.get_read_connection = lambda headers: conn
+    goals.EXPORT_MAX_BYTES = EXPORT_BENCH_MAX_BYTES
+    return goals
+
+def export_event(compress: bool, cursor: Optional[str] = None) -> Dict[str, Any]:
+    params = {'format': 'jsonl', 'gzip': '1' if compress else ''}
+    if cursor:
+        params['cursor'] = cursor
+    return {'headers': {}, 'queryStringParameters': params}
+
+def export_peak_memory(rows: int, compress: bool) -> tuple:
+    """Status code, next cursor and tracemalloc peak bytes of the first export page over `rows` goals plus
+    `rows` notifications; later pages run the same loop from a keyset position, so they peak the same"""
+    goals = export_handler(rows)
+
+    tracemalloc.start()
+    try:
+        response = goals.export_data(export_event(compress), 1)
+        return response['statusCode'], response['headers'].get('X-Export-Cursor'), tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def export_all_pages(rows: int, compress: bool) -> tuple:
+    """Follow X-Export-Cursor to the end; returns (statuses, pages, records in the concatenated bodies)"""
+    goals = export_handler(rows)
+    statuses, parts, cursor = set(), [], None
+    while True:
+        response = goals.export_data(export_event(compress, cursor), 1)
+        statuses.add(response['statusCode'])
+        parts.append(base64.b64decode(response['body']))
+        cursor = response['headers'].get('X-Export-Cursor')
+        if response['statusCode'] != 200 or not cursor:
+            break
+    body = b''.join(parts)
+    if compress:
+        body = gzip.decompress(body)
+    return statuses, len(parts), len(body.splitlines())
+
+# Functions a page load touches: one cold start each when deployed separately, one in total behind the router
+PAGE_LOAD_SERVICES = ('auth', 'profile', 'goals', 'notifications')
+COLD_START_REPEATS = 5
+
+COLD_START_SCRIPT = """
+import importlib.util, sys, time
+start = time.perf_counter()
+def load(path, name):
+    spec = importlib.util.spec_from_file_location(name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+    return module
+backend, mode, services = sys.argv[1], sys.argv[2], sys.argv[3:]
+if mode == 'router':
+    router = load(backend + '/api/index.py', 'api')
+    for service in services:
+        router.load_service(service)
+else:
+    for service in services:
+        load(backend + '/' + service + '/index.py', service)
+print(time.perf_counter() - start)
+"""
+
+def latency_percentiles(fn: Callable[[], Any], calls: int = 2000) -> tuple:
+    """p50 and p99 microseconds of individually timed warm calls"""
+    fn()
+    samples = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    cuts = statistics.quantiles(samples, n=100)
+    return cuts[49], cuts[98]
+
+def cold_start(mode: str, services: tuple) -> tuple:
+    """Median milliseconds of a fresh process start plus module import, and of the import alone"""
+    walls, imports = [], []
+    for _ in range(COLD_START_REPEATS):
+        start = time.perf_counter()
+        out = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, BACKEND_DIR, mode, *services],
+                             capture_output=True, text=True, check=True).stdout
+        walls.append((time.perf_counter() - start) * 1000)
+        imports.append(float(out) * 1000)
+    return statistics.median(walls), statistics.median(imports)
+
+def measure(fn: Callable[[], Any]) -> float:
+    """Median microseconds per call over REPEATS rounds, each long enough to swamp timer noise"""
+    fn()
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - start
+        if elapsed >= 0.05:
+            break
+        loops *= 2
+
+    rounds = []
+    for _ in range(REPEATS):
+        start = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        rounds.append((time.perf_counter() - start) / loops * 1e6)
+    return statistics.median(rounds)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--check', action='store_true')
+    parser.add_argument('--update', action='store_true')
+    parser.add_argument('--only')
+    args = parser.parse_args()
+
+    thresholds = {}
+    if os.path.exists(THRESHOLDS_PATH):
+        with open(THRESHOLDS_PATH) as f:
+            thresholds = json.load(f)
+
+    regressions = []
+    results = {}
+    benchmarks = build_benchmarks()
+    for name, fn in benchmarks.items():
+        if args.only and not name.startswith(args.only):
+            continue
+        results[name] = measure(fn)
+        limit = thresholds.get(name)
+        flag = ''
+        if limit is not None and results[name] > limit:
+            flag = f'  REGRESSION > {limit:.1f}'
+            regressions.append(name)
+        print(f'{name:34s} {results[name]:12.2f} us{flag}')
+
+    if not args.only or args.only.startswith('goals'):
+        for name, trips in build_round_trips().items():
+            flag = ''
+            if trips['statements'] > ROUND_TRIP_BUDGETS[name] or trips['connections'] > 1:
+                flag = f"  REGRESSION > {ROUND_TRIP_BUDGETS[name]} statement(s) on 1 connection"
+                regressions.append(f'{name} round trips')
+            elif trips.get('lastWrite') is False:
+                flag = '  REGRESSION: no X-Last-Write from the write statement'
+                regressions.append(f'{name} X-Last-Write')
+            print(f"{name + ' round trips':34s} {trips['statements']} statement(s), {trips['commits']} commit(s), "
+                  f"{trips['connections']} connection(s){flag}")
+
+    if not args.only or args.only.startswith('goals'):
+        for name, sizes in build_payload_sizes().items():
+            print(f'{name:34s} ' + ', '.join(f'{encoding} {size} B' for encoding, size in sizes.items()))
+
+    if not args.only or args.only.startswith('api'):
+        for name in ('api.direct_goals_list', 'api.router_goals_list'):
+            p50, p99 = latency_percentiles(benchmarks[name])
+            print(f"{name + ' tail':34s} p50 {p50:9.2f} us, p99 {p99:9.2f} us")
+        separate = []
+        for service in PAGE_LOAD_SERVICES:
+            wall, imported = cold_start('function', (service,))
+            separate.append(wall)
+            print(f"{'api.cold_' + service:34s} {wall:9.1f} ms process, {imported:7.1f} ms import")
+        wall, imported = cold_start('router', PAGE_LOAD_SERVICES)
+        print(f"{'api.cold_router_page':34s} {wall:9.1f} ms process, {imported:7.1f} ms import")
+        print(f"{'api.page_load_cold_starts':34s} separate: {len(separate)} starts, {sum(separate):.1f} ms in total, "
+              f"slowest {max(separate):.1f} ms; router: 1 start, {wall:.1f} ms")
+
+    if not args.only or args.only.startswith('export'):
+        for compress in (False, True):
+            peaks = []
+            for rows in EXPORT_ROWS:
+                status, cursor, peak = export_peak_memory(rows, compress)
+                name = f"export.{'jsonl_gz' if compress else 'jsonl'}_{rows}"
+                if status != 200:
+                    print(f'{name:34s} status {status}, expected 200')
+                    regressions.append(f'{name} status')
+                    continue
+                peaks.append(peak)
+                print(f"{name:34s} {peak / 1024 / 1024:9.2f} MB peak, status {status}, "
+                      f"{'more pages' if cursor else 'single page'}")
+            statuses, pages, records = export_all_pages(EXPORT_PAGED_ROWS, compress)
+            name = f"export.{'jsonl_gz' if compress else 'jsonl'}_pages_{EXPORT_PAGED_ROWS}"
+            print(f'{name:34s} {pages} pages, {records} records, statuses {sorted(statuses)}')
+            if statuses != {200} or records != 2 * EXPORT_PAGED_ROWS:
+                print(f'  REGRESSION: paged export lost records or failed ({records} of {2 * EXPORT_PAGED_ROWS})')
+                regressions.append(f'{name} completeness')
+            if len(peaks) < len(EXPORT_ROWS):
+                continue
+            if peaks[-1] > peaks[-2] * EXPORT_MEMORY_GROWTH:
+                print(f'  REGRESSION: export memory grows with history ({peaks[-2]} -> {peaks[-1]} bytes)')
+                regressions.append(f"export.{'jsonl_gz' if compress else 'jsonl'} memory")
+
+    if args.update:
+        thresholds.update({name: round(value * THRESHOLD_HEADROOM, 1) for name, value in results.items()})
+        with open(THRESHOLDS_PATH, 'w') as f:
+            json.dump(dict(sorted(thresholds.items())), f, indent=2)
+            f.write('\n')
+        print(f'thresholds written to {THRESHOLDS_PATH}')
+
+    if args.check and regressions:
+        print(f"{len(regressions)} benchmark(s) over threshold: {', '.join(regressions)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
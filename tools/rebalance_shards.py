@@ -0,0 +1,338 @@
+'''
+Business: Prepare the shards listed in SHARD_DSNS and move users between them
+Args: --init (apply db_migrations to shards that lack the schema and give every shard's id sequences a residue
+      of its own, so moved rows never collide; rerun whenever a shard is added),
+      --user ID --to SHARD (move one user), --even N (move up to N users from the fullest shard to the emptiest),
+      --status (users per shard), --wait seconds a handler may still route by a cached directory entry
+      (default SHARD_CACHE_TTL + 1), --dry-run, --directory / --shards (default DATABASE_URL / SHARD_DSNS)
+Returns: prints each step; exit code 1 when a move is refused
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import psycopg2
+from typing import Dict, List, Tuple
+
+from check_queries import SCHEMA, migration_files
+
+# Ids of rows moved between shards must stay unique, so shard i only generates ids congruent to i mod ID_STRIDE
+ID_STRIDE = 64
+# Headroom for rows inserted on a live shard while --init reads and restarts its sequences
+ID_MARGIN = 100000
+# Allocated by the directory for every shard at once, never strided
+DIRECTORY_SEQUENCES = ('user_shards_user_id_seq',)
+
+# One user's rows, parents first; deleted in reverse. Legacy tokens without the '<user_id>.' prefix
+# route to shard 0, so they are not copied and the user signs in again after a move off shard 0
+USER_GOALS = f'goal_id IN (SELECT id FROM {SCHEMA}.goals WHERE user_id = %(user_id)s)'
+USER_TABLES = (
+    ('users', 'id = %(user_id)s'),
+    ('user_settings', 'user_id = %(user_id)s'),
+    ('tokens', 'user_id = %(user_id)s AND token LIKE %(token_prefix)s'),
+    ('goals', 'user_id = %(user_id)s'),
+    ('subtasks', USER_GOALS),
+    ('goal_occurrences', USER_GOALS),
+    ('goal_events', 'user_id = %(user_id)s'),
+    ('goal_activity_daily', 'user_id = %(user_id)s'),
+    ('user_analytics_cache', 'user_id = %(user_id)s'),
+    ('notifications', 'user_id = %(user_id)s'),
+    ('telegram_link_tokens', 'user_id = %(user_id)s'),
+)
+
+# Shared goals join rows of the owner and the member, which must therefore stay on one shard
+SHARED_GOALS_QUERY = f"""SELECT EXISTS (
+        SELECT 1 FROM {SCHEMA}.goal_members m
+        JOIN {SCHEMA}.goals g ON g.id = m.goal_id
+        WHERE m.user_id = %(user_id)s OR g.user_id = %(user_id)s
+    )"""
+
+# Every sequence of the schema with its position and the column it issues ids for (serial columns own theirs)
+SEQUENCE_POSITIONS_QUERY = """SELECT s.sequencename, COALESCE(s.last_value, 0), t.relname, a.attname 
+    FROM pg_sequences s 
+    JOIN pg_class c ON c.relname = s.sequencename AND c.relnamespace = s.schemaname::regnamespace 
+    LEFT JOIN pg_depend d ON d.classid = 'pg_class'::regclass AND d.objid = c.oid 
+         AND d.refclassid = 'pg_class'::regclass AND d.deptype IN ('a', 'i') 
+    LEFT JOIN pg_class t ON t.oid = d.refobjid 
+    LEFT JOIN pg_attribute a ON a.attrelid = d.refobjid AND a.attnum = d.refobjsubid 
+    WHERE s.schemaname = %s"""
+
+class MoveRefused(Exception):
+    pass
+
+def get_shard_dsns() -> List[str]:
+    dsns = [dsn.strip() for dsn in os.environ.get('SHARD_DSNS', '').split(',') if dsn.strip()]
+    return dsns or [os.environ.get('DATABASE_URL')]
+
+def apply_migrations(conn):
+    cur = conn.cursor()
+    try:
+        cur.execute(f"CREATE SCHEMA IF NOT EXISTS {SCHEMA}")
+        cur.execute(f"SET LOCAL search_path TO {SCHEMA}")
+        for path in migration_files():
+            with open(path) as f:
+                cur.execute(f.read())
+        conn.commit()
+    finally:
+        cur.close()
+
+def init_shards(shards: List[str], migrate: bool = True):
+    """Migrate empty shards, then restart every id sequence of shard i at the next value congruent to i mod ID_STRIDE
+    above the highest value issued on any shard"""
+    if len(shards) > ID_STRIDE:
+        raise MoveRefused(f'At most {ID_STRIDE} shards are supported')
+    
+    conns = [psycopg2.connect(dsn) for dsn in shards]
+    try:
+        for index, conn in enumerate(conns):
+            cur = conn.cursor()
+            cur.execute("SELECT to_regclass(%s) IS NULL", (f'{SCHEMA}.users',))
+            empty = cur.fetchone()[0]
+            conn.rollback()
+            cur.close()
+            if empty and migrate:
+                apply_migrations(conn)
+                print(f'shard {index}: migrations applied')
+        
+        highest: Dict[str, int] = {}
+        for conn in conns:
+            cur = conn.cursor()
+            # last_value is NULL after a restart until the next nextval, so the ids already in the owning
+            # column count too; otherwise a second --init would restart below rows issued after the first
+            cur.execute(SEQUENCE_POSITIONS_QUERY, (SCHEMA,))
+            for name, value, table, column in cur.fetchall():
+                if name in DIRECTORY_SEQUENCES:
+                    continue
+                if table:
+                    cur.execute(f"SELECT COALESCE(MAX({column}), 0) FROM {SCHEMA}.{table}")
+                    value = max(value, cur.fetchone()[0])
+                highest[name] = max(highest.get(name, 0), value)
+            conn.rollback()
+            cur.close()
+        
+        for index, conn in enumerate(conns):
+            cur = conn.cursor()
+            for name, value in sorted(highest.items()):
+                start = ((value + ID_MARGIN) // ID_STRIDE + 1) * ID_STRIDE + index
+                cur.execute(f"ALTER SEQUENCE {SCHEMA}.{name} INCREMENT BY {ID_STRIDE} RESTART WITH {start}")
+            conn.commit()
+            cur.close()
+            print(f'shard {index}: {len(highest)} sequences issue ids = {index} mod {ID_STRIDE}')
+    finally:
+        for conn in conns:
+            conn.close()
+
+def table_columns(cur, table: str) -> List[str]:
+    cur.execute(
+        """SELECT column_name FROM information_schema.columns
+           WHERE table_schema = %s AND table_name = %s ORDER BY ordinal_position""",
+        (SCHEMA, table)
+    )
+    return [row[0] for row in cur.fetchall()]
+
+def user_params(user_id: int) -> Dict[str, object]:
+    return {'user_id': user_id, 'token_prefix': f'{user_id}.%'}
+
+def count_user_rows(cur, user_id: int) -> Dict[str, int]:
+    counts = {}
+    for table, condition in USER_TABLES:
+        cur.execute(f"SELECT count(*) FROM {SCHEMA}.{table} WHERE {condition}", user_params(user_id))
+        counts[table] = cur.fetchone()[0]
+    return counts
+
+def delete_user_rows(cur, user_id: int):
+    for table, condition in reversed(USER_TABLES):
+        # Every token goes, prefixed or not; only prefixed ones were copied
+        if table == 'tokens':
+            condition = 'user_id = %(user_id)s'
+        cur.execute(f"DELETE FROM {SCHEMA}.{table} WHERE {condition}", user_params(user_id))
+
+def copy_user_rows(source_cur, target_cur, user_id: int) -> Dict[str, int]:
+    """COPY each table's rows of the user out of the source and into the target, spooled to disk past 64 MB"""
+    copied = {}
+    params = user_params(user_id)
+    for table, condition in USER_TABLES:
+        columns = ', '.join(table_columns(source_cur, table))
+        query = source_cur.mogrify(f"SELECT {columns} FROM {SCHEMA}.{table} WHERE {condition}", params).decode()
+        with tempfile.SpooledTemporaryFile(max_size=64 * 1024 * 1024, mode='w+b') as buffer:
+            source_cur.copy_expert(f"COPY ({query}) TO STDOUT", buffer)
+            buffer.seek(0)
+            target_cur.copy_expert(f"COPY {SCHEMA}.{table} ({columns}) FROM STDIN", buffer)
+            copied[table] = target_cur.rowcount
+    return copied
+
+def move_user(directory_dsn: str, shards: List[str], user_id: int, target: int, wait: float, dry_run: bool = False):
+    """Freeze the user's writes, wait out cached routes, copy, flip the directory, wait again, delete the source rows.
+    Every step is safe to rerun after a crash"""
+    if not 0 <= target < len(shards):
+        raise MoveRefused(f'Shard {target} is not in SHARD_DSNS ({len(shards)} shards)')
+    
+    directory = psycopg2.connect(directory_dsn)
+    dir_cur = directory.cursor()
+    try:
+        dir_cur.execute(f"SELECT shard FROM {SCHEMA}.user_shards WHERE user_id = %s", (user_id,))
+        row = dir_cur.fetchone()
+        directory.rollback()
+        if not row:
+            raise MoveRefused(f'User {user_id} is not in the user_shards directory')
+        source = row[0]
+        
+        if source == target:
+            leftovers = clean_leftovers(shards, user_id, target, wait, dry_run)
+            print(f'user {user_id}: already on shard {target}' + (f', removed leftovers on {leftovers}' if leftovers else ''))
+            return
+        
+        source_conn = psycopg2.connect(shards[source])
+        target_conn = psycopg2.connect(shards[target])
+        source_cur = source_conn.cursor()
+        target_cur = target_conn.cursor()
+        try:
+            source_cur.execute(SHARED_GOALS_QUERY, {'user_id': user_id})
+            if source_cur.fetchone()[0]:
+                raise MoveRefused(f'User {user_id} owns or is a member of shared goals, which cannot span shards')
+            
+            if dry_run:
+                counts = count_user_rows(source_cur, user_id)
+                print(f'user {user_id}: would move shard {source} -> {target}: '
+                      + ', '.join(f'{table} {count}' for table, count in counts.items()))
+                return
+            
+            dir_cur.execute(
+                f"UPDATE {SCHEMA}.user_shards SET moving = TRUE, updated_at = CURRENT_TIMESTAMP WHERE user_id = %s",
+                (user_id,)
+            )
+            directory.commit()
+            print(f'user {user_id}: writes frozen, waiting {wait:g}s for cached routes to expire')
+            time.sleep(wait)
+            
+            # Rows a crashed earlier run committed on the target are replaced, not duplicated
+            delete_user_rows(target_cur, user_id)
+            copied = copy_user_rows(source_cur, target_cur, user_id)
+            source_conn.rollback()
+            target_conn.commit()
+            print(f'user {user_id}: copied to shard {target}: ' + ', '.join(f'{t} {n}' for t, n in copied.items()))
+            
+            dir_cur.execute(
+                f"""UPDATE {SCHEMA}.user_shards SET shard = %s, moving = FALSE, updated_at = CURRENT_TIMESTAMP
+                    WHERE user_id = %s""",
+                (target, user_id)
+            )
+            directory.commit()
+            print(f'user {user_id}: directory points at shard {target}, waiting {wait:g}s before deleting the source')
+            time.sleep(wait)
+            
+            delete_user_rows(source_cur, user_id)
+            source_conn.commit()
+            print(f'user {user_id}: removed from shard {source}')
+        finally:
+            source_cur.close()
+            target_cur.close()
+            source_conn.close()
+            target_conn.close()
+    finally:
+        dir_cur.close()
+        directory.close()
+
+def clean_leftovers(shards: List[str], user_id: int, home: int, wait: float, dry_run: bool) -> List[int]:
+    """Delete the user's rows from every shard but its home, left there by a move that crashed before its last step"""
+    found = []
+    for index, dsn in enumerate(shards):
+        if index == home:
+            continue
+        conn = psycopg2.connect(dsn)
+        cur = conn.cursor()
+        try:
+            if any(count_user_rows(cur, user_id).values()):
+                found.append(index)
+                if not dry_run:
+                    time.sleep(wait)
+                    delete_user_rows(cur, user_id)
+                    conn.commit()
+        finally:
+            cur.close()
+            conn.close()
+    return found
+
+def shard_counts(directory_dsn: str, shards: List[str]) -> List[Tuple[int, int]]:
+    """(shard, users) for every configured shard, from the directory"""
+    conn = psycopg2.connect(directory_dsn)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"""SELECT s, count(u.user_id) FROM generate_series(0, %s - 1) s
+                LEFT JOIN {SCHEMA}.user_shards u ON u.shard = s
+                GROUP BY s ORDER BY s""",
+            (len(shards),)
+        )
+        return cur.fetchall()
+    finally:
+        cur.close()
+        conn.close()
+
+def even_out(directory_dsn: str, shards: List[str], limit: int, wait: float, dry_run: bool) -> int:
+    """Move up to `limit` users, newest first, from the fullest shard to the emptiest while that narrows the gap"""
+    counts = dict(shard_counts(directory_dsn, shards))
+    source = max(counts, key=counts.get)
+    target = min(counts, key=counts.get)
+    movable = min(limit, (counts[source] - counts[target]) // 2)
+    if movable <= 0:
+        print('shards are even')
+        return 0
+    
+    conn = psycopg2.connect(directory_dsn)
+    cur = conn.cursor()
+    try:
+        cur.execute(
+            f"SELECT user_id FROM {SCHEMA}.user_shards WHERE shard = %s AND NOT moving ORDER BY user_id DESC",
+            (source,)
+        )
+        candidates = [row[0] for row in cur.fetchall()]
+    finally:
+        cur.close()
+        conn.close()
+    
+    moved = 0
+    for user_id in candidates:
+        if moved == movable:
+            break
+        try:
+            move_user(directory_dsn, shards, user_id, target, wait, dry_run)
+            moved += 1
+        except MoveRefused as e:
+            print(f'skipped: {e}')
+    return moved
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--directory', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--shards', default=','.join(get_shard_dsns()))
+    parser.add_argument('--init', action='store_true')
+    parser.add_argument('--user', type=int)
+    parser.add_argument('--to', type=int)
+    parser.add_argument('--even', type=int, metavar='N')
+    parser.add_argument('--status', action='store_true')
+    parser.add_argument('--wait', type=float, default=int(os.environ.get('SHARD_CACHE_TTL', '30')) + 1)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    shards = [dsn.strip() for dsn in args.shards.split(',') if dsn.strip()]
+    
+    try:
+        if args.init:
+            init_shards(shards)
+        if args.user is not None:
+            if args.to is None:
+                parser.error('--user needs --to')
+            move_user(args.directory, shards, args.user, args.to, args.wait, args.dry_run)
+        if args.even:
+            print(f'{even_out(args.directory, shards, args.even, args.wait, args.dry_run)} users moved')
+        if args.status or not (args.init or args.user is not None or args.even):
+            for shard, users in shard_counts(args.directory, shards):
+                print(f'shard {shard}: {users} users')
+    except MoveRefused as e:
+        print(f'refused: {e}')
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+'''
+Business: Bulk-load a reproducible synthetic dataset into the schema from db_migrations for scale testing
+Args: --scale (1 = 1000 users), --goals-per-user mean, --seed, --truncate, --dsn (defaults to DATABASE_URL)
+Returns: loads users, goals, notifications, tokens and user_settings through COPY and prints row counts
+'''
+
+import argparse
+import hashlib
+import io
+import os
+import random
+import time
+import psycopg2
+from datetime import datetime, timedelta
+from typing import Iterator, List
+
+SCHEMA = 't_p59845625_taskbuddy_project'
+
+USERS_PER_SCALE = 1000
+
+CATEGORIES = ['work', 'health', 'study', 'personal', 'finance', 'home', '']
+CATEGORY_WEIGHTS = [35, 20, 15, 15, 6, 6, 3]
+PRIORITIES = ['low', 'medium', 'high']
+PRIORITY_WEIGHTS = [25, 55, 20]
+STATUSES = ['completed', 'pending', 'deleted']
+STATUS_WEIGHTS = [55, 35, 10]
+NOTIFICATION_TYPES = ['task_created', 'task_completed', 'deadline_reminder', 'success']
+NOTIFICATION_WEIGHTS = [45, 35, 15, 5]
+
+PASSWORD_HASH = hashlib.sha256(b'password123').hexdigest()
+
+class IteratorFile(io.TextIOBase):
+    """File-like view over an iterator of COPY lines, so COPY streams without building the data in memory"""
+    
+    def __init__(self, lines: Iterator[str]):
+        self.lines = lines
+        self.buffer = ''
+    
+    def readable(self) -> bool:
+        return True
+    
+    def read(self, size: int = -1) -> str:
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.lines)
+            except StopIteration:
+                break
+        if size < 0:
+            chunk, self.buffer = self.buffer, ''
+        else:
+            chunk, self.buffer = self.buffer[:size], self.buffer[size:]
+        return chunk
+    
+    def readline(self, size: int = -1) -> str:
+        return self.read(size)
+
+def copy_rows(cur, table: str, columns: List[str], lines: Iterator[str]):
+    cur.copy_expert(
+        f"COPY {SCHEMA}.{table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT text)",
+        IteratorFile(lines),
+        size=1 << 20
+    )
+
+def value(v) -> str:
+    if v is None:
+        return '\\N'
+    if isinstance(v, bool):
+        return 't' if v else 'f'
+    return str(v).replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n')
+
+def line(*values) -> str:
+    return '\t'.join(value(v) for v in values) + '\n'
+
+def goals_for_user(rng: random.Random, mean: float, alpha: float, cap: int) -> int:
+    """Power-law goal count: most users have a handful, a few have thousands"""
+    xm = mean * (alpha - 1) / alpha
+    return min(cap, int(xm * rng.paretovariate(alpha)))
+
+def generate(seed: int, first_user_id: int, users: int, first_goal_id: int, mean_goals: float, now: datetime):
+    """Yield per-table COPY lines; goal counts drive notifications so all tables stay correlated"""
+    rng = random.Random(seed)
+    plan = []
+    for offset in range(users):
+        user_id = first_user_id + offset
+        created = now - timedelta(seconds=rng.randint(0, 2 * 365 * 86400))
+        plan.append((user_id, created, goals_for_user(rng, mean_goals, 1.3, 20000)))
+    
+    def users_lines():
+        for user_id, created, _ in plan:
+            chat_id = 100000000 + user_id if rng.random() < 0.3 else None
+            yield line(user_id, f'user{user_id}@example.com', PASSWORD_HASH, f'user{user_id}', created, created, chat_id)
+    
+    def goals_lines():
+        goal_id = first_goal_id
+        for user_id, user_created, count in plan:
+            span = max(1, int((now - user_created).total_seconds()))
+            for _ in range(count):
+                created = user_created + timedelta(seconds=rng.randint(0, span))
+                status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+                start = created.date()
+                end = start + timedelta(days=rng.randint(0, 60)) if rng.random() < 0.8 else None
+                updated = created + timedelta(seconds=rng.randint(0, max(1, int((now - created).total_seconds()))))
+                progress = 100 if status == 'completed' else rng.randint(0, 90)
+                yield line(goal_id, user_id, f'Goal {goal_id}', 'Synthetic goal description ' * rng.randint(0, 8),
+                           rng.choices(CATEGORIES, CATEGORY_WEIGHTS)[0], rng.choices(PRIORITIES, PRIORITY_WEIGHTS)[0],
+                           status, start, end, progress, created, updated, updated if status == 'completed' else None)
+                goal_id += 1
+    
+    def notifications_lines():
+        for user_id, user_created, count in plan:
+            span = max(1, int((now - user_created).total_seconds()))
+            for _ in range(1 + int(count * 1.5)):
+                notif_type = rng.choices(NOTIFICATION_TYPES, NOTIFICATION_WEIGHTS)[0]
+                created = user_created + timedelta(seconds=rng.randint(0, span))
+                is_read = rng.random() < 0.8 or created < now - timedelta(days=30)
+                yield line(user_id, 'Уведомление', f'Синтетическое уведомление {notif_type}', notif_type, is_read, created)
+    
+    def tokens_lines():
+        for user_id, user_created, _ in plan:
+            for _ in range(rng.randint(1, 3)):
+                created = user_created + timedelta(seconds=rng.randint(0, max(1, int((now - user_created).total_seconds()))))
+                token = '%032x' % rng.getrandbits(128) + '%08x' % user_id
+                yield line(user_id, token, created, created + timedelta(days=30))
+    
+    def settings_lines():
+        for user_id, _, _ in plan:
+            if rng.random() < 0.6:
+                yield line(user_id, rng.random() < 0.9, rng.random() < 0.2, rng.random() < 0.8,
+                           rng.choice(['1hour', '1day', '3days']))
+    
+    return plan, users_lines, goals_lines, notifications_lines, tokens_lines, settings_lines
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic TaskBuddy dataset generator')
+    parser.add_argument('--dsn', default=os.environ.get('DATABASE_URL'))
+    parser.add_argument('--scale', type=float, default=1.0, help=f'1 = {USERS_PER_SCALE} users, 1000 = 1M users')
+    parser.add_argument('--goals-per-user', type=float, default=100.0, help='mean of the power-law goal distribution')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--truncate', action='store_true', help='empty the tables before loading')
+    args = parser.parse_args()
+    
+    conn = psycopg2.connect(args.dsn)
+    cur = conn.cursor()
+    now = datetime(2026, 1, 1)
+    
+    try:
+        if args.truncate:
+            cur.execute(f"""TRUNCATE {SCHEMA}.users, {SCHEMA}.goals, {SCHEMA}.notifications, 
+                            {SCHEMA}.tokens, {SCHEMA}.user_settings, {SCHEMA}.user_shards RESTART IDENTITY CASCADE""")
+        
+        # User ids are allocated by the user_shards directory, which may be ahead of this database's users
+        cur.execute(f"""SELECT GREATEST((SELECT COALESCE(MAX(id), 0) FROM {SCHEMA}.users), 
+                                        (SELECT COALESCE(MAX(user_id), 0) FROM {SCHEMA}.user_shards)) + 1""")
+        first_user_id = cur.fetchone()[0]
+        cur.execute(f"SELECT COALESCE(MAX(id), 0) + 1 FROM {SCHEMA}.goals")
+        first_goal_id = cur.fetchone()[0]
+        
+        users = max(1, int(args.scale * USERS_PER_SCALE))
+        plan, users_lines, goals_lines, notifications_lines, tokens_lines, settings_lines = generate(
+            args.seed, first_user_id, users, first_goal_id, args.goals_per_user, now
+        )
+        
+        loads = [
+            ('users', ['id', 'email', 'password_hash', 'username', 'created_at', 'updated_at', 'telegram_chat_id'], users_lines),
+            ('goals', ['id', 'user_id', 'title', 'description', 'category', 'priority', 'status',
+                       'start_date', 'end_date', 'progress', 'created_at', 'updated_at', 'completed_at'], goals_lines),
+            ('notifications', ['user_id', 'title', 'message', 'type', 'is_read', 'created_at'], notifications_lines),
+            ('tokens', ['user_id', 'token', 'created_at', 'expires_at'], tokens_lines),
+            ('user_settings', ['user_id', 'notifications', 'email_notifications', 'telegram_notifications', 'reminder_time'], settings_lines),
+        ]
+        
+        for table, columns, lines in loads:
+            started = time.perf_counter()
+            copy_rows(cur, table, columns, lines())
+            print(f'{table:15} {cur.rowcount:>12} rows  {time.perf_counter() - started:8.1f}s')
+        
+        # The seeded users live on this database, shard 0 of the directory
+        cur.execute(f"""INSERT INTO {SCHEMA}.user_shards (user_id, email, shard) 
+                        SELECT id, lower(email), 0 FROM {SCHEMA}.users WHERE id >= %s 
+                        ON CONFLICT DO NOTHING""", (first_user_id,))
+        
+        for table in ('users', 'goals'):
+            cur.execute(f"""SELECT setval(pg_get_serial_sequence('{SCHEMA}.{table}', 'id'), 
+                            (SELECT MAX(id) FROM {SCHEMA}.{table}))""")
+        cur.execute(f"""SELECT setval(pg_get_serial_sequence('{SCHEMA}.user_shards', 'user_id'), 
+                        (SELECT MAX(user_id) FROM {SCHEMA}.user_shards))""")
+        
+        conn.commit()
+        
+        conn.autocommit = True
+        cur.execute(f"ANALYZE {SCHEMA}.users, {SCHEMA}.goals, {SCHEMA}.notifications, {SCHEMA}.tokens, {SCHEMA}.user_settings")
+    finally:
+        cur.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()